@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Benchmark response serialization
+
+Compares the original path (dict rows + json.dumps) against orjson,
+streaming and the columnar wire format for get_transactions-sized results.
+
+Usage:
+    python benchmarks/bench_serialization.py --rows 100000
+"""
+
+import argparse
+import json
+import os
+import secrets
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.manager import DatabaseManager
+from models.batch import TransactionBatch, iso_to_days
+from utils import serializer
+
+MERCHANTS = [
+    ('ANTHROPIC', 'AI Services'),
+    ('REPUBLIC FITNESS', 'Health & Fitness'),
+    ('AMAZON WEB SERVICES', 'Cloud Services'),
+    ('SOMERVILLE PARKING', 'Transportation'),
+    ('NETFLIX', 'Entertainment'),
+]
+
+
+def build_database(db_path: str, rows: int) -> DatabaseManager:
+    """Fill a scratch database with synthetic transactions"""
+    batch = TransactionBatch()
+    start = iso_to_days('2020-01-01')
+    for i in range(rows):
+        merchant, category = MERCHANTS[i % len(MERCHANTS)]
+        batch.append(
+            f"txn_{secrets.token_hex(8)}",
+            start + i % 2000,
+            merchant,
+            f"{merchant} #{i % 97:04d}",
+            -(1000 + i % 9000),
+            category,
+            0.9
+        )
+    db = DatabaseManager(db_path)
+    db.save_batch(batch)
+    return db
+
+
+def measure(fn):
+    """Run fn, returning (result, seconds, peak traced bytes)"""
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+
+    # Memory is traced in a second run so tracing overhead doesn't skew timing
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def run(rows: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        db = build_database(os.path.join(tmp, 'bench.db'), rows)
+
+        def rows_result():
+            transactions = db.get_transactions()
+            return {'success': True, 'transactions': transactions, 'total': len(transactions)}
+
+        def columnar_result():
+            batch = db.get_transactions_batch()
+            return {'success': True, 'format': 'columnar',
+                    'transactions': batch.to_columns(), 'total': len(batch)}
+
+        def streamed(result):
+            return sum(len(chunk) for chunk in serializer.iter_dumps(result))
+
+        # name -> (build result, encode result)
+        cases = {
+            'baseline_json_rows': (rows_result, lambda r: json.dumps(r).encode('utf-8')),
+            'rows': (rows_result, serializer.dumps),
+            'rows_streamed': (rows_result, streamed),
+            'columnar': (columnar_result, serializer.dumps),
+        }
+
+        report = {
+            'rows': rows,
+            'serializer': serializer.get_serializer().name,
+            'cases': {}
+        }
+        for name, (build, encode) in cases.items():
+            result, build_seconds, _ = measure(build)
+            payload, encode_seconds, _ = measure(lambda: encode(result))
+            _, _, peak = measure(lambda: encode(build()))
+            report['cases'][name] = {
+                'build_seconds': round(build_seconds, 4),
+                'encode_seconds': round(encode_seconds, 4),
+                'bytes': payload if isinstance(payload, int) else len(payload),
+                'peak_bytes': peak,
+            }
+        db.conn.close()
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=100000)
+    args = parser.parse_args()
+    print(json.dumps(run(args.rows), indent=2))
+
+
+if __name__ == '__main__':
+    main()
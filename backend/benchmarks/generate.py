@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Synthetic bank statement generator
+
+Produces deterministic CSV statements, PDF statements and pre-populated
+databases with a realistic mix of recurring subscriptions, payroll and
+variable everyday spending.
+
+Usage:
+    python benchmarks/generate.py --rows 100000 --out benchmarks/data
+"""
+
+import argparse
+import csv
+import os
+import random
+import secrets
+import sys
+import zlib
+from datetime import date, timedelta
+from typing import Iterator, NamedTuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.batch import TransactionBatch, date_to_days
+
+DEFAULT_SEED = 2025
+START_DATE = date(2015, 1, 1)
+
+# (payee, address, amount in cents, cadence in days, category)
+RECURRING = [
+    ('ANTHROPIC ANTHROPIC.COMCA', 'ANTHROPIC.COM CA', -2000, 30, 'AI Services'),
+    ('OPENAI *CHATGPT SUBSCR OPENAI.COM CA', 'OPENAI.COM CA', -2000, 30, 'AI Services'),
+    ('ABC*REPUBLIC FITNESS 617-5471229 MA', '617-5471229 MA', -8399, 30, 'Health & Fitness'),
+    ('Amazon web services aws.amazon.coWA', 'aws.amazon.co WA', -2163, 30, 'Cloud Services'),
+    ('NETFLIX.COM 866-579-7172 CA', '866-579-7172 CA', -1549, 30, 'Entertainment'),
+    ('SPOTIFY USA 877-7781161 NY', '877-7781161 NY', -1199, 30, 'Entertainment'),
+    ('GEICO *AUTO 800-841-3000 DC', '800-841-3000 DC', -13700, 30, 'Insurance'),
+    ('SQSP* SQUARESPACE INC. NY', 'SQUARESPACE NY', -19200, 365, 'Web Services'),
+    ('PAYROLL ACME CORP DIRECT DEP', 'ACME CORP', 385000, 14, ''),
+]
+
+# (payee template, address, min cents, max cents, category)
+VARIABLE = [
+    ('WHOLEFDS SOM #{store} SOMERVILLE MA', 'SOMERVILLE MA', 1500, 18000, ''),
+    ('STAR MARKET {store} CAMBRIDGE MA', 'CAMBRIDGE MA', 800, 12000, ''),
+    ('SHELL OIL {store:05d} MEDFORD MA', 'MEDFORD MA', 2500, 7000, ''),
+    ('UBER *TRIP HELP.UBER.COM CA', 'HELP.UBER.COM CA', 900, 4500, 'Transportation'),
+    ('LYFT *RIDE SAT 8PM 855-2800278 CA', '855-2800278 CA', 800, 3800, 'Transportation'),
+    ('SOMERVILLEMA PRKGTICKET 617-2392365 MA', '617-2392365 MA', 1500, 5500, 'Transportation'),
+    ('TST* OLIVEIRAS STEAKHOUSE {store} MA', 'SOMERVILLE MA', 1800, 9500, ''),
+    ('DUNKIN #{store} Q35 SOMERVILLE MA', 'SOMERVILLE MA', 250, 1400, ''),
+    ('STEAMGAMES.COM 4259522985 WA', '4259522985 WA', 499, 6999, 'Entertainment'),
+    ('RINSE LAUNDRY 415-3668886 CA', '415-3668886 CA', 2500, 6000, 'Services'),
+    ('CVS/PHARMACY #{store} BOSTON MA', 'BOSTON MA', 400, 6500, ''),
+    ('AMZN Mktp US*{store} Amzn.com/billWA', 'Amzn.com/bill WA', 700, 25000, ''),
+]
+
+SIZES = {'1k': 1000, '100k': 100000, '1M': 1000000}
+
+
+class Record(NamedTuple):
+    date: date
+    payee: str
+    address: str
+    amount_cents: int
+    category: str
+
+
+def parse_size(size: str) -> int:
+    """Accept '1k', '100k', '1M' or a plain integer"""
+    return SIZES.get(size) or int(size)
+
+
+def span_days(rows: int) -> int:
+    """History length for a row count, from one year up to fifteen"""
+    return min(max(365, rows // 20), 365 * 15)
+
+
+def generate_records(rows: int, seed: int = DEFAULT_SEED) -> Iterator[Record]:
+    """Yield ``rows`` transactions in date order"""
+    rng = random.Random(seed)
+    span = span_days(rows)
+    # Each recurring charge starts on its own day of the cycle
+    due = [rng.randrange(cadence) for _, _, _, cadence, _ in RECURRING]
+    amounts = [amount for _, _, amount, _, _ in RECURRING]
+
+    for i in range(rows):
+        offset = i * span // rows
+        day = START_DATE + timedelta(days=offset)
+
+        for r, (payee, address, _, cadence, category) in enumerate(RECURRING):
+            if due[r] <= offset:
+                due[r] += cadence
+                # Occasional price increases
+                if rng.random() < 0.02:
+                    amounts[r] = int(amounts[r] * 1.1)
+                yield Record(day, payee, address, amounts[r], category)
+                break
+        else:
+            template, address, low, high, category = rng.choice(VARIABLE)
+            payee = template.format(store=rng.randrange(1, 400))
+            yield Record(day, payee, address, -rng.randint(low, high), category)
+
+
+MERCHANT_WORDS = [
+    'blue', 'star', 'market', 'coffee', 'fitness', 'cloud', 'studio', 'garden', 'pizza', 'auto',
+    'books', 'pharmacy', 'river', 'north', 'city', 'grill', 'labs', 'media', 'supply', 'health',
+    'golden', 'urban', 'hardware', 'bakery', 'games', 'travel', 'pet', 'dental', 'yoga', 'wine',
+]
+MERCHANT_CATEGORIES = [
+    'Food & Dining', 'Shopping', 'Health & Fitness', 'Entertainment', 'Services', 'Transportation',
+]
+
+
+def merchant_names(count: int, seed: int = DEFAULT_SEED) -> Iterator[tuple]:
+    """Yield ``count`` distinct (canonical merchant name, category) pairs"""
+    rng = random.Random(seed)
+    seen = set()
+    while len(seen) < count:
+        words = rng.sample(MERCHANT_WORDS, 2)
+        name = f"{rng.choice('BCDFGHKLMNPRSTVWZ')}{rng.choice('aeiou')}{rng.choice('klmnrst')}" \
+               f"{rng.choice('aeiouy')} {' '.join(words)}".title()
+        if name in seen:
+            continue
+        seen.add(name)
+        # crc32, not hash(): str hashes are salted per process
+        yield name, MERCHANT_CATEGORIES[zlib.crc32(words[-1].encode()) % len(MERCHANT_CATEGORIES)]
+
+
+def format_amount(cents: int) -> str:
+    sign = '-' if cents < 0 else ''
+    cents = abs(cents)
+    return f"{sign}{cents // 100}.{cents % 100:02d}"
+
+
+def write_csv(path: str, rows: int, seed: int = DEFAULT_SEED) -> str:
+    """Write a statement CSV in the same layout as the bank export"""
+    rng = random.Random(seed + 1)
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Posted Date', 'Reference Number', 'Payee', 'Address', 'Amount', 'Category'])
+        for record in generate_records(rows, seed):
+            writer.writerow([
+                record.date.strftime('%m/%d/%Y'),
+                str(rng.randrange(10 ** 22, 10 ** 23)),
+                record.payee,
+                record.address,
+                format_amount(record.amount_cents),
+                record.category
+            ])
+    return path
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def write_pdf(path: str, rows: int, seed: int = DEFAULT_SEED, lines_per_page: int = 60) -> str:
+    """
+    Write a text-based PDF statement
+
+    One transaction per line ("MM/DD/YY PAYEE AMOUNT"), Helvetica, no
+    compression; the PDF structure is written by hand so no PDF library
+    is needed to generate benchmark input.
+    """
+    pages = max(1, -(-rows // lines_per_page))
+    offsets = []
+
+    with open(path, 'wb') as f:
+        def obj(number: int, body: bytes) -> None:
+            offsets.append((number, f.tell()))
+            f.write(f"{number} 0 obj\n".encode() + body + b"\nendobj\n")
+
+        f.write(b"%PDF-1.4\n")
+        kids = ' '.join(f"{4 + 2 * p} 0 R" for p in range(pages))
+        obj(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        obj(2, f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode())
+        obj(3, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+        records = generate_records(rows, seed)
+        for p in range(pages):
+            lines = [b"BT /F1 8 Tf 11 TL 36 760 Td"]
+            for _, record in zip(range(lines_per_page), records):
+                text = (f"{record.date.strftime('%m/%d/%y')}  {record.payee[:40]:<40}  "
+                        f"{format_amount(record.amount_cents):>12}")
+                lines.append(f"({_pdf_escape(text)}) Tj T*".encode())
+            lines.append(b"ET")
+            content = b"\n".join(lines)
+
+            obj(4 + 2 * p, (f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                            f"/Resources << /Font << /F1 3 0 R >> >> "
+                            f"/Contents {5 + 2 * p} 0 R >>").encode())
+            obj(5 + 2 * p, f"<< /Length {len(content)} >>\nstream\n".encode()
+                + content + b"\nendstream")
+
+        xref = f.tell()
+        count = 4 + 2 * pages
+        f.write(f"xref\n0 {count + 1}\n".encode())
+        f.write(b"0000000000 65535 f \n")
+        for _, offset in sorted(offsets):
+            f.write(f"{offset:010d} 00000 n \n".encode())
+        f.write(f"trailer\n<< /Size {count + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+
+    return path
+
+
+def generate_batch(rows: int, seed: int = DEFAULT_SEED) -> TransactionBatch:
+    """Build an in-memory batch with the statement categories applied"""
+    batch = TransactionBatch()
+    for record in generate_records(rows, seed):
+        batch.append(
+            f"txn_{secrets.token_hex(8)}",
+            date_to_days(record.date),
+            record.payee,
+            record.payee,
+            record.amount_cents,
+            record.category or 'Uncategorized',
+            1.0 if record.category else 0.0
+        )
+    return batch
+
+
+def build_database(path: str, rows: int, seed: int = DEFAULT_SEED) -> str:
+    """Create a populated database for query benchmarks"""
+    from database.manager import DatabaseManager
+
+    db = DatabaseManager(path)
+    db.save_batch(generate_batch(rows, seed))
+    db.conn.close()
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', default='1k', help="row count or one of 1k/100k/1M")
+    parser.add_argument('--out', default='.', help="output directory")
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--formats', default='csv,pdf,db')
+    args = parser.parse_args()
+
+    rows = parse_size(args.rows)
+    os.makedirs(args.out, exist_ok=True)
+    formats = args.formats.split(',')
+    stem = os.path.join(args.out, f"statement_{args.rows}")
+
+    if 'csv' in formats:
+        print(write_csv(f"{stem}.csv", rows, args.seed))
+    if 'pdf' in formats:
+        print(write_pdf(f"{stem}.pdf", rows, args.seed))
+    if 'db' in formats:
+        print(build_database(f"{stem}.db", rows, args.seed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+Backend benchmark suite
+
+Each stage runs in a fresh interpreter so peak RSS and cold-start numbers
+are not polluted by earlier stages. Results are printed (or written) as
+JSON and can be compared against a stored baseline.
+
+Usage:
+    python benchmarks/run.py --sizes 1k,100k
+    python benchmarks/run.py --sizes 100k --output results.json --save-baseline
+    python benchmarks/run.py --sizes 100k --baseline benchmarks/baseline.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks import generate
+
+DEFAULT_DATA_DIR = os.path.join(BACKEND_DIR, 'benchmarks', 'data')
+DEFAULT_BASELINE = os.path.join(BACKEND_DIR, 'benchmarks', 'baseline.json')
+
+# The per-row save path commits once per row, so it is capped to keep large
+# sizes from running for hours; throughput is still comparable
+SAVE_TRANSACTION_LIMIT = 10000
+
+
+def peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return round(peak / divisor, 1)
+
+
+# --- stages (run inside the child process) ---------------------------------
+# Each stage takes (data paths, rows) and returns the number of rows processed.
+# paths['tmp'] is a scratch directory removed once the stage has finished.
+
+def stage_cold_start(paths: Dict[str, str], rows: int) -> int:
+    from main import BankAnalyzerAPI
+
+    BankAnalyzerAPI(os.path.join(paths['tmp'], 'cold.db'))
+    return 1
+
+
+def stage_csv_parse(paths: Dict[str, str], rows: int) -> int:
+    from parsers.csv_parser import CSVParser
+
+    return len(CSVParser().parse_batch(paths['csv']))
+
+
+def stage_pdf_parse(paths: Dict[str, str], rows: int) -> int:
+    from parsers.pdf_parser import PDFParser
+
+    return len(PDFParser().parse_batch(paths['pdf']))
+
+
+def stage_categorize(paths: Dict[str, str], rows: int) -> Callable[[], int]:
+    from array import array
+    from ml.categorizer import MLCategorizer
+    from models.batch import UNCATEGORIZED
+
+    batch = generate.generate_batch(rows)
+    # Strip statement categories so every row goes through the categorizer
+    batch.category_codes = array('I', [batch.category_code(UNCATEGORIZED)] * len(batch))
+    categorizer = MLCategorizer()
+    return lambda: (categorizer.categorize_batch(batch), len(batch))[1]
+
+
+def stage_save_transaction(paths: Dict[str, str], rows: int) -> Callable[[], int]:
+    from database.manager import DatabaseManager
+
+    transactions = generate.generate_batch(min(rows, SAVE_TRANSACTION_LIMIT)).to_dicts()
+    db = DatabaseManager(os.path.join(paths['tmp'], 'save.db'))
+
+    def run() -> int:
+        for txn in transactions:
+            db.save_transaction(txn)
+        return len(transactions)
+    return run
+
+
+def stage_save_batch(paths: Dict[str, str], rows: int) -> Callable[[], int]:
+    from database.manager import DatabaseManager
+
+    batch = generate.generate_batch(rows)
+    db = DatabaseManager(os.path.join(paths['tmp'], 'save.db'))
+    return lambda: db.save_batch(batch)
+
+
+def stage_get_transactions(paths: Dict[str, str], rows: int) -> Callable[[], int]:
+    from database.manager import DatabaseManager
+
+    db = DatabaseManager(paths['db'])
+    return lambda: len(db.get_transactions())
+
+
+def stage_get_spending_summary(paths: Dict[str, str], rows: int) -> Callable[[], int]:
+    from main import BankAnalyzerAPI
+
+    api = BankAnalyzerAPI(paths['db'])
+    end = generate.START_DATE.toordinal() + generate.span_days(rows)
+    end_date = datetime.fromordinal(end).strftime('%Y-%m-%d')
+
+    def run() -> int:
+        result = api.get_spending_summary(generate.START_DATE.isoformat(), end_date)
+        if not result['success']:
+            raise RuntimeError(result['error'])
+        return result['summary']['transactionCount']
+    return run
+
+
+def stage_serialize(paths: Dict[str, str], rows: int) -> Callable[[], int]:
+    from database.manager import DatabaseManager
+    from utils import serializer
+
+    db = DatabaseManager(paths['db'])
+    transactions = db.get_transactions()
+    result = {'success': True, 'transactions': transactions, 'total': len(transactions)}
+    return lambda: (serializer.dumps(result), len(transactions))[1]
+
+
+def stage_merchant_lookup(paths: Dict[str, str], rows: int) -> Callable[[], int]:
+    import random
+    from ml.similarity import MerchantIndex
+    from utils.helpers import extract_merchant_name
+
+    # Index ``rows`` known merchants (up to 100k), then look up unseen
+    # variants of them with store numbers and state codes attached
+    known = list(generate.merchant_names(min(rows, 100000)))
+    index = MerchantIndex()
+    for name, category in known:
+        index.add(name, category)
+    rng = random.Random(generate.DEFAULT_SEED)
+    queries = [
+        extract_merchant_name(f"SQ *{name.upper()} #{rng.randrange(1000)} MA")
+        for name, _ in rng.sample(known, min(len(known), 2000))
+    ]
+    # Refresh the cached IDF weights outside the timed loop
+    index.query(queries[0])
+
+    def run() -> int:
+        for query in queries:
+            index.predict(query)
+        return len(queries)
+    return run
+
+
+# Stages returning a callable have untimed setup; the others are timed whole
+STAGES = {
+    'cold_start': stage_cold_start,
+    'csv_parse': stage_csv_parse,
+    'pdf_parse': stage_pdf_parse,
+    'categorize': stage_categorize,
+    'save_transaction': stage_save_transaction,
+    'save_batch': stage_save_batch,
+    'get_transactions': stage_get_transactions,
+    'get_spending_summary': stage_get_spending_summary,
+    'serialize': stage_serialize,
+    'merchant_lookup': stage_merchant_lookup,
+}
+
+# Input files each stage needs generated beforehand
+STAGE_INPUTS = {
+    'csv_parse': 'csv',
+    'pdf_parse': 'pdf',
+    'get_transactions': 'db',
+    'get_spending_summary': 'db',
+    'serialize': 'db',
+}
+
+
+def run_stage(stage: str, paths: Dict[str, str], rows: int) -> Dict[str, Any]:
+    """Run one stage in this process and return its measurements"""
+    # Keep module log output out of the JSON on stdout
+    import logging
+    logging.disable(logging.CRITICAL)
+
+    with tempfile.TemporaryDirectory(prefix='bench_') as tmp:
+        start = time.perf_counter()
+        work = STAGES[stage](dict(paths, tmp=tmp), rows)
+        if callable(work):
+            start = time.perf_counter()
+            processed = work()
+        else:
+            processed = work
+        seconds = time.perf_counter() - start
+
+    return {
+        'rows': processed,
+        'seconds': round(seconds, 4),
+        'rows_per_sec': round(processed / seconds, 1) if seconds > 0 else None,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+# --- orchestration (parent process) ----------------------------------------
+
+def prepare_inputs(data_dir: str, size: str, stages: List[str]) -> Dict[str, str]:
+    """Generate (or reuse) the synthetic inputs needed for a size"""
+    os.makedirs(data_dir, exist_ok=True)
+    rows = generate.parse_size(size)
+    stem = os.path.join(data_dir, f"statement_{size}_{generate.DEFAULT_SEED}")
+    writers = {
+        'csv': generate.write_csv,
+        'pdf': generate.write_pdf,
+        'db': generate.build_database,
+    }
+
+    paths = {}
+    for kind in sorted({STAGE_INPUTS[s] for s in stages if s in STAGE_INPUTS}):
+        path = f"{stem}.{kind}"
+        if not os.path.exists(path):
+            writers[kind](path, rows)
+        paths[kind] = path
+    return paths
+
+
+def spawn_stage(stage: str, size: str, paths: Dict[str, str]) -> Dict[str, Any]:
+    """Run a stage in a fresh interpreter"""
+    cmd = [sys.executable, os.path.abspath(__file__), '--child', stage,
+           '--sizes', size, '--paths', json.dumps(paths)]
+    start = time.perf_counter()
+    proc = subprocess.run(cmd, cwd=BACKEND_DIR, capture_output=True, text=True)
+    wall = time.perf_counter() - start
+
+    if proc.returncode != 0:
+        lines = proc.stderr.strip().splitlines()
+        return {'error': lines[-1] if lines else f"exit code {proc.returncode}"}
+
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result['wall_seconds'] = round(wall, 4)
+    return result
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[Dict[str, Any]]:
+    """Compare stage timings with a baseline; returns the regressions"""
+    regressions = []
+    for size, stages in report['results'].items():
+        for stage, result in stages.items():
+            base = baseline.get('results', {}).get(size, {}).get(stage)
+            if not base or 'seconds' not in base or 'seconds' not in result:
+                continue
+            ratio = result['seconds'] / base['seconds'] if base['seconds'] else None
+            result['baseline_seconds'] = base['seconds']
+            result['ratio'] = round(ratio, 3) if ratio is not None else None
+            if ratio is not None and ratio > 1 + threshold:
+                regressions.append({'size': size, 'stage': stage, 'ratio': result['ratio']})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', default='1k,100k', help="comma separated, e.g. 1k,100k,1M")
+    parser.add_argument('--stages', default=','.join(STAGES), help="comma separated stage names")
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR)
+    parser.add_argument('--output', help="write the JSON report to this file")
+    parser.add_argument('--baseline', help="compare against this JSON report")
+    parser.add_argument('--save-baseline', action='store_true',
+                        help=f"also write the report to {DEFAULT_BASELINE}")
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help="relative slowdown reported as a regression")
+    parser.add_argument('--fail-on-regression', action='store_true')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--paths', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        rows = generate.parse_size(args.sizes)
+        print(json.dumps(run_stage(args.child, json.loads(args.paths), rows)))
+        return
+
+    stages = [s for s in args.stages.split(',') if s]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+
+    report = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'sqlite': sqlite3.sqlite_version,
+        'results': {}
+    }
+    for size in args.sizes.split(','):
+        paths = prepare_inputs(args.data_dir, size, stages)
+        report['results'][size] = {}
+        for stage in stages:
+            result = spawn_stage(stage, size, paths)
+            report['results'][size][stage] = result
+            if 'error' in result:
+                summary = f"skipped: {result['error']}"
+            else:
+                summary = (f"{result['seconds']:>9.4f}s {result['rows_per_sec'] or 0:>12,.0f} rows/s "
+                           f"{result['peak_rss_mb']} MB")
+            print(f"{size:>6} {stage:<22} {summary}", file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        report['regressions'] = regressions
+        for r in regressions:
+            print(f"REGRESSION {r['size']} {r['stage']}: {r['ratio']}x baseline", file=sys.stderr)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    if args.save_baseline:
+        with open(DEFAULT_BASELINE, 'w') as f:
+            f.write(output)
+    print(output)
+
+    if args.fail_on_regression and report.get('regressions'):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,50 +1,206 @@
 """Database operations manager with dynamic categories"""
 
+import heapq
+import os
 import sqlite3
-from typing import Dict, List, Optional, Any
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from datetime import date
+from typing import Dict, List, Optional, Any, Tuple
+from urllib.request import pathname2url
 import logging
 
+from database.migrations import migrate
+from ml.recurring import RecurringDetector
+from ml.similarity import MIN_LABEL_CONFIDENCE
+from models.batch import TransactionBatch, NO_DATE, UNCATEGORIZED, date_to_days, days_to_date, iso_to_days, to_cents
+from utils.helpers import extract_merchant_name
+from utils.metrics import InstrumentedConnection
+
 logger = logging.getLogger(__name__)
 
+# Transaction columns as returned to callers: dates as ISO strings, amounts
+# in currency units and merchant/category names joined in
+TRANSACTION_COLUMNS = (
+    "t.id, date(t.date + 2440587.5) AS date, m.name AS merchant, t.description, "
+    "t.amount_cents / 100.0 AS amount, c.name AS category, t.confidence, t.created_at, "
+    "t.merchant_id, t.category_id"
+)
+
+# Native column types, in TransactionBatch.from_rows order
+BATCH_COLUMNS = "t.id, t.date, m.name, t.description, t.amount_cents, c.name, t.confidence"
+
+# Formatted with the schema holding the transactions table: 'main' or an
+# attached archive shard. Merchants and categories always live in main.
+TRANSACTIONS_FROM = (
+    "{schema}.transactions t "
+    "LEFT JOIN main.merchants m ON m.id = t.merchant_id "
+    "LEFT JOIN main.categories c ON c.id = t.category_id"
+)
+
+# Archive shards attached at once (SQLite allows 10 by default); queries
+# spanning more shards run in groups and their results are merged
+MAX_ATTACHED_SHARDS = 8
+
+# Transactions table of an archive shard; same columns as main
+SHARD_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS {schema}.transactions (
+        id TEXT PRIMARY KEY,
+        date INTEGER,
+        merchant_id INTEGER,
+        description TEXT,
+        amount_cents INTEGER NOT NULL DEFAULT 0,
+        category_id INTEGER,
+        confidence REAL DEFAULT 0.0,
+        created_at TIMESTAMP
+    )
+"""
+
+SHARD_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS {schema}.idx_date ON transactions(date)",
+    "CREATE INDEX IF NOT EXISTS {schema}.idx_category_id ON transactions(category_id, date)",
+    "CREATE INDEX IF NOT EXISTS {schema}.idx_merchant_id ON transactions(merchant_id)",
+)
+
+# Fields callers may update, mapped to (column, conversion)
+UPDATABLE_FIELDS = {
+    'date': ('date', lambda value: None if value is None else _iso_days(value)),
+    'description': ('description', None),
+    'amount': ('amount_cents', to_cents),
+    'confidence': ('confidence', None),
+}
+
+
+def _days_or_none(days: int) -> Optional[int]:
+    return None if days == NO_DATE else days
+
+
+def _iso_days(value: str) -> int:
+    """Convert an ISO date to the stored day number, rejecting other formats"""
+    days = iso_to_days(value)
+    if days == NO_DATE:
+        raise ValueError(f"Invalid date: {value!r} (expected YYYY-MM-DD)")
+    return days
+
+
+def _year_bounds(year: int) -> Tuple[int, int]:
+    """First and last day of a year, as days since the epoch"""
+    return date_to_days(date(year, 1, 1)), date_to_days(date(year, 12, 31))
+
+
+def _date_sort_key(row) -> tuple:
+    # Matches ORDER BY date DESC when merged in reverse: NULL dates last
+    return (row[1] is not None, row[1] or 0)
+
+
+class ArchivedTransactionError(ValueError):
+    """Raised when modifying a transaction stored in a read-only archive shard"""
+
 
 class DatabaseManager:
     def __init__(self, db_path: str):
         self.db_path = db_path
-        self.conn = sqlite3.connect(db_path)
+        # uri=True lets archive shards be attached read-only
+        self.conn = sqlite3.connect(db_path, factory=InstrumentedConnection, uri=True)
         self.conn.row_factory = sqlite3.Row
+        # Raw payee string -> merchant id, shared by every import
+        self._merchant_ids: Dict[str, int] = {}
+        # Category name -> id
+        self._category_ids: Dict[str, int] = {}
+        # Ids created by the open transaction; cached above once it commits
+        self._new_merchant_ids: Dict[str, int] = {}
+        self._new_category_ids: Dict[str, int] = {}
+        # Attached shard aliases, least recently used first
+        self._attached: OrderedDict = OrderedDict()
+        self.recurring = RecurringDetector(self.conn, history=self._merchant_charges)
+        if db_path != ':memory:':
+            # WAL lets background imports write while the UI keeps reading
+            self.conn.execute("PRAGMA journal_mode=WAL")
         self._init_schema()
     
     def _init_schema(self):
-        """Create tables if they don't exist"""
-        self.conn.executescript("""
-            CREATE TABLE IF NOT EXISTS transactions (
-                id TEXT PRIMARY KEY,
-                date TEXT,
-                merchant TEXT,
-                description TEXT,
-                amount REAL,
-                category TEXT,
-                confidence REAL DEFAULT 0.0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-            
-            CREATE TABLE IF NOT EXISTS categories (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT UNIQUE NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
+        """Create tables if they don't exist and apply pending migrations"""
+        applied = migrate(self.conn)
+        if applied:
+            logger.info(f"Database schema migrated to version {applied[-1]}")
+        if 5 in applied:
+            # Seed the recurring-charge statistics from existing history
+            self.rebuild_merchant_stats()
+    
+    @contextmanager
+    def _transaction(self):
+        """
+        Commit on success and roll back on error
+
+        Merchant and category ids created inside are only cached once the
+        commit succeeds, so a failed batch (e.g. SQLITE_BUSY from an import
+        job's connection) leaves no cached ids for rolled-back rows.
+        """
+        try:
+            with self.conn:
+                yield
+        except BaseException:
+            self.conn.rollback()
+            self._new_merchant_ids.clear()
+            self._new_category_ids.clear()
+            raise
+        self._merchant_ids.update(self._new_merchant_ids)
+        self._category_ids.update(self._new_category_ids)
+        self._new_merchant_ids.clear()
+        self._new_category_ids.clear()
+    
+    def resolve_merchants(self, names: List[str]) -> List[Optional[int]]:
+        """
+        Map raw payee strings to merchant ids, creating merchants as needed
+        
+        Each distinct raw string is normalized and looked up once; repeats
+        are served from memory. Does not commit; call inside _transaction().
+        """
+        cache = self._merchant_ids
+        new = self._new_merchant_ids
+        unresolved = {name for name in names if name and name not in cache and name not in new}
+        
+        if unresolved:
+            canonical = {raw: extract_merchant_name(raw) for raw in unresolved}
+            unique = sorted(set(canonical.values()))
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO merchants (name) VALUES (?)",
+                [(name,) for name in unique]
+            )
             
-            CREATE INDEX IF NOT EXISTS idx_date ON transactions(date);
-            CREATE INDEX IF NOT EXISTS idx_category ON transactions(category);
-            CREATE INDEX IF NOT EXISTS idx_merchant ON transactions(merchant);
+            ids = {}
+            for start in range(0, len(unique), 500):
+                chunk = unique[start:start + 500]
+                placeholders = ', '.join('?' * len(chunk))
+                for row in self.conn.execute(
+                    f"SELECT name, id FROM merchants WHERE name IN ({placeholders})", chunk
+                ):
+                    ids[row[0]] = row[1]
             
-            CREATE TABLE IF NOT EXISTS settings (
-                key TEXT PRIMARY KEY,
-                value TEXT,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-        """)
-        self.conn.commit()
+            for raw, name in canonical.items():
+                new[raw] = ids[name]
+        
+        return [cache.get(name) or new.get(name) if name else None for name in names]
+    
+    def resolve_categories(self, names: List[str]) -> List[Optional[int]]:
+        """Map category names to ids, creating categories as needed. Does not commit."""
+        cache = self._category_ids
+        new = self._new_category_ids
+        missing = {name.strip() for name in names if name} - cache.keys() - new.keys()
+        missing.discard('')
+        
+        if missing:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO categories (name) VALUES (?)",
+                [(name,) for name in missing]
+            )
+            for name in missing:
+                row = self.conn.execute(
+                    "SELECT id FROM categories WHERE name = ?", (name,)
+                ).fetchone()
+                new[name] = row[0]
+        
+        return [cache.get(name.strip()) or new.get(name.strip()) if name else None for name in names]
     
     def ensure_category_exists(self, category_name: str) -> None:
         """Add category if it doesn't exist"""
@@ -59,101 +215,622 @@ class DatabaseManager:
                 logger.error(f"Error adding category {category_name}: {e}")
     
     def get_all_categories(self) -> List[str]:
-        """Get all unique categories from both the categories table and transactions"""
-        cursor = self.conn.execute("""
-            SELECT DISTINCT name FROM (
-                SELECT name FROM categories
-                UNION
-                SELECT DISTINCT category as name FROM transactions 
-                WHERE category IS NOT NULL AND category != ''
-            )
-            ORDER BY name
-        """)
+        """Get all categories (every transaction category references this table)"""
+        cursor = self.conn.execute("SELECT name FROM categories ORDER BY name")
         return [row['name'] for row in cursor.fetchall()]
     
     def save_transaction(self, transaction: Dict[str, Any]) -> bool:
         """Save a transaction to database"""
         try:
-            # Ensure the category exists
-            category = transaction.get('category', 'Uncategorized')
-            if category:
-                self.ensure_category_exists(category)
-            
-            self.conn.execute("""
-                INSERT OR REPLACE INTO transactions 
-                (id, date, merchant, description, amount, category, confidence)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (
-                transaction['id'],
-                transaction['date'],
-                transaction['merchant'],
-                transaction['description'],
-                transaction['amount'],
-                category,
-                transaction.get('confidence', 0.0)
-            ))
-            self.conn.commit()
+            with self._transaction():
+                # Ensure the category exists
+                category = transaction.get('category', 'Uncategorized')
+                category_id, = self.resolve_categories([category])
+                merchant_id, = self.resolve_merchants([transaction['merchant']])
+                days = iso_to_days(transaction['date'])
+                cents = to_cents(transaction['amount'])
+                existing = self.conn.execute(
+                    "SELECT merchant_id FROM transactions WHERE id = ?", (transaction['id'],)
+                ).fetchone()
+                
+                self.conn.execute("""
+                    INSERT OR REPLACE INTO transactions 
+                    (id, date, merchant_id, description, amount_cents, category_id, confidence)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, (
+                    transaction['id'],
+                    _days_or_none(days),
+                    merchant_id,
+                    transaction['description'],
+                    cents,
+                    category_id,
+                    transaction.get('confidence', 0.0)
+                ))
+                if existing is None:
+                    self.recurring.update(self._charges(
+                        [transaction['id']], [days], [merchant_id], [cents]
+                    ))
+                self._label_merchants([(merchant_id, category_id, transaction.get('confidence', 0.0))])
+            if existing is not None:
+                self.rebuild_merchant_stats({existing[0], merchant_id})
             return True
         except Exception as e:
             logger.error(f"Database save error: {e}")
             return False
     
+    def save_batch(self, batch: TransactionBatch) -> int:
+        """Save a batch of transactions in a single database transaction"""
+        if not len(batch):
+            return 0
+        
+        # Archived rows are read-only; re-imported ones are skipped
+        archived = self._archived_ids(batch)
+        existing = self._existing_ids(batch.ids)
+        # So are rows already stored under another id
+        skipped = archived | self._stored_copies(batch, archived | existing)
+        # Rows already saved are replaced but not counted again in merchant_stats
+        skip = skipped | existing
+        
+        with self._transaction():
+            merchant_ids = self.resolve_merchants(batch.merchants)
+            # Batch category codes -> database category ids
+            category_ids = self.resolve_categories(batch.categories)
+            rows = (
+                (txn_id, None if days == NO_DATE else days, merchant_id, description,
+                 cents, category_ids[code], confidence)
+                for txn_id, days, merchant_id, description, cents, code, confidence in zip(
+                    batch.ids, batch.dates, merchant_ids, batch.descriptions,
+                    batch.amounts, batch.category_codes, batch.confidences
+                )
+            )
+            if skipped:
+                rows = (row for row in rows if row[0] not in skipped)
+            self.conn.executemany("""
+                INSERT OR REPLACE INTO transactions 
+                (id, date, merchant_id, description, amount_cents, category_id, confidence)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+            self.recurring.update(self._charges(
+                batch.ids, batch.dates, merchant_ids, batch.amounts, skip
+            ))
+            self._label_merchants(
+                (merchant_id, category_ids[code], confidence)
+                for merchant_id, code, confidence in zip(
+                    merchant_ids, batch.category_codes, batch.confidences
+                )
+            )
+        
+        return len(batch) - len(skipped)
+    
+    def _label_merchants(self, labels) -> None:
+        """
+        Record confidently categorized merchants in merchant_categories
+        
+        ``labels`` are (merchant_id, category_id, confidence); a label is
+        only replaced by one of at least the same confidence.
+        """
+        uncategorized = self._category_ids.get(UNCATEGORIZED)
+        best = {}
+        for merchant_id, category_id, confidence in labels:
+            if (confidence < MIN_LABEL_CONFIDENCE or merchant_id is None
+                    or category_id is None or category_id == uncategorized):
+                continue
+            if merchant_id not in best or confidence >= best[merchant_id][1]:
+                best[merchant_id] = (category_id, confidence)
+        if not best:
+            return
+        self.conn.executemany("""
+            INSERT INTO merchant_categories (merchant_id, category_id, confidence)
+            VALUES (?, ?, ?)
+            ON CONFLICT(merchant_id) DO UPDATE SET
+                category_id = excluded.category_id,
+                confidence = excluded.confidence,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE excluded.confidence >= merchant_categories.confidence
+        """, [(merchant_id, category_id, confidence)
+              for merchant_id, (category_id, confidence) in best.items()])
+    
+    @staticmethod
+    def _charges(ids, dates, merchant_ids, amounts, skip=frozenset()) -> list:
+        """Dated debits as (merchant_id, days, absolute cents, id) for merchant_stats"""
+        charges = {}
+        for txn_id, days, merchant_id, cents in zip(ids, dates, merchant_ids, amounts):
+            if cents < 0 and days != NO_DATE and merchant_id is not None and txn_id not in skip:
+                charges[txn_id] = (merchant_id, days, -cents, txn_id)
+        return list(charges.values())
+    
+    def _merchant_charges(self, merchant_ids: List[int]) -> list:
+        """
+        Every charge of the given merchants, in main and the archive shards
+        
+        Called inside save transactions, where shards cannot be attached, so
+        shards are read through their own read-only connections; they never
+        change once written.
+        """
+        rows = []
+        sources = [(self.conn, 'main')] + [
+            (None, path) for _, path in self._shards_for(None, None)
+        ]
+        for conn, path in sources:
+            shard = conn or sqlite3.connect(self._shard_uri(path), uri=True)
+            try:
+                for i in range(0, len(merchant_ids), 500):
+                    chunk = merchant_ids[i:i + 500]
+                    placeholders = ', '.join('?' * len(chunk))
+                    rows += shard.execute(f"""
+                        SELECT id, date, merchant_id, amount_cents FROM transactions
+                        WHERE merchant_id IN ({placeholders})
+                    """, chunk).fetchall()
+            finally:
+                if conn is None:
+                    shard.close()
+        
+        ids, dates, merchants, amounts = zip(*rows) if rows else ((), (), (), ())
+        dates = [NO_DATE if days is None else days for days in dates]
+        return self._charges(ids, dates, merchants, amounts)
+    
+    def _existing_ids(self, ids: List[str]) -> set:
+        """Ids already stored in the main database"""
+        found = set()
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            placeholders = ', '.join('?' * len(chunk))
+            found.update(row[0] for row in self.conn.execute(
+                f"SELECT id FROM main.transactions WHERE id IN ({placeholders})", chunk
+            ))
+        return found
+    
+    def rebuild_merchant_stats(self, merchant_ids: Optional[set] = None) -> None:
+        """
+        Recompute merchant_stats and anomalies from transaction history
+        
+        Used after edits that incremental updates can't express (deleted
+        rows, changed dates or amounts). Without ``merchant_ids`` every
+        merchant is rebuilt.
+        """
+        columns = "t.id, t.date, t.merchant_id, t.amount_cents"
+        if merchant_ids is None:
+            rows = self._select_transactions(columns, None, raw=True)
+        else:
+            merchant_ids = {merchant_id for merchant_id in merchant_ids if merchant_id is not None}
+            rows = []
+            for merchant_id in merchant_ids:
+                rows += self._select_transactions(columns, {'merchant_id': merchant_id}, raw=True)
+        
+        ids, dates, merchants, amounts = zip(*rows) if rows else ((), (), (), ())
+        dates = [NO_DATE if days is None else days for days in dates]
+        with self.conn:
+            self.recurring.reset(None if merchant_ids is None else list(merchant_ids))
+            self.recurring.update(self._charges(ids, dates, merchants, amounts))
+    
+    def get_transactions_batch(self, filters: Optional[Dict] = None) -> TransactionBatch:
+        """Retrieve transactions with optional filters as a columnar batch"""
+        # Plain tuples avoid building a sqlite3.Row per result
+        return TransactionBatch.from_rows(self._select_transactions(BATCH_COLUMNS, filters, raw=True))
+    
+    def get_transaction(self, transaction_id: str) -> Optional[Dict]:
+        """Retrieve a single transaction from the main database"""
+        row = self.conn.execute(
+            f"SELECT {TRANSACTION_COLUMNS} FROM {TRANSACTIONS_FROM.format(schema='main')} "
+            "WHERE t.id = ?", (transaction_id,)
+        ).fetchone()
+        return dict(row) if row else None
+    
     def get_transactions(self, filters: Optional[Dict] = None) -> List[Dict]:
         """Retrieve transactions with optional filters"""
-        query = "SELECT * FROM transactions WHERE 1=1"
+        return [dict(row) for row in self._select_transactions(TRANSACTION_COLUMNS, filters)]
+    
+    def _select_transactions(self, columns: str, filters: Optional[Dict],
+                             raw: bool = False) -> list:
+        """
+        Run a filtered transactions query across main and archive shards
+        
+        Only shards whose year overlaps the date filter are attached and
+        queried, so reads of recent data touch the main database alone.
+        """
+        conditions, params, start, end = self._transaction_filters(filters)
+        shards = self._shards_for(start, end)
+        
+        results = []
+        schemas = ['main']
+        # The first group also covers main
+        for i in range(0, len(shards) or 1, MAX_ATTACHED_SHARDS):
+            schemas += [self._attach(year, path) for year, path in shards[i:i + MAX_ATTACHED_SHARDS]]
+            parts = [
+                f"SELECT {columns} FROM {TRANSACTIONS_FROM.format(schema=schema)} WHERE {conditions}"
+                for schema in schemas
+            ]
+            # A single table can order by the indexed column directly
+            order = "t.date DESC" if len(parts) == 1 else "date DESC"
+            query = " UNION ALL ".join(parts) + f" ORDER BY {order}"
+            cursor = self.conn.execute(query, params * len(parts))
+            if raw:
+                cursor.row_factory = None
+            results.append(cursor.fetchall())
+            schemas = []
+        
+        if len(results) == 1:
+            return results[0]
+        return list(heapq.merge(*results, key=_date_sort_key, reverse=True))
+    
+    def _transaction_filters(self, filters: Optional[Dict]):
+        """Build the WHERE clause for a filtered transactions query"""
+        conditions = ["1=1"]
         params = []
+        start = end = None
         
         if filters:
             if 'start_date' in filters:
-                query += " AND date >= ?"
-                params.append(filters['start_date'])
+                start = self._filter_days(filters['start_date'])
+                conditions.append("t.date >= ?")
+                params.append(start)
             if 'end_date' in filters:
-                query += " AND date <= ?"
-                params.append(filters['end_date'])
+                end = self._filter_days(filters['end_date'])
+                conditions.append("t.date <= ?")
+                params.append(end)
             if 'category' in filters:
-                query += " AND category = ?"
+                conditions.append("t.category_id = (SELECT id FROM main.categories WHERE name = ?)")
                 params.append(filters['category'])
+            if 'merchant_id' in filters:
+                conditions.append("t.merchant_id = ?")
+                params.append(filters['merchant_id'])
+            if 'merchant' in filters:
+                conditions.append("t.merchant_id = (SELECT id FROM main.merchants WHERE name = ?)")
+                params.append(extract_merchant_name(filters['merchant']))
+            if 'search' in filters:
+                # Match against the small merchants table, then filter by id
+                conditions.append("t.merchant_id IN (SELECT id FROM main.merchants WHERE name LIKE ?)")
+                params.append(f"%{filters['search']}%")
         
-        query += " ORDER BY date DESC"
-        
-        cursor = self.conn.execute(query, params)
-        return [dict(row) for row in cursor.fetchall()]
+        return " AND ".join(conditions), params, start, end
+    
+    @staticmethod
+    def _filter_days(value: str) -> int:
+        """Convert an ISO date filter to the stored day number"""
+        days = iso_to_days(value)
+        if days == NO_DATE:
+            raise ValueError(f"Invalid date filter: {value!r} (expected YYYY-MM-DD)")
+        return days
     
     def update_transaction(self, transaction_id: str, updates: Dict) -> bool:
         """Update a transaction"""
         try:
-            # If updating category, ensure it exists
-            if 'category' in updates:
-                self.ensure_category_exists(updates['category'])
-            
-            set_clauses = []
-            params = []
-            
-            for field, value in updates.items():
-                if field != 'id':
-                    set_clauses.append(f"{field} = ?")
+            with self._transaction():
+                set_clauses = []
+                params = []
+                
+                for field, value in updates.items():
+                    if field == 'id':
+                        continue
+                    # Categories and merchants are stored by id
+                    if field == 'category':
+                        column, value = 'category_id', self.resolve_categories([value])[0]
+                    elif field == 'merchant':
+                        column, value = 'merchant_id', self.resolve_merchants([value])[0]
+                    elif field in UPDATABLE_FIELDS:
+                        column, convert = UPDATABLE_FIELDS[field]
+                        if convert:
+                            value = convert(value)
+                    else:
+                        raise ValueError(f"Field cannot be updated: {field}")
+                    set_clauses.append(f"{column} = ?")
                     params.append(value)
-            
-            params.append(transaction_id)
-            query = f"UPDATE transactions SET {', '.join(set_clauses)} WHERE id = ?"
-            
-            self.conn.execute(query, params)
-            self.conn.commit()
+                
+                if not set_clauses:
+                    return True
+                
+                params.append(transaction_id)
+                query = f"UPDATE transactions SET {', '.join(set_clauses)} WHERE id = ?"
+                
+                previous = self.conn.execute(
+                    "SELECT merchant_id FROM transactions WHERE id = ?", (transaction_id,)
+                ).fetchone()
+                cursor = self.conn.execute(query, params)
+                if cursor.rowcount and 'category' in updates:
+                    self._label_merchants(self.conn.execute(
+                        "SELECT merchant_id, category_id, confidence FROM transactions WHERE id = ?",
+                        (transaction_id,)
+                    ).fetchall())
+            if cursor.rowcount == 0:
+                self._check_not_archived(transaction_id)
+            elif updates.keys() & {'date', 'amount', 'merchant'}:
+                current = self.conn.execute(
+                    "SELECT merchant_id FROM transactions WHERE id = ?", (transaction_id,)
+                ).fetchone()
+                self.rebuild_merchant_stats({previous[0], current[0]})
             return True
+        except ArchivedTransactionError:
+            raise
         except Exception as e:
             logger.error(f"Update error: {e}")
             return False
     
+    def delete_transaction(self, transaction_id: str) -> None:
+        """Delete a transaction; archived transactions cannot be deleted"""
+        previous = self.conn.execute(
+            "SELECT merchant_id FROM transactions WHERE id = ?", (transaction_id,)
+        ).fetchone()
+        cursor = self.conn.execute("DELETE FROM transactions WHERE id = ?", (transaction_id,))
+        self.conn.commit()
+        if cursor.rowcount == 0:
+            self._check_not_archived(transaction_id)
+        else:
+            self.rebuild_merchant_stats({previous[0]})
+    
     def get_category_spending(self, start_date: str, end_date: str) -> Dict[str, float]:
         """Get spending breakdown by category"""
-        cursor = self.conn.execute("""
-            SELECT category, SUM(ABS(amount)) as total
-            FROM transactions
-            WHERE amount < 0 
-                AND date >= ? 
-                AND date <= ?
-            GROUP BY category
-            ORDER BY total DESC
-        """, (start_date, end_date))
-        
-        return {row['category']: row['total'] for row in cursor.fetchall()}
+        start, end = self._filter_days(start_date), self._filter_days(end_date)
+        shards = self._shards_for(start, end)
+        
+        totals: Dict[int, int] = {}
+        schemas = ['main']
+        for i in range(0, len(shards) or 1, MAX_ATTACHED_SHARDS):
+            schemas += [self._attach(year, path) for year, path in shards[i:i + MAX_ATTACHED_SHARDS]]
+            parts = [f"""
+                SELECT category_id, amount_cents FROM {schema}.transactions
+                WHERE amount_cents < 0 AND date >= ? AND date <= ?
+            """ for schema in schemas]
+            cursor = self.conn.execute(f"""
+                SELECT category_id, -SUM(amount_cents) AS total
+                FROM ({" UNION ALL ".join(parts)})
+                GROUP BY category_id
+            """, [start, end] * len(parts))
+            for category_id, total in cursor.fetchall():
+                totals[category_id] = totals.get(category_id, 0) + total
+            schemas = []
+        
+        names = {row[0]: row[1] for row in self.conn.execute("SELECT id, name FROM categories")}
+        return {
+            names.get(category_id): total / 100
+            for category_id, total in sorted(totals.items(), key=lambda item: -item[1])
+        }
+    
+    # Year partitioning
+    
+    def get_partitions(self) -> List[Dict]:
+        """Archived years with their shard files and row counts"""
+        cursor = self.conn.execute(
+            "SELECT year, path, row_count, archived_at FROM partitions ORDER BY year"
+        )
+        return [dict(row) for row in cursor.fetchall()]
+    
+    def archive_closed_years(self, keep_years: int = 1, vacuum: bool = True) -> List[Dict]:
+        """
+        Move every closed year older than the last ``keep_years`` years
+        into its own archive shard
+        
+        With the default of 1 only the current year stays in the main
+        database. Returns the years archived and their row counts.
+        """
+        if keep_years < 1:
+            raise ValueError("keep_years must be at least 1")
+        cutoff_year = date.today().year - keep_years + 1
+        oldest = self.conn.execute(
+            "SELECT MIN(date) FROM transactions WHERE date < ?",
+            (_year_bounds(cutoff_year)[0],)
+        ).fetchone()[0]
+        if oldest is None:
+            return []
+        
+        archived = []
+        for year in range(days_to_date(oldest).year, cutoff_year):
+            rows = self.archive_year(year)
+            if rows:
+                archived.append({'year': year, 'rows': rows})
+        
+        if archived and vacuum:
+            # Return the freed pages so the hot database file shrinks
+            self.conn.execute("VACUUM main")
+        return archived
+    
+    def archive_year(self, year: int) -> int:
+        """
+        Move a closed year's transactions into ``<database>_<year>.db``
+        
+        Rows are copied (merging into an existing shard), registered and
+        removed from main in one write transaction, so rows committed by
+        another connection meanwhile are neither lost nor half-moved. The
+        shard is compacted afterwards. An interrupted run can simply be
+        repeated. Returns the number of rows moved.
+        """
+        if self.db_path == ':memory:':
+            raise ValueError("In-memory databases cannot be partitioned")
+        if year >= date.today().year:
+            raise ValueError(f"{year} is not a closed year")
+        
+        first, last = _year_bounds(year)
+        if not self.conn.execute(
+            "SELECT 1 FROM main.transactions WHERE date BETWEEN ? AND ? LIMIT 1", (first, last)
+        ).fetchone():
+            return 0
+        
+        path = self._shard_path(year)
+        self._detach(f"shard_{year}")
+        self.conn.execute("ATTACH DATABASE ? AS archive_load", (self._shard_uri(path, 'rwc'),))
+        try:
+            self.conn.execute(SHARD_SCHEMA.format(schema='archive_load'))
+            with self.conn:
+                self.conn.execute("BEGIN IMMEDIATE")
+                self.conn.execute("""
+                    INSERT OR REPLACE INTO archive_load.transactions
+                    SELECT id, date, merchant_id, description, amount_cents,
+                           category_id, confidence, created_at
+                    FROM main.transactions WHERE date BETWEEN ? AND ?
+                """, (first, last))
+                row_count = self.conn.execute(
+                    "SELECT COUNT(*) FROM archive_load.transactions"
+                ).fetchone()[0]
+                self.conn.execute("""
+                    INSERT INTO partitions (year, path, row_count) VALUES (?, ?, ?)
+                    ON CONFLICT(year) DO UPDATE SET
+                        path = excluded.path, row_count = excluded.row_count,
+                        archived_at = CURRENT_TIMESTAMP
+                """, (year, os.path.basename(path), row_count))
+                # Delete exactly the rows that are now in the shard
+                moved = self.conn.execute("""
+                    DELETE FROM main.transactions
+                    WHERE date BETWEEN ? AND ?
+                      AND id IN (SELECT id FROM archive_load.transactions)
+                """, (first, last)).rowcount
+            for index in SHARD_INDEXES:
+                self.conn.execute(index.format(schema='archive_load'))
+            # Archived shards are never written again; pack them tightly
+            self.conn.execute("VACUUM archive_load")
+        finally:
+            self.conn.execute("DETACH DATABASE archive_load")
+        
+        logger.info(f"Archived {moved} transactions from {year} to {path}")
+        return moved
+    
+    def _shard_path(self, year: int, name: Optional[str] = None) -> str:
+        """Shard files live next to the main database"""
+        directory = os.path.dirname(os.path.abspath(self.db_path))
+        if name is None:
+            stem = os.path.splitext(os.path.basename(self.db_path))[0]
+            name = f"{stem}_{year}.db"
+        return os.path.join(directory, name)
+    
+    @staticmethod
+    def _shard_uri(path: str, mode: str = 'ro') -> str:
+        return f"file:{pathname2url(path)}?mode={mode}"
+    
+    def _shards_for(self, start: Optional[int], end: Optional[int]) -> List[Tuple[int, str]]:
+        """Archived (year, path) pairs overlapping a day range, newest first"""
+        shards = []
+        for year, name in self.conn.execute("SELECT year, path FROM partitions ORDER BY year DESC"):
+            first, last = _year_bounds(year)
+            if (start is None or last >= start) and (end is None or first <= end):
+                shards.append((year, self._shard_path(year, name)))
+        return shards
+    
+    def _attach(self, year: int, path: str) -> str:
+        """Attach a shard read-only (if needed) and return its schema alias"""
+        alias = f"shard_{year}"
+        if alias in self._attached:
+            self._attached.move_to_end(alias)
+            return alias
+        
+        while len(self._attached) >= MAX_ATTACHED_SHARDS:
+            self._detach(next(iter(self._attached)))
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Archive shard for {year} is missing: {path}")
+        self.conn.execute(f"ATTACH DATABASE ? AS {alias}", (self._shard_uri(path),))
+        self._attached[alias] = year
+        return alias
+    
+    def close_shards(self) -> None:
+        """Detach every attached archive shard"""
+        for alias in list(self._attached):
+            self._detach(alias)
+    
+    def reset_caches(self) -> None:
+        """Forget cached ids and attachments, e.g. after the database was restored"""
+        self._merchant_ids.clear()
+        self._category_ids.clear()
+        self._new_merchant_ids.clear()
+        self._new_category_ids.clear()
+        self.close_shards()
+    
+    def _detach(self, alias: str) -> None:
+        if self._attached.pop(alias, None) is not None:
+            self.conn.execute(f"DETACH DATABASE {alias}")
+    
+    def _archived_ids(self, batch: TransactionBatch) -> set:
+        """Ids in ``batch`` that already exist in an archive shard"""
+        partitions = {
+            year: name for year, name in self.conn.execute("SELECT year, path FROM partitions")
+        }
+        if not partitions:
+            return set()
+        
+        bounds = {year: _year_bounds(year) for year in partitions}
+        newest = max(last for _, last in bounds.values())
+        by_year: Dict[int, List[str]] = {}
+        for txn_id, days in zip(batch.ids, batch.dates):
+            if days > newest:
+                continue
+            for year, (first, last) in bounds.items():
+                if first <= days <= last:
+                    by_year.setdefault(year, []).append(txn_id)
+                    break
+        
+        found = set()
+        for year, ids in by_year.items():
+            alias = self._attach(year, self._shard_path(year, partitions[year]))
+            for i in range(0, len(ids), 500):
+                chunk = ids[i:i + 500]
+                placeholders = ', '.join('?' * len(chunk))
+                found.update(row[0] for row in self.conn.execute(
+                    f"SELECT id FROM {alias}.transactions WHERE id IN ({placeholders})", chunk
+                ))
+        return found
+    
+    def _stored_copies(self, batch: TransactionBatch, known: set) -> set:
+        """
+        Ids in ``batch`` of rows already stored (or archived) under another id
+        
+        Parsers give every row a fresh random id, so re-imported rows are
+        matched on (merchant, date, amount, description). A row stored n
+        times absorbs at most n copies, so identical charges on the same
+        day are kept. Rows whose id is in ``known`` are left alone.
+        """
+        days = sorted({day for day in batch.dates if day != NO_DATE})
+        
+        # Look merchants up without creating them; unknown ones have no copies
+        canonical = {raw: extract_merchant_name(raw) for raw in set(batch.merchants) if raw}
+        names = sorted(set(canonical.values()))
+        merchant_ids = {}
+        for i in range(0, len(names), 500):
+            chunk = names[i:i + 500]
+            placeholders = ', '.join('?' * len(chunk))
+            merchant_ids.update(self.conn.execute(
+                f"SELECT name, id FROM main.merchants WHERE name IN ({placeholders})", chunk
+            ))
+        
+        batch_ids = set(batch.ids)
+        stored = Counter()
+        
+        def count(schema: str) -> None:
+            conditions = [("date IS NULL", [])] if schema == 'main' and NO_DATE in batch.dates else []
+            for i in range(0, len(days), 500):
+                chunk = days[i:i + 500]
+                conditions.append((f"date IN ({', '.join('?' * len(chunk))})", chunk))
+            for condition, params in conditions:
+                for row in self.conn.execute(f"""
+                    SELECT id, merchant_id, date, amount_cents, description
+                    FROM {schema}.transactions WHERE {condition}
+                """, params):
+                    if row[0] not in batch_ids:
+                        stored[row[1:]] += 1
+        
+        count('main')
+        for year, path in self._shards_for(days[0], days[-1]) if days else []:
+            count(self._attach(year, path))
+        if not stored:
+            return set()
+        
+        copies = set()
+        matched = Counter()
+        for txn_id, raw, day, cents, description in zip(
+            batch.ids, batch.merchants, batch.dates, batch.amounts, batch.descriptions
+        ):
+            if txn_id in known or (raw and canonical[raw] not in merchant_ids):
+                continue
+            key = (merchant_ids[canonical[raw]] if raw else None,
+                   None if day == NO_DATE else day, cents, description)
+            if matched[key] < stored[key]:
+                matched[key] += 1
+                copies.add(txn_id)
+        return copies
+    
+    def _check_not_archived(self, transaction_id: str) -> None:
+        """Raise ArchivedTransactionError if the id lives in an archive shard"""
+        for year, path in self._shards_for(None, None):
+            alias = self._attach(year, path)
+            found = self.conn.execute(
+                f"SELECT 1 FROM {alias}.transactions WHERE id = ?", (transaction_id,)
+            ).fetchone()
+            if found:
+                raise ArchivedTransactionError(
+                    f"Transaction {transaction_id} is archived ({year}) and read-only"
+                )
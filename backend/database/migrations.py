@@ -0,0 +1,562 @@
+"""Versioned, resumable schema migrations"""
+
+import os
+import re
+import secrets
+import sqlite3
+from datetime import date, datetime
+from typing import Callable, List, NamedTuple, Optional
+import logging
+
+from ml.similarity import LABELS_VERSION_KEY, MIN_LABEL_CONFIDENCE
+from models.batch import date_to_days
+from utils.helpers import extract_merchant_name
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_VERSION_KEY = 'schema_version'
+
+# Rows copied per transaction when a migration rebuilds a table
+MIGRATION_BATCH_SIZE = 10000
+
+# Schema of databases created before migrations existed (version 0)
+BASE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS transactions (
+        id TEXT PRIMARY KEY,
+        date TEXT,
+        merchant TEXT,
+        description TEXT,
+        amount REAL,
+        category TEXT,
+        confidence REAL DEFAULT 0.0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+
+    CREATE TABLE IF NOT EXISTS categories (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT UNIQUE NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+
+    CREATE TABLE IF NOT EXISTS settings (
+        key TEXT PRIMARY KEY,
+        value TEXT,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+"""
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    apply: Callable[[sqlite3.Connection, int], None]
+
+
+MIGRATIONS: List[Migration] = []
+
+
+def migration(version: int, name: str):
+    """Register a migration; versions must be added in increasing order"""
+    def register(fn):
+        assert not MIGRATIONS or MIGRATIONS[-1].version < version
+        MIGRATIONS.append(Migration(version, name, fn))
+        return fn
+    return register
+
+
+def get_setting(conn: sqlite3.Connection, key: str) -> Optional[str]:
+    row = conn.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+
+def set_setting(conn: sqlite3.Connection, key: str, value) -> None:
+    conn.execute("""
+        INSERT INTO settings (key, value, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at = CURRENT_TIMESTAMP
+    """, (key, str(value)))
+
+
+def delete_setting(conn: sqlite3.Connection, key: str) -> None:
+    conn.execute("DELETE FROM settings WHERE key = ?", (key,))
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    """Current schema version (0 for databases that predate migrations)"""
+    has_settings = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'settings'"
+    ).fetchone()
+    if not has_settings:
+        return 0
+    return int(get_setting(conn, SCHEMA_VERSION_KEY) or 0)
+
+
+def latest_version() -> int:
+    return MIGRATIONS[-1].version if MIGRATIONS else 0
+
+
+def migrate(conn: sqlite3.Connection, batch_size: int = MIGRATION_BATCH_SIZE) -> List[int]:
+    """
+    Bring a database up to the latest schema version
+
+    Each migration either commits completely or, for table rebuilds,
+    records its progress after every batch so an interrupted run resumes
+    where it stopped. Returns the versions applied.
+    """
+    current = schema_version(conn)
+    if current == 0:
+        conn.executescript(BASE_SCHEMA)
+
+    applied = []
+    for step in MIGRATIONS:
+        if step.version <= current:
+            continue
+        logger.info(f"Applying migration {step.version}: {step.name}")
+        step.apply(conn, batch_size)
+        with conn:
+            set_setting(conn, SCHEMA_VERSION_KEY, step.version)
+        applied.append(step.version)
+    return applied
+
+
+def _columns(conn: sqlite3.Connection, table: str) -> List[str]:
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def _rebuild_transactions(conn: sqlite3.Connection, version: int, new_table: str,
+                          indexes: List[str], select: str, insert: str,
+                          convert: Callable, batch_size: int) -> None:
+    """
+    Copy transactions into a new table definition in batches, then swap
+
+    ``select`` lists the old columns to read (after rowid), ``insert`` is
+    the INSERT into ``transactions_new`` and ``convert`` maps an old row
+    to its parameters. Progress is stored under a settings key so the
+    copy can resume after a crash; the swap itself is atomic.
+    """
+    cursor_key = f"migration.{version}.cursor"
+    conn.execute(new_table)
+    last = int(get_setting(conn, cursor_key) or 0)
+
+    while True:
+        rows = conn.execute(
+            f"SELECT rowid, {select} FROM transactions WHERE rowid > ? ORDER BY rowid LIMIT ?",
+            (last, batch_size)
+        ).fetchall()
+        if not rows:
+            break
+        with conn:
+            conn.executemany(insert, [convert(row[1:]) for row in rows])
+            last = rows[-1][0]
+            set_setting(conn, cursor_key, last)
+        logger.info(f"Migration {version}: copied rows up to rowid {last}")
+
+    conn.execute("BEGIN")
+    try:
+        conn.execute("DROP TABLE transactions")
+        conn.execute("ALTER TABLE transactions_new RENAME TO transactions")
+        for index in indexes:
+            conn.execute(index)
+        delete_setting(conn, cursor_key)
+        # Bump the version with the swap so a crash can't re-run the copy
+        # against the new table
+        set_setting(conn, SCHEMA_VERSION_KEY, version)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+_LEGACY_DATE = re.compile(r'^\s*(\d{1,2})/(\d{1,2})(?:/(\d{2,4}))?\s*$')
+
+
+def legacy_date_to_days(value, created_at: Optional[str] = None) -> Optional[int]:
+    """
+    Convert a date stored as free text to days since the epoch
+
+    Handles ISO dates and the MM/DD[/YY[YY]] strings older parsers stored.
+    Dates without a year are placed in the year before the row was created.
+    """
+    if value is None:
+        return None
+    text = str(value).strip()
+    try:
+        return date_to_days(date.fromisoformat(text[:10]))
+    except ValueError:
+        pass
+
+    match = _LEGACY_DATE.match(text)
+    if not match:
+        return None
+    month, day, year = match.groups()
+    try:
+        if year:
+            year_num = int(year) + (2000 if len(year) == 2 else 0)
+            return date_to_days(date(year_num, int(month), int(day)))
+
+        try:
+            reference = datetime.fromisoformat(str(created_at)).date()
+        except ValueError:
+            reference = date.today()
+        parsed = date(reference.year, int(month), int(day))
+        if parsed > reference:
+            parsed = date(reference.year - 1, int(month), int(day))
+        return date_to_days(parsed)
+    except ValueError:
+        return None
+
+
+def _amount_to_cents(value) -> int:
+    if value is None:
+        return 0
+    return int(round(float(value) * 100))
+
+
+@migration(1, 'merchant_ids')
+def _merchant_ids(conn: sqlite3.Connection, batch_size: int) -> None:
+    """Move free-text transactions.merchant into a merchants table"""
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS merchants (
+            id INTEGER PRIMARY KEY,
+            name TEXT UNIQUE NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+    columns = _columns(conn, 'transactions')
+
+    with conn:
+        if 'merchant_id' not in columns:
+            conn.execute(
+                "ALTER TABLE transactions ADD COLUMN merchant_id INTEGER REFERENCES merchants(id)"
+            )
+        if 'merchant' in columns:
+            raw_names = [
+                row[0] for row in conn.execute(
+                    "SELECT DISTINCT merchant FROM transactions WHERE merchant IS NOT NULL"
+                )
+            ]
+            canonical = {raw: extract_merchant_name(raw) for raw in raw_names}
+            conn.executemany(
+                "INSERT OR IGNORE INTO merchants (name) VALUES (?)",
+                [(name,) for name in set(canonical.values())]
+            )
+            conn.executemany("""
+                UPDATE transactions
+                SET merchant_id = (SELECT id FROM merchants WHERE name = ?)
+                WHERE merchant = ?
+            """, [(name, raw) for raw, name in canonical.items()])
+        conn.execute("DROP INDEX IF EXISTS idx_merchant")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_merchant_id ON transactions(merchant_id)")
+    # The merchant column itself is dropped by the next table rebuild
+
+
+@migration(2, 'typed_dates_and_cents')
+def _typed_dates_and_cents(conn: sqlite3.Connection, batch_size: int) -> None:
+    """Store dates as days since 1970-01-01 and amounts as integer cents"""
+    _rebuild_transactions(
+        conn, 2,
+        new_table="""
+            CREATE TABLE IF NOT EXISTS transactions_new (
+                id TEXT PRIMARY KEY,
+                date INTEGER,
+                merchant_id INTEGER REFERENCES merchants(id),
+                description TEXT,
+                amount_cents INTEGER NOT NULL DEFAULT 0,
+                category TEXT,
+                confidence REAL DEFAULT 0.0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """,
+        indexes=[
+            "CREATE INDEX IF NOT EXISTS idx_date ON transactions(date)",
+            "CREATE INDEX IF NOT EXISTS idx_category ON transactions(category)",
+            "CREATE INDEX IF NOT EXISTS idx_merchant_id ON transactions(merchant_id)",
+        ],
+        select="id, date, merchant_id, description, amount, category, confidence, created_at",
+        insert="""
+            INSERT OR REPLACE INTO transactions_new
+            (id, date, merchant_id, description, amount_cents, category, confidence, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        convert=lambda row: (
+            row[0], legacy_date_to_days(row[1], row[7]), row[2], row[3],
+            _amount_to_cents(row[4]), row[5], row[6], row[7]
+        ),
+        batch_size=batch_size
+    )
+
+
+@migration(3, 'category_ids')
+def _category_ids(conn: sqlite3.Connection, batch_size: int) -> None:
+    """Dictionary-encode categories as a foreign key into categories"""
+    with conn:
+        conn.execute("""
+            INSERT OR IGNORE INTO categories (name)
+            SELECT DISTINCT TRIM(category) FROM transactions
+            WHERE category IS NOT NULL AND TRIM(category) != ''
+        """)
+    ids = {name: category_id for category_id, name in conn.execute("SELECT id, name FROM categories")}
+
+    _rebuild_transactions(
+        conn, 3,
+        new_table="""
+            CREATE TABLE IF NOT EXISTS transactions_new (
+                id TEXT PRIMARY KEY,
+                date INTEGER,
+                merchant_id INTEGER REFERENCES merchants(id),
+                description TEXT,
+                amount_cents INTEGER NOT NULL DEFAULT 0,
+                category_id INTEGER REFERENCES categories(id),
+                confidence REAL DEFAULT 0.0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """,
+        indexes=[
+            "CREATE INDEX IF NOT EXISTS idx_date ON transactions(date)",
+            "CREATE INDEX IF NOT EXISTS idx_category_id ON transactions(category_id, date)",
+            "CREATE INDEX IF NOT EXISTS idx_merchant_id ON transactions(merchant_id)",
+        ],
+        select="id, date, merchant_id, description, amount_cents, category, confidence, created_at",
+        insert="""
+            INSERT OR REPLACE INTO transactions_new
+            (id, date, merchant_id, description, amount_cents, category_id, confidence, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        convert=lambda row: (
+            row[0], row[1], row[2], row[3], row[4],
+            ids.get((row[5] or '').strip()), row[6], row[7]
+        ),
+        batch_size=batch_size
+    )
+
+
+@migration(4, 'partitions')
+def _partitions(conn: sqlite3.Connection, batch_size: int) -> None:
+    """Registry of closed years moved into per-year archive shards"""
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS partitions (
+            year INTEGER PRIMARY KEY,
+            path TEXT NOT NULL,
+            row_count INTEGER NOT NULL DEFAULT 0,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+
+
+@migration(5, 'merchant_stats')
+def _merchant_stats(conn: sqlite3.Connection, batch_size: int) -> None:
+    """Running per-merchant charge statistics and flagged anomalies"""
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS merchant_stats (
+            merchant_id INTEGER PRIMARY KEY REFERENCES merchants(id),
+            charge_count INTEGER NOT NULL DEFAULT 0,
+            first_date INTEGER,
+            last_date INTEGER,
+            last_cents INTEGER,
+            amount_mean REAL NOT NULL DEFAULT 0,
+            amount_m2 REAL NOT NULL DEFAULT 0,
+            interval_count INTEGER NOT NULL DEFAULT 0,
+            interval_mean REAL NOT NULL DEFAULT 0,
+            interval_m2 REAL NOT NULL DEFAULT 0,
+            recurring_flagged INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+
+        CREATE TABLE IF NOT EXISTS anomalies (
+            id INTEGER PRIMARY KEY,
+            transaction_id TEXT NOT NULL,
+            merchant_id INTEGER REFERENCES merchants(id),
+            date INTEGER,
+            kind TEXT NOT NULL,
+            amount_cents INTEGER,
+            expected_cents INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE (transaction_id, kind)
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_anomalies_date ON anomalies(date);
+        CREATE INDEX IF NOT EXISTS idx_anomalies_merchant ON anomalies(merchant_id);
+    """)
+
+
+@migration(6, 'change_log')
+def _change_log(conn: sqlite3.Connection, batch_size: int) -> None:
+    """
+    Log of changed row keys, so snapshots can copy only what changed
+
+    The triggers that fill it are created with the first snapshot (see
+    database/snapshot.py); entries are deleted once a snapshot covers them.
+    """
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq INTEGER PRIMARY KEY,
+            table_name TEXT NOT NULL,
+            row_key NOT NULL
+        );
+    """)
+
+
+@migration(7, 'merchant_categories')
+def _merchant_categories(conn: sqlite3.Connection, batch_size: int) -> None:
+    """Category label of each merchant, used by the nearest-merchant index"""
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS merchant_categories (
+            merchant_id INTEGER PRIMARY KEY REFERENCES merchants(id),
+            category_id INTEGER NOT NULL REFERENCES categories(id),
+            confidence REAL NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+    # Seed with each merchant's most frequent confident category, counting
+    # archived years too
+    uncategorized = conn.execute(
+        "SELECT id FROM categories WHERE name = 'Uncategorized'"
+    ).fetchone()
+    shards = _attach_shards(conn)
+    counts = {}
+    for schema in ['main'] + shards:
+        for merchant_id, category_id, count, confidence in conn.execute(f"""
+            SELECT merchant_id, category_id, COUNT(*), MAX(confidence)
+            FROM {schema}.transactions
+            WHERE merchant_id IS NOT NULL AND category_id IS NOT NULL AND confidence >= ?
+            GROUP BY merchant_id, category_id
+        """, (MIN_LABEL_CONFIDENCE,)):
+            if uncategorized and category_id == uncategorized[0]:
+                continue
+            total, best = counts.get((merchant_id, category_id), (0, 0.0))
+            counts[(merchant_id, category_id)] = (total + count, max(best, confidence))
+    for schema in shards:
+        conn.execute(f"DETACH DATABASE {schema}")
+
+    best = {}
+    for (merchant_id, category_id), (count, confidence) in counts.items():
+        if merchant_id not in best or count > best[merchant_id][1]:
+            best[merchant_id] = (category_id, count, confidence)
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO merchant_categories (merchant_id, category_id, confidence) "
+            "VALUES (?, ?, ?)",
+            [(merchant_id, category_id, confidence)
+             for merchant_id, (category_id, _, confidence) in best.items()]
+        )
+
+
+def _attach_shards(conn: sqlite3.Connection) -> List[str]:
+    """
+    Attach the archive shards listed in partitions; returns their schema names
+
+    Shards live next to the main database file. Missing shards are skipped.
+    """
+    main_path = next(row[2] for row in conn.execute("PRAGMA database_list") if row[1] == 'main')
+    if not main_path:
+        return []
+    schemas = []
+    for year, name in conn.execute("SELECT year, path FROM partitions ORDER BY year").fetchall():
+        path = os.path.join(os.path.dirname(main_path), name)
+        if not os.path.exists(path):
+            logger.warning(f"Archive shard for {year} not found: {path}")
+            continue
+        schema = f"migration_shard_{year}"
+        conn.execute("ATTACH DATABASE ? AS " + schema, (path,))
+        schemas.append(schema)
+    return schemas
+
+
+@migration(8, 'metrics')
+def _metrics(conn: sqlite3.Connection, batch_size: int) -> None:
+    """
+    Metrics shared by every backend process (see utils/metrics.py)
+
+    Timings hold a latency histogram, counters a count and stage rows a
+    row count and the seconds spent on them.
+    """
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS metrics (
+            kind TEXT NOT NULL,
+            name TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            total REAL NOT NULL DEFAULT 0,
+            min REAL,
+            max REAL,
+            buckets TEXT,
+            since TEXT,
+            PRIMARY KEY (kind, name)
+        );
+
+        CREATE TABLE IF NOT EXISTS metric_profiles (
+            id INTEGER PRIMARY KEY,
+            method TEXT NOT NULL,
+            mode TEXT NOT NULL,
+            captured_at TEXT,
+            report TEXT
+        );
+    """)
+
+
+@migration(9, 'jobs')
+def _jobs(conn: sqlite3.Connection, batch_size: int) -> None:
+    """
+    Import jobs and their progress (see jobs/manager.py)
+
+    Jobs run in a worker process, so their state is shared through the
+    database rather than kept in memory.
+    """
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            paths TEXT NOT NULL,
+            phase TEXT NOT NULL,
+            current_file TEXT,
+            files_done INTEGER NOT NULL DEFAULT 0,
+            rows_total INTEGER NOT NULL DEFAULT 0,
+            rows_done INTEGER NOT NULL DEFAULT 0,
+            pages_total INTEGER NOT NULL DEFAULT 0,
+            pages_done INTEGER NOT NULL DEFAULT 0,
+            errors TEXT NOT NULL DEFAULT '[]',
+            created_at TEXT,
+            started REAL,
+            finished REAL,
+            phase_started REAL,
+            phase_rows_start INTEGER NOT NULL DEFAULT 0,
+            heartbeat REAL,
+            cancel_requested INTEGER NOT NULL DEFAULT 0
+        );
+    """)
+
+
+@migration(10, 'merchant_categories_version')
+def _merchant_categories_version(conn: sqlite3.Connection, batch_size: int) -> None:
+    """
+    Version token for merchant_categories, replaced by triggers on every change
+
+    The nearest-merchant index is saved next to the database under this
+    token and reused until the labels change (see ml/similarity.py).
+    """
+    bump = f"""
+        UPDATE settings SET value = lower(hex(randomblob(8))), updated_at = CURRENT_TIMESTAMP
+        WHERE key = '{LABELS_VERSION_KEY}';
+    """
+    conn.executescript(f"""
+        CREATE TRIGGER IF NOT EXISTS merchant_categories_version_insert
+        AFTER INSERT ON merchant_categories
+        BEGIN {bump} END;
+
+        CREATE TRIGGER IF NOT EXISTS merchant_categories_version_update
+        AFTER UPDATE ON merchant_categories
+        WHEN NEW.category_id IS NOT OLD.category_id OR NEW.confidence IS NOT OLD.confidence
+        BEGIN {bump} END;
+
+        CREATE TRIGGER IF NOT EXISTS merchant_categories_version_delete
+        AFTER DELETE ON merchant_categories
+        BEGIN {bump} END;
+    """)
+    with conn:
+        set_setting(conn, LABELS_VERSION_KEY, secrets.token_hex(8))
+
+
+@migration(11, 'drop_metrics')
+def _drop_metrics(conn: sqlite3.Connection, batch_size: int) -> None:
+    """Metrics moved to a file next to the database (see utils/metrics.py)"""
+    conn.executescript("""
+        DROP TABLE IF EXISTS metrics;
+        DROP TABLE IF EXISTS metric_profiles;
+    """)
@@ -0,0 +1,446 @@
+"""Online snapshots of the database using the SQLite backup API"""
+
+import gzip
+import hashlib
+import json
+import os
+import secrets
+import shutil
+import sqlite3
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import logging
+
+from database.migrations import get_setting, latest_version, schema_version, set_setting
+
+logger = logging.getLogger(__name__)
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MANIFEST_NAME = 'manifest.json'
+CHANGES_NAME = 'changes.jsonl'
+
+# Pages copied per backup step; locks are released between steps so
+# other connections keep reading and writing during a snapshot
+SNAPSHOT_PAGES = 1024
+
+# Pause between backup steps, in seconds
+STEP_SLEEP = 0.001
+
+# Settings key holding the most recent snapshot created or restored
+LAST_SNAPSHOT_KEY = 'snapshot.last'
+
+COMPRESSIONS = {None: '', 'gzip': '.gz', 'zstd': '.zst'}
+
+# Tables whose row changes are logged for incremental snapshots, with
+# their primary key column
+CHANGE_TRACKED_TABLES = {
+    'transactions': 'id',
+    'merchants': 'id',
+    'categories': 'id',
+    'merchant_stats': 'merchant_id',
+    'anomalies': 'id',
+    'merchant_categories': 'merchant_id',
+    'partitions': 'year',
+    'settings': 'key',
+}
+
+_CHUNK = 1024 * 1024
+
+
+def _check_compression(compression: Optional[str]) -> None:
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unknown compression: {compression}")
+    if compression == 'zstd' and zstandard is None:
+        raise ImportError("zstandard not installed. Install with: pip install zstandard")
+
+
+def _open_write(path: str, compression: Optional[str]):
+    if compression == 'gzip':
+        return gzip.open(path, 'wb', compresslevel=6)
+    if compression == 'zstd':
+        return zstandard.ZstdCompressor(level=3).stream_writer(open(path, 'wb'), closefd=True)
+    return open(path, 'wb')
+
+
+def _open_read(path: str, compression: Optional[str]):
+    if compression == 'gzip':
+        return gzip.open(path, 'rb')
+    if compression == 'zstd':
+        _check_compression(compression)
+        return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+    return open(path, 'rb')
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _store(source: str, directory: str, name: str, compression: Optional[str],
+           role: str, **extra) -> Dict[str, Any]:
+    """Stream a file into the snapshot directory, compressing it if asked"""
+    stored = name + COMPRESSIONS[compression]
+    with open(source, 'rb') as src, _open_write(os.path.join(directory, stored), compression) as dst:
+        shutil.copyfileobj(src, dst, _CHUNK)
+    return _file_entry(directory, stored, compression, role, **extra)
+
+
+def _file_entry(directory: str, name: str, compression: Optional[str],
+                role: str, **extra) -> Dict[str, Any]:
+    path = os.path.join(directory, name)
+    return {
+        'name': name,
+        'role': role,
+        'compression': compression,
+        'size': os.path.getsize(path),
+        'sha256': _sha256(path),
+        **extra,
+    }
+
+
+def _backup(source: sqlite3.Connection, target_path: str, pages: int) -> None:
+    """Copy a database page by page into a new file"""
+    target = sqlite3.connect(target_path)
+    try:
+        def progress(status, remaining, total):
+            logger.debug(f"Snapshot backup: {total - remaining}/{total} pages")
+        source.backup(target, pages=pages, progress=progress, sleep=STEP_SLEEP)
+    finally:
+        target.close()
+
+
+def _read_snapshot_connection(db) -> sqlite3.Connection:
+    """
+    Connection pinned to one consistent view of the database
+
+    With WAL, holding a read transaction lets the paged backup see a single
+    point in time while other connections keep committing.
+    """
+    if db.db_path == ':memory:':
+        return db.conn
+    conn = sqlite3.connect(db.db_path)
+    conn.execute("BEGIN")
+    conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+    return conn
+
+
+def enable_change_log(conn: sqlite3.Connection) -> None:
+    """
+    Create the triggers that record changed rows in change_log
+
+    Logging only starts with the first snapshot, so databases that are
+    never backed up don't pay for it on every insert.
+    """
+    statements = []
+    for table, key in CHANGE_TRACKED_TABLES.items():
+        # Snapshot bookkeeping itself is not logged
+        new_filter = " WHEN NEW.key NOT LIKE 'snapshot.%'" if table == 'settings' else ""
+        old_filter = " WHEN OLD.key NOT LIKE 'snapshot.%'" if table == 'settings' else ""
+        statements.append(f"""
+            CREATE TRIGGER IF NOT EXISTS log_{table}_insert AFTER INSERT ON {table}{new_filter}
+            BEGIN
+                INSERT INTO change_log (table_name, row_key) VALUES ('{table}', NEW.{key});
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS log_{table}_update AFTER UPDATE ON {table}{new_filter}
+            BEGIN
+                INSERT INTO change_log (table_name, row_key) VALUES ('{table}', NEW.{key});
+                INSERT INTO change_log (table_name, row_key)
+                SELECT '{table}', OLD.{key} WHERE OLD.{key} IS NOT NEW.{key};
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS log_{table}_delete AFTER DELETE ON {table}{old_filter}
+            BEGIN
+                INSERT INTO change_log (table_name, row_key) VALUES ('{table}', OLD.{key});
+            END;
+        """)
+    conn.executescript('\n'.join(statements))
+
+
+def _changed_keys(conn: sqlite3.Connection, table: str, until: int) -> List[Any]:
+    """Primary keys of ``table`` logged up to ``until``"""
+    return [row[0] for row in conn.execute(
+        "SELECT DISTINCT row_key FROM change_log WHERE table_name = ? AND seq <= ?",
+        (table, until)
+    )]
+
+
+def _changed_rows(conn: sqlite3.Connection, until: int) -> Iterator[Dict[str, Any]]:
+    """Current row (or None when deleted) for every key logged up to ``until``"""
+    for table, key in CHANGE_TRACKED_TABLES.items():
+        keys = _changed_keys(conn, table, until)
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            placeholders = ', '.join('?' * len(chunk))
+            cursor = conn.execute(f"SELECT * FROM {table} WHERE {key} IN ({placeholders})", chunk)
+            columns = [column[0] for column in cursor.description]
+            key_index = columns.index(key)
+            rows = {row[key_index]: dict(zip(columns, row)) for row in cursor}
+            for row_key in chunk:
+                yield {'table': table, 'key': row_key, 'row': rows.get(row_key)}
+
+
+def create_snapshot(db, path: str, compression: Optional[str] = None,
+                    incremental: bool = False, pages: int = SNAPSHOT_PAGES) -> Dict[str, Any]:
+    """
+    Write a snapshot of the database (and its archive shards) to a new directory
+
+    A full snapshot stores the database file copied with the backup API.
+    An incremental snapshot stores only rows changed since the previous
+    snapshot (from change_log) and refers to that snapshot as its parent.
+    Every file is listed with its sha256 in manifest.json.
+    """
+    _check_compression(compression)
+    if os.path.exists(path) and os.listdir(path):
+        raise ValueError(f"Snapshot directory is not empty: {path}")
+
+    parent = None
+    if incremental:
+        last = get_setting(db.conn, LAST_SNAPSHOT_KEY)
+        parent = json.loads(last) if last else None
+        if parent is None or not os.path.exists(os.path.join(parent['path'], MANIFEST_NAME)):
+            raise ValueError("Incremental snapshot needs a previous snapshot; create a full one first")
+        if parent['schema_version'] != schema_version(db.conn):
+            raise ValueError("Schema changed since the last snapshot; create a full one first")
+
+    # Log changes from before the snapshot's read transaction starts, so
+    # nothing committed meanwhile is missed by the next incremental
+    enable_change_log(db.conn)
+    os.makedirs(path, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(db.db_path))[0] if db.db_path != ':memory:' else 'memory'
+    manifest: Dict[str, Any] = {
+        'id': f"snap_{datetime.now().strftime('%Y%m%d%H%M%S')}_{secrets.token_hex(4)}",
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'mode': 'incremental' if incremental else 'full',
+        'database': stem,
+        'parent': {'id': parent['id'], 'path': parent['path']} if parent else None,
+        'files': [],
+    }
+
+    source = _read_snapshot_connection(db)
+    try:
+        manifest['schema_version'] = schema_version(source)
+        seq = source.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log").fetchone()[0]
+        manifest['change_seq'] = seq
+
+        if incremental:
+            manifest['files'].append(_write_changes(source, path, seq, compression))
+            years = set(_changed_keys(source, 'partitions', seq))
+        else:
+            target = os.path.join(path, f".{stem}.db.tmp") if compression else os.path.join(path, f"{stem}.db")
+            _backup(source, target, pages)
+            if compression:
+                manifest['files'].append(_store(target, path, f"{stem}.db", compression, 'main'))
+                os.remove(target)
+            else:
+                manifest['files'].append(_file_entry(path, f"{stem}.db", None, 'main'))
+            years = None
+
+        # Archive shards are immutable once written, so they are copied as files
+        partitions = source.execute("SELECT year, path FROM partitions").fetchall()
+        for year, name in partitions:
+            if years is None or year in years:
+                manifest['files'].append(
+                    _store(db._shard_path(year, name), path, name, compression, 'shard', year=year)
+                )
+    finally:
+        if source is not db.conn:
+            source.rollback()
+            source.close()
+
+    with open(os.path.join(path, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    _record_snapshot(db, manifest, os.path.abspath(path), manifest['change_seq'])
+    logger.info(f"Created {manifest['mode']} snapshot {manifest['id']} in {path}")
+    return manifest
+
+
+def _write_changes(conn: sqlite3.Connection, directory: str, until: int,
+                   compression: Optional[str]) -> Dict[str, Any]:
+    name = CHANGES_NAME + COMPRESSIONS[compression]
+    count = 0
+    with _open_write(os.path.join(directory, name), compression) as f:
+        for change in _changed_rows(conn, until):
+            f.write(json.dumps(change, separators=(',', ':')).encode('utf-8') + b'\n')
+            count += 1
+    return _file_entry(directory, name, compression, 'changes', rows=count)
+
+
+def _record_snapshot(db, manifest: Dict[str, Any], path: str, seq: int) -> None:
+    """Remember the snapshot as the next parent and drop the log it covers"""
+    with db.conn:
+        set_setting(db.conn, LAST_SNAPSHOT_KEY, json.dumps({
+            'id': manifest['id'],
+            'path': path,
+            'schema_version': manifest['schema_version'],
+        }))
+        db.conn.execute("DELETE FROM change_log WHERE seq <= ?", (seq,))
+
+
+def load_manifest(path: str) -> Dict[str, Any]:
+    with open(os.path.join(path, MANIFEST_NAME)) as f:
+        return json.load(f)
+
+
+def _snapshot_chain(path: str) -> List[Tuple[str, Dict[str, Any]]]:
+    """(directory, manifest) pairs from the full snapshot up to ``path``"""
+    chain = []
+    while True:
+        manifest = load_manifest(path)
+        chain.append((path, manifest))
+        parent = manifest.get('parent')
+        if not parent:
+            break
+        path = parent['path']
+        if load_manifest(path)['id'] != parent['id']:
+            raise ValueError(f"Parent snapshot at {path} does not match {parent['id']}")
+    chain.reverse()
+    return chain
+
+
+def verify_snapshot(path: str) -> None:
+    """Check every file of a snapshot (and its parents) against the manifest"""
+    for directory, manifest in _snapshot_chain(path):
+        for entry in manifest['files']:
+            if _sha256(os.path.join(directory, entry['name'])) != entry['sha256']:
+                raise ValueError(f"Checksum mismatch for {entry['name']} in {directory}")
+
+
+def _extract(directory: str, entry: Dict[str, Any], target: str) -> None:
+    with _open_read(os.path.join(directory, entry['name']), entry['compression']) as src, \
+            open(target, 'wb') as dst:
+        shutil.copyfileobj(src, dst, _CHUNK)
+
+
+def _apply_changes(conn: sqlite3.Connection, directory: str, entry: Dict[str, Any]) -> None:
+    """Replay an incremental snapshot's rows; deletes first so unique names can move"""
+    with _open_read(os.path.join(directory, entry['name']), entry['compression']) as f:
+        changes = [json.loads(line) for line in f.read().splitlines() if line]
+
+    with conn:
+        for change in changes:
+            key = CHANGE_TRACKED_TABLES[change['table']]
+            conn.execute(f"DELETE FROM {change['table']} WHERE {key} = ?", (change['key'],))
+        for change in changes:
+            row = change['row']
+            if row is None:
+                continue
+            columns = ', '.join(row)
+            placeholders = ', '.join('?' * len(row))
+            conn.execute(
+                f"INSERT INTO {change['table']} ({columns}) VALUES ({placeholders})",
+                list(row.values())
+            )
+
+
+def restore_snapshot(db, path: str, pages: int = SNAPSHOT_PAGES) -> Dict[str, Any]:
+    """
+    Replace the database contents with a snapshot
+
+    The snapshot chain is verified and rebuilt, with its archive shards,
+    in a staging directory next to the database. There it is migrated to
+    the current schema and integrity-checked. Only then are the shards
+    moved into place and the database copied into the live connection with
+    the backup API, so the open connection stays valid. The replaced shards
+    are kept until the backup succeeds, so any failure leaves the live
+    database and its shards untouched.
+    """
+    path = os.path.abspath(path)
+    verify_snapshot(path)
+    chain = _snapshot_chain(path)
+    manifest = chain[-1][1]
+    _check_schema(chain)
+
+    base_dir, base = chain[0]
+    main_entry = next(entry for entry in base['files'] if entry['role'] == 'main')
+    work_dir = os.path.dirname(os.path.abspath(db.db_path)) if db.db_path != ':memory:' else path
+    stage_dir = os.path.join(work_dir, f".restore-{secrets.token_hex(4)}")
+    # Same file name as the live database, so default shard names match
+    name = os.path.basename(db.db_path) if db.db_path != ':memory:' else 'memory.db'
+    temp_path = os.path.join(stage_dir, name)
+
+    os.makedirs(stage_dir)
+    try:
+        _extract(base_dir, main_entry, temp_path)
+        shards: Dict[int, Tuple[str, Dict[str, Any]]] = {}
+        restored = sqlite3.connect(temp_path)
+        try:
+            for directory, snapshot in chain:
+                if snapshot['mode'] == 'incremental':
+                    changes = next(entry for entry in snapshot['files'] if entry['role'] == 'changes')
+                    _apply_changes(restored, directory, changes)
+                for entry in snapshot['files']:
+                    if entry['role'] == 'shard':
+                        shards[entry['year']] = (directory, entry)
+
+            with restored:
+                restored.execute("DELETE FROM change_log")
+            partitions = restored.execute("SELECT year, path FROM partitions").fetchall()
+        finally:
+            restored.close()
+
+        for year, shard_name in partitions:
+            if year not in shards:
+                raise ValueError(f"Snapshot is missing the archive shard for {year}")
+            directory, entry = shards[year]
+            _extract(directory, entry, os.path.join(stage_dir, shard_name))
+
+        # Opening the staged copy applies any pending migrations
+        staged = type(db)(temp_path)
+        try:
+            problems = [row[0] for row in staged.conn.execute("PRAGMA integrity_check")]
+            if problems != ['ok']:
+                raise ValueError(f"Restored database is corrupt: {problems[0]}")
+
+            db.close_shards()
+            # The live shards are kept aside until the backup has succeeded
+            moved = []
+            try:
+                for year, shard_name in partitions:
+                    target = db._shard_path(year, shard_name)
+                    previous = None
+                    if os.path.exists(target):
+                        previous = os.path.join(stage_dir, f"{shard_name}.previous")
+                        os.replace(target, previous)
+                    moved.append((target, previous))
+                    os.replace(os.path.join(stage_dir, shard_name), target)
+                staged.conn.backup(db.conn, pages=pages, sleep=STEP_SLEEP)
+            except BaseException:
+                for target, previous in reversed(moved):
+                    if previous is not None:
+                        os.replace(previous, target)
+                    elif os.path.exists(target):
+                        os.remove(target)
+                raise
+        finally:
+            staged.close_shards()
+            staged.conn.close()
+    finally:
+        shutil.rmtree(stage_dir, ignore_errors=True)
+
+    db.reset_caches()
+    enable_change_log(db.conn)
+    _record_snapshot(db, manifest, path, 0)
+    logger.info(f"Restored snapshot {manifest['id']} from {path}")
+    return manifest
+
+
+def _check_schema(chain: List[Tuple[str, Dict[str, Any]]]) -> None:
+    """Reject snapshots this version cannot read"""
+    versions = {snapshot['schema_version'] for _, snapshot in chain}
+    if len(versions) > 1:
+        raise ValueError("Snapshot chain spans a schema change")
+    version, = versions
+    if version > latest_version():
+        raise ValueError(
+            f"Snapshot schema version {version} is newer than supported ({latest_version()}); "
+            "upgrade the application first"
+        )
@@ -0,0 +1,396 @@
+"""Background import jobs with progress reporting and cancellation"""
+
+import json
+import os
+import secrets
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+import logging
+
+from database.manager import DatabaseManager
+from models.batch import TransactionBatch
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'worker.py')
+
+# Rows committed per database transaction; each committed batch is
+# immediately visible to readers on other connections
+DEFAULT_BATCH_SIZE = 5000
+
+# Finished jobs kept for get_job() before the oldest are dropped
+MAX_FINISHED_JOBS = 50
+
+FINISHED_PHASES = ('completed', 'failed', 'cancelled')
+
+# Page progress is written at most this often; phase changes and saved
+# batches are always written
+PROGRESS_INTERVAL = 0.25
+
+# Workers touch their job this often while they run. An unfinished job
+# not touched for STALE_AFTER seconds belongs to a worker that has died.
+HEARTBEAT_INTERVAL = 2.0
+STALE_AFTER = 30.0
+
+JOB_COLUMNS = (
+    'id', 'paths', 'phase', 'current_file', 'files_done', 'rows_total', 'rows_done',
+    'pages_total', 'pages_done', 'errors', 'created_at', 'started', 'finished',
+    'phase_started', 'phase_rows_start', 'heartbeat'
+)
+
+
+class JobCancelled(Exception):
+    """Raised inside a worker when its job has been cancelled"""
+
+
+class ImportJob:
+    """State of a single import job, as stored in the jobs table"""
+
+    def __init__(self, paths: List[str], job_id: Optional[str] = None):
+        self.id = job_id or f"job_{secrets.token_hex(8)}"
+        self.paths = list(paths)
+        self.phase = 'queued'
+        self.current_file: Optional[str] = None
+        self.files_done = 0
+        self.rows_total = 0
+        self.rows_done = 0
+        self.pages_total = 0
+        self.pages_done = 0
+        self.errors: List[Dict[str, str]] = []
+        self.created_at = datetime.now().isoformat(timespec='seconds')
+        # Wall-clock times, since workers run in other processes
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.phase_started: Optional[float] = None
+        self.phase_rows_start = 0
+        self.heartbeat = time.time()
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row) -> 'ImportJob':
+        job = cls(json.loads(row['paths']), row['id'])
+        for column in JOB_COLUMNS[2:]:
+            setattr(job, column, row[column])
+        job.errors = json.loads(row['errors'])
+        return job
+
+    def to_row(self) -> tuple:
+        values = {column: getattr(self, column) for column in JOB_COLUMNS}
+        values['paths'] = json.dumps(self.paths)
+        values['errors'] = json.dumps(self.errors)
+        return tuple(values[column] for column in JOB_COLUMNS)
+
+    def set_phase(self, phase: str) -> None:
+        self.phase = phase
+        self.phase_started = time.time()
+        self.phase_rows_start = self.rows_done
+        if phase in FINISHED_PHASES:
+            self.finished = self.phase_started
+
+    def _eta_seconds(self, now: float) -> Optional[float]:
+        """Estimate time left in the current phase from its progress rate"""
+        if self.phase == 'saving':
+            done = self.rows_done - self.phase_rows_start
+            total = self.rows_total - self.phase_rows_start
+        elif self.phase == 'parsing' and self.pages_total:
+            done, total = self.pages_done, self.pages_total
+        else:
+            return None
+
+        elapsed = now - (self.phase_started or now)
+        if done <= 0 or elapsed <= 0 or total < done:
+            return None
+        return round((total - done) * elapsed / done, 1)
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = time.time()
+        end = self.finished or now
+        return {
+            'id': self.id,
+            'phase': self.phase,
+            'paths': self.paths,
+            'current_file': self.current_file,
+            'files_done': self.files_done,
+            'files_total': len(self.paths),
+            'rows_done': self.rows_done,
+            'rows_total': self.rows_total,
+            'pages_done': self.pages_done,
+            'pages_total': self.pages_total,
+            'eta_seconds': self._eta_seconds(now) if self.phase not in FINISHED_PHASES else None,
+            'elapsed_seconds': round(end - self.started, 3) if self.started else 0.0,
+            'errors': list(self.errors),
+            'created_at': self.created_at,
+        }
+
+
+class JobStore:
+    """Reads and writes job rows through a database connection"""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def create(self, job: ImportJob) -> None:
+        placeholders = ', '.join('?' * len(JOB_COLUMNS))
+        with self.conn:
+            self.conn.execute(
+                f"INSERT INTO jobs ({', '.join(JOB_COLUMNS)}) VALUES ({placeholders})",
+                job.to_row()
+            )
+            # Drop the oldest finished jobs
+            self.conn.execute(f"""
+                DELETE FROM jobs WHERE id IN (
+                    SELECT id FROM jobs WHERE phase IN {FINISHED_PHASES}
+                    ORDER BY created_at DESC, rowid DESC LIMIT -1 OFFSET ?
+                )
+            """, (MAX_FINISHED_JOBS,))
+
+    def save(self, job: ImportJob) -> None:
+        job.heartbeat = time.time()
+        assignments = ', '.join(f"{column} = ?" for column in JOB_COLUMNS[1:])
+        with self.conn:
+            self.conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?",
+                              job.to_row()[1:] + (job.id,))
+
+    def load(self, job_id: str) -> Optional[ImportJob]:
+        row = self.conn.execute(
+            f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        return self._expire(ImportJob.from_row(row)) if row else None
+
+    def load_all(self) -> List[ImportJob]:
+        rows = self.conn.execute(
+            f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs ORDER BY created_at, rowid"
+        ).fetchall()
+        return [self._expire(ImportJob.from_row(row)) for row in rows]
+
+    def request_cancel(self, job_id: str) -> bool:
+        with self.conn:
+            cursor = self.conn.execute(
+                f"UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND phase NOT IN {FINISHED_PHASES}",
+                (job_id,)
+            )
+        return cursor.rowcount > 0
+
+    def cancel_requested(self, job_id: str) -> bool:
+        row = self.conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def _expire(self, job: ImportJob) -> ImportJob:
+        """Mark an unfinished job whose worker stopped responding as failed"""
+        if job.phase not in FINISHED_PHASES and time.time() - job.heartbeat > STALE_AFTER:
+            logger.warning(f"Import job {job.id} worker stopped responding")
+            job.errors.append({'path': job.current_file, 'error': 'Import worker stopped'})
+            job.current_file = None
+            job.set_phase('failed')
+            self.save(job)
+        return job
+
+
+class JobManager:
+    """
+    Runs parse -> categorize -> save pipelines outside the calling process
+
+    The bridge starts a new interpreter for every call, so job state lives
+    in the jobs table: start_import() records the job and launches a
+    detached worker (``jobs/worker.py``) that writes its progress
+    there, and get_job()/cancel_job() only read or flag that row. With
+    detach=False the worker runs on a thread of this process instead.
+    """
+
+    def __init__(self, db_path: str, parsers: Dict[str, Any], categorizer,
+                 batch_size: int = DEFAULT_BATCH_SIZE, detach: bool = True):
+        self.db_path = db_path
+        self.parsers = parsers
+        self.categorizer = categorizer
+        self.batch_size = batch_size
+        self.detach = detach
+        self._db: Optional[DatabaseManager] = None
+        self._threads: List[threading.Thread] = []
+
+    @property
+    def store(self) -> JobStore:
+        # Opened on first use, so API calls that never touch jobs skip it
+        if self._db is None:
+            self._db = DatabaseManager(self.db_path)
+        return JobStore(self._db.conn)
+
+    def start_import(self, paths: List[str]) -> str:
+        """Queue an import of one or more statement files"""
+        if isinstance(paths, str):
+            paths = [paths]
+        if not paths:
+            raise ValueError("No files to import")
+        for path in paths:
+            self._parser_for(path)
+
+        job = ImportJob(paths)
+        self.store.create(job)
+        if self.detach:
+            self._spawn(job.id)
+        else:
+            thread = threading.Thread(target=self.run_job, args=(job.id,),
+                                      name=f"import-{job.id}", daemon=True)
+            self._threads.append(thread)
+            thread.start()
+        return job.id
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self.store.load(job_id)
+        return job.snapshot() if job else None
+
+    def list_jobs(self) -> List[Dict[str, Any]]:
+        return [job.snapshot() for job in self.store.load_all()]
+
+    def cancel_job(self, job_id: str) -> bool:
+        """
+        Request cancellation; returns False for unknown or finished jobs
+
+        Batches already committed stay in the database.
+        """
+        return self.store.request_cancel(job_id)
+
+    def active_jobs(self) -> List[str]:
+        return [job.id for job in self.store.load_all() if job.phase not in FINISHED_PHASES]
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Cancel running jobs and wait for this process's worker threads"""
+        for job_id in self.active_jobs():
+            self.cancel_job(job_id)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+        self._threads = []
+
+    def _spawn(self, job_id: str) -> None:
+        """Start a worker process that outlives this one"""
+        kwargs: Dict[str, Any] = {}
+        if sys.platform == 'win32':
+            kwargs['creationflags'] = (subprocess.DETACHED_PROCESS
+                                       | subprocess.CREATE_NEW_PROCESS_GROUP)
+        else:
+            kwargs['start_new_session'] = True
+        # No inherited pipes, or the bridge would wait for the worker's output
+        subprocess.Popen(
+            [sys.executable, WORKER_SCRIPT, self.db_path, job_id],
+            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL, close_fds=True, **kwargs
+        )
+
+    def _parser_for(self, path: str):
+        ext = os.path.splitext(path)[1].lower().lstrip('.')
+        parser = self.parsers.get(ext)
+        if parser is None:
+            raise ValueError(f"Unsupported file type: {path}")
+        return parser
+
+    def run_job(self, job_id: str) -> None:
+        """Run a queued job to completion in this thread"""
+        # Workers use their own connections, so imports never block reads
+        # made through the API's connection
+        db = DatabaseManager(self.db_path)
+        store = JobStore(db.conn)
+        job = store.load(job_id)
+        if job is None or job.phase != 'queued':
+            logger.warning(f"Import job {job_id} is not queued")
+            db.conn.close()
+            return
+
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(job_id, stop), daemon=True)
+        heartbeat.start()
+        job.started = time.time()
+        try:
+            self._check_cancelled(store, job)
+            for path in job.paths:
+                job.current_file = path
+                try:
+                    self._import_file(job, store, db, path)
+                except JobCancelled:
+                    raise
+                except Exception as e:
+                    logger.error(f"Import job {job.id} failed on {path}: {e}")
+                    job.errors.append({'path': path, 'error': str(e)})
+                job.files_done += 1
+
+            failed = job.errors and job.rows_done == 0
+            job.current_file = None
+            job.set_phase('failed' if failed else 'completed')
+        except JobCancelled:
+            logger.info(f"Import job {job.id} cancelled after {job.rows_done} rows")
+            job.current_file = None
+            job.set_phase('cancelled')
+        except Exception as e:
+            logger.error(f"Import job {job.id} failed: {e}")
+            job.errors.append({'path': job.current_file, 'error': str(e)})
+            job.current_file = None
+            job.set_phase('failed')
+        finally:
+            stop.set()
+            heartbeat.join()
+            store.save(job)
+            db.conn.close()
+            metrics.flush()
+
+    def _heartbeat(self, job_id: str, stop: threading.Event) -> None:
+        """Touch the job while it runs, including during long parses"""
+        conn = sqlite3.connect(self.db_path, timeout=HEARTBEAT_INTERVAL)
+        try:
+            while not stop.wait(HEARTBEAT_INTERVAL):
+                try:
+                    with conn:
+                        conn.execute("UPDATE jobs SET heartbeat = ? WHERE id = ?",
+                                     (time.time(), job_id))
+                except sqlite3.Error as e:
+                    logger.warning(f"Import job {job_id} heartbeat failed: {e}")
+        finally:
+            conn.close()
+
+    def _check_cancelled(self, store: JobStore, job: ImportJob) -> None:
+        if store.cancel_requested(job.id):
+            raise JobCancelled()
+
+    def _import_file(self, job: ImportJob, store: JobStore, db: DatabaseManager, path: str) -> None:
+        parser = self._parser_for(path)
+        last_saved = time.monotonic()
+
+        def on_page(done: int, total: int) -> None:
+            nonlocal last_saved
+            job.pages_done, job.pages_total = done, total
+            if time.monotonic() - last_saved >= PROGRESS_INTERVAL:
+                store.save(job)
+                last_saved = time.monotonic()
+            self._check_cancelled(store, job)
+
+        job.set_phase('parsing')
+        job.pages_done = job.pages_total = 0
+        store.save(job)
+        with metrics.span('parse') as span:
+            if path.lower().endswith('.pdf'):
+                batch: TransactionBatch = parser.parse_batch(path, progress=on_page)
+            else:
+                batch = parser.parse_batch(path)
+            span['rows'] = len(batch)
+        job.rows_total += len(batch)
+        self._check_cancelled(store, job)
+
+        job.set_phase('categorizing')
+        store.save(job)
+        with metrics.span('categorize', len(batch)):
+            self.categorizer.categorize_batch(batch)
+        self._check_cancelled(store, job)
+
+        job.set_phase('saving')
+        store.save(job)
+        for start in range(0, len(batch), self.batch_size):
+            self._check_cancelled(store, job)
+            chunk = batch.slice(start, start + self.batch_size)
+            with metrics.span('insert', len(chunk)):
+                db.save_batch(chunk)
+            self.categorizer.learn(chunk)
+            job.rows_done += len(chunk)
+            store.save(job)
@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+"""
+Worker process for a single import job
+
+Started detached by JobManager.start_import(); runs the job and records
+its progress in the jobs table of the given database.
+
+Usage:
+    python jobs/worker.py <db_path> <job_id>
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import BankAnalyzerAPI
+
+
+def main(argv) -> int:
+    if len(argv) != 2:
+        print(__doc__, file=sys.stderr)
+        return 2
+    db_path, job_id = argv
+    api = BankAnalyzerAPI(db_path)
+    api.jobs.run_job(job_id)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
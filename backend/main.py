@@ -3,10 +3,16 @@ Main entry point for the Bank Analyzer backend
 """
 
 from database.manager import DatabaseManager
+from database import snapshot
 from parsers.csv_parser import CSVParser
 from parsers.pdf_parser import PDFParser
 from ml.categorizer import MLCategorizer
+from ml.similarity import MerchantIndex
+from jobs.manager import JobManager
+from models.batch import TransactionBatch, NO_DATE, iso_to_days
 from utils.auth import hash_password, verify_password, change_password
+from utils.serializer import check_wire_format, to_columnar
+from utils.metrics import metrics, instrumented
 from typing import Dict, Any, Optional, List
 import logging
 import csv
@@ -23,63 +29,128 @@ class BankAnalyzerAPI:
     
     def __init__(self, db_path: str = "bank_analyzer.db"):
         self.db = DatabaseManager(db_path)
+        # Every bridge call is a new process; metrics accumulate in a file next to the database
+        metrics.persist(db_path)
         self.pdf_parser = PDFParser()
         self.csv_parser = CSVParser()
-        self.ml = MLCategorizer()
+        # The nearest-merchant index is only built when a payee matches no rule
+        # and is saved next to the database, so later calls reuse it
+        index_path = None if db_path == ':memory:' else f"{db_path}.index"
+        self.ml = MLCategorizer(load_index=lambda: MerchantIndex.from_db(self.db.conn, index_path))
+        self.jobs = JobManager(
+            db_path,
+            {'csv': self.csv_parser, 'pdf': self.pdf_parser},
+            self.ml
+        )
     
+    @instrumented
     def parse_csv(self, file_path: str) -> Dict[str, Any]:
         """Parse CSV and return transactions"""
         try:
-            # Parse the file
-            transactions = self.csv_parser.parse(file_path)
-            
-            # Auto-categorize if needed
-            for txn in transactions:
-                if txn.get('category', 'Uncategorized') == 'Uncategorized':
-                    category, confidence = self.ml.categorize(txn)
-                    txn['category'] = category
-                    txn['confidence'] = confidence
-            
-            # Save to database
-            for txn in transactions:
-                self.db.save_transaction(txn)
-            
-            return {
-                'success': True,
-                'transactions': transactions,
-                'count': len(transactions)
-            }
+            with metrics.span('parse') as span:
+                batch = self.csv_parser.parse_batch(file_path)
+                span['rows'] = len(batch)
+            return self._import_batch(batch)
         except Exception as e:
             logger.error(f"CSV parsing error: {e}")
             return {'success': False, 'error': str(e)}
     
+    @instrumented
     def parse_pdf(self, file_path: str) -> Dict[str, Any]:
         """Parse PDF and return transactions"""
         try:
-            transactions = self.pdf_parser.parse(file_path)
-            
-            for txn in transactions:
-                if txn.get('category', 'Uncategorized') == 'Uncategorized':
-                    category, confidence = self.ml.categorize(txn)
-                    txn['category'] = category
-                    txn['confidence'] = confidence
-            
-            for txn in transactions:
-                self.db.save_transaction(txn)
-            
+            with metrics.span('parse') as span:
+                batch = self.pdf_parser.parse_batch(file_path)
+                span['rows'] = len(batch)
+            return self._import_batch(batch)
+        except Exception as e:
+            logger.error(f"PDF parsing error: {e}")
+            return {'success': False, 'error': str(e)}
+    
+    def _import_batch(self, batch: TransactionBatch) -> Dict[str, Any]:
+        """Categorize and save a parsed batch"""
+        # Auto-categorize anything the statement didn't label
+        with metrics.span('categorize', len(batch)):
+            self.ml.categorize_batch(batch)
+        
+        # Save to database
+        with metrics.span('insert', len(batch)):
+            self.db.save_batch(batch)
+        self.ml.learn(batch)
+        
+        return {
+            'success': True,
+            'transactions': batch.to_dicts(),
+            'count': len(batch)
+        }
+    
+    @instrumented
+    def start_import(self, paths: List[str]) -> Dict[str, Any]:
+        """Start a background import of one or more CSV/PDF files"""
+        try:
+            job_id = self.jobs.start_import(paths)
             return {
                 'success': True,
-                'transactions': transactions,
-                'count': len(transactions)
+                'job_id': job_id
             }
         except Exception as e:
-            logger.error(f"PDF parsing error: {e}")
+            logger.error(f"Start import error: {e}")
             return {'success': False, 'error': str(e)}
     
-    def get_transactions(self, filters: Optional[Dict] = None) -> Dict[str, Any]:
-        """Get transactions from database"""
+    @instrumented
+    def get_job(self, job_id: str) -> Dict[str, Any]:
+        """Get phase, progress, ETA and errors of an import job"""
         try:
-            transactions = self.db.get_transactions(filters)
+            job = self.jobs.get_job(job_id)
+            if job is None:
+                return {'success': False, 'error': f"Unknown job: {job_id}"}
+            return {
+                'success': True,
+                'job': job
+            }
+        except Exception as e:
+            logger.error(f"Get job error: {e}")
+            return {'success': False, 'error': str(e)}
+    
+    @instrumented
+    def cancel_job(self, job_id: str) -> Dict[str, Any]:
+        """Cancel an import job; batches already saved are kept"""
+        try:
+            if not self.jobs.cancel_job(job_id):
+                return {'success': False, 'error': f"Job not running: {job_id}"}
+            return {
+                'success': True,
+                'message': 'Cancellation requested'
+            }
+        except Exception as e:
+            logger.error(f"Cancel job error: {e}")
+            return {'success': False, 'error': str(e)}
+    
+    @instrumented
+    def get_transactions(self, filters: Optional[Dict] = None,
+                         wire_format: str = 'rows') -> Dict[str, Any]:
+        """
+        Get transactions from database
+        
+        wire_format='columnar' returns column arrays instead of one object
+        per transaction, with categories dictionary-encoded.
+        """
+        try:
+            check_wire_format(wire_format)
+            if wire_format == 'columnar':
+                with metrics.span('query') as span:
+                    batch = self.db.get_transactions_batch(filters)
+                    span['rows'] = len(batch)
+                return {
+                    'success': True,
+                    'format': 'columnar',
+                    'transactions': batch.to_columns(),
+                    'total': len(batch)
+                }
+            
+            with metrics.span('query') as span:
+                transactions = self.db.get_transactions(filters)
+                span['rows'] = len(transactions)
             return {
                 'success': True,
                 'transactions': transactions,
@@ -90,6 +161,7 @@ class BankAnalyzerAPI:
             return {'success': False, 'error': str(e)}
         
 
+    @instrumented
     def update_transaction(self, transaction_id: str, updates: Dict[str, Any]) -> Dict[str, Any]:
         """Update a transaction (mainly for category updates)"""
         try:
@@ -99,6 +171,12 @@ class BankAnalyzerAPI:
             
             success = self.db.update_transaction(transaction_id, updates)
             
+            if success and 'category' in updates:
+                # Corrections teach the nearest-merchant index
+                transaction = self.db.get_transaction(transaction_id)
+                if transaction and transaction['merchant']:
+                    self.ml.train([transaction])
+            
             if success:
                 return {
                     'success': True,
@@ -113,12 +191,11 @@ class BankAnalyzerAPI:
             logger.error(f"Update transaction error: {e}")
             return {'success': False, 'error': str(e)}
     
+    @instrumented
     def delete_transaction(self, transaction_id: str) -> Dict[str, Any]:
         """Delete a transaction"""
         try:
-            query = "DELETE FROM transactions WHERE id = ?"
-            self.db.conn.execute(query, (transaction_id,))
-            self.db.conn.commit()
+            self.db.delete_transaction(transaction_id)
             
             return {
                 'success': True,
@@ -129,34 +206,40 @@ class BankAnalyzerAPI:
             return {'success': False, 'error': str(e)}
 
     
+    @instrumented
     def get_spending_summary(self, start_date: str, end_date: str) -> Dict[str, Any]:
         """Calculate spending analytics"""
         try:
-            transactions = self.db.get_transactions({
-                'start_date': start_date,
-                'end_date': end_date
-            })
+            with metrics.span('query') as span:
+                batch = self.db.get_transactions_batch({
+                    'start_date': start_date,
+                    'end_date': end_date
+                })
+                span['rows'] = len(batch)
             
-            # Calculate summary
-            total_spending = sum(abs(t['amount']) for t in transactions if t['amount'] < 0)
-            total_income = sum(t['amount'] for t in transactions if t['amount'] > 0)
+            # Calculate summary in integer cents
+            totals = batch.total_cents()
+            total_spending = totals['spending']
+            total_income = totals['income']
             
-            # Category breakdown
+            # Category breakdown, keyed by category code
             categories = {}
-            for t in transactions:
-                if t['amount'] < 0:
-                    cat = t['category']
-                    categories[cat] = categories.get(cat, 0) + abs(t['amount'])
+            for code, cents in zip(batch.category_codes, batch.amounts):
+                if cents < 0:
+                    categories[code] = categories.get(code, 0) - cents
             
-            top_category = max(categories.items(), key=lambda x: x[1])[0] if categories else None
+            top_category = (
+                batch.categories[max(categories.items(), key=lambda x: x[1])[0]]
+                if categories else None
+            )
             
             return {
                 'success': True,
                 'summary': {
-                    'totalSpending': total_spending,
-                    'totalIncome': total_income,
-                    'netCashFlow': total_income - total_spending,
-                    'transactionCount': len(transactions),
+                    'totalSpending': total_spending / 100,
+                    'totalIncome': total_income / 100,
+                    'netCashFlow': (total_income - total_spending) / 100,
+                    'transactionCount': len(batch),
                     'topCategory': top_category
                 }
             }
@@ -164,6 +247,7 @@ class BankAnalyzerAPI:
             logger.error(f"Get spending summary error: {e}")
             return {'success': False, 'error': str(e)}
         
+    @instrumented
     def get_categories(self) -> Dict[str, Any]:
         """Get all available categories"""
         try:
@@ -176,10 +260,14 @@ class BankAnalyzerAPI:
             logger.error(f"Get categories error: {e}")
             return {'success': False, 'error': str(e)}
     
-    def get_category_breakdown(self, start_date: str, end_date: str) -> Dict[str, Any]:
+    @instrumented
+    def get_category_breakdown(self, start_date: str, end_date: str,
+                               wire_format: str = 'rows') -> Dict[str, Any]:
         """Get spending breakdown by category"""
         try:
-            category_spending = self.db.get_category_spending(start_date, end_date)
+            check_wire_format(wire_format)
+            with metrics.span('query'):
+                category_spending = self.db.get_category_spending(start_date, end_date)
             
             # Format for frontend
             categories = [
@@ -187,6 +275,13 @@ class BankAnalyzerAPI:
                 for cat, amount in category_spending.items()
             ]
             
+            if wire_format == 'columnar':
+                return {
+                    'success': True,
+                    'format': 'columnar',
+                    'categories': to_columnar(categories)
+                }
+            
             return {
                 'success': True,
                 'categories': categories
@@ -195,6 +290,128 @@ class BankAnalyzerAPI:
             logger.error(f"Get category breakdown error: {e}")
             return {'success': False, 'error': str(e)}
 
+    
+    @instrumented
+    def get_recurring(self) -> Dict[str, Any]:
+        """Get subscriptions and other recurring charges"""
+        try:
+            with metrics.span('query'):
+                recurring = self.db.recurring.get_recurring()
+            return {
+                'success': True,
+                'recurring': recurring
+            }
+        except Exception as e:
+            logger.error(f"Get recurring error: {e}")
+            return {'success': False, 'error': str(e)}
+    
+    @instrumented
+    def get_anomalies(self, start_date: Optional[str] = None, limit: int = 100) -> Dict[str, Any]:
+        """Get new, missed and price-changed subscriptions and unusual charges"""
+        try:
+            start = iso_to_days(start_date) if start_date else None
+            if start == NO_DATE:
+                raise ValueError(f"Invalid start date: {start_date}")
+            with metrics.span('query'):
+                anomalies = self.db.recurring.get_anomalies(start, limit)
+            return {
+                'success': True,
+                'anomalies': anomalies
+            }
+        except Exception as e:
+            logger.error(f"Get anomalies error: {e}")
+            return {'success': False, 'error': str(e)}
+    
+    @instrumented
+    def create_snapshot(self, path: str, compression: Optional[str] = None,
+                        incremental: bool = False) -> Dict[str, Any]:
+        """
+        Back up the database into a new snapshot directory
+        
+        Args:
+            path: Directory to create (must be empty or missing)
+            compression: None, 'gzip' or 'zstd'
+            incremental: Store only rows changed since the last snapshot
+        """
+        try:
+            with metrics.span('snapshot'):
+                manifest = snapshot.create_snapshot(self.db, path, compression, incremental)
+            return {
+                'success': True,
+                'snapshot': manifest
+            }
+        except Exception as e:
+            logger.error(f"Create snapshot error: {e}")
+            return {'success': False, 'error': str(e)}
+    
+    @instrumented
+    def restore_snapshot(self, path: str) -> Dict[str, Any]:
+        """Replace the database with a snapshot (full or incremental)"""
+        try:
+            if self.jobs.active_jobs():
+                raise ValueError("Cannot restore while imports are running")
+            with metrics.span('restore'):
+                manifest = snapshot.restore_snapshot(self.db, path)
+            self.ml.reset_index()
+            return {
+                'success': True,
+                'snapshot': manifest
+            }
+        except Exception as e:
+            logger.error(f"Restore snapshot error: {e}")
+            return {'success': False, 'error': str(e)}
+    
+    @instrumented
+    def archive_closed_years(self, keep_years: int = 1) -> Dict[str, Any]:
+        """
+        Move closed years into read-only per-year archive databases
+        
+        Queries attach an archive only when their date range reaches it.
+        """
+        try:
+            archived = self.db.archive_closed_years(keep_years)
+            return {
+                'success': True,
+                'archived': archived,
+                'partitions': self.db.get_partitions()
+            }
+        except Exception as e:
+            logger.error(f"Archive error: {e}")
+            return {'success': False, 'error': str(e)}
+    
+    @instrumented
+    def get_partitions(self) -> Dict[str, Any]:
+        """List archived years"""
+        try:
+            return {
+                'success': True,
+                'partitions': self.db.get_partitions()
+            }
+        except Exception as e:
+            logger.error(f"Get partitions error: {e}")
+            return {'success': False, 'error': str(e)}
+
+    
+    def get_metrics(self, reset: bool = False) -> Dict[str, Any]:
+        """
+        Get timing histograms, stage throughput, SQL statement counts and
+        any captured profiles
+        
+        Pass profile='cpu' or profile='memory' to any other API method to
+        capture a profile of that call.
+        """
+        try:
+            report = metrics.snapshot()
+            if reset:
+                metrics.reset()
+            return {
+                'success': True,
+                'metrics': report
+            }
+        except Exception as e:
+            logger.error(f"Get metrics error: {e}")
+            return {'success': False, 'error': str(e)}
+
 
 if __name__ == "__main__":
     # Test the API
@@ -1,13 +1,24 @@
 """Machine learning transaction categorizer"""
 
-from typing import Tuple, Dict, Any, List
+from typing import Tuple, Dict, Any, List, Optional, Callable
 import logging
 
+from ml.similarity import MerchantIndex, MIN_LABEL_CONFIDENCE
+from models.batch import TransactionBatch, UNCATEGORIZED
+from utils.helpers import extract_merchant_name
+
 logger = logging.getLogger(__name__)
 
 
 class MLCategorizer:
-    def __init__(self):
+    def __init__(self, index: Optional[MerchantIndex] = None,
+                 load_index: Optional[Callable[[], MerchantIndex]] = None):
+        # Previously categorized merchants, for payees no rule matches.
+        # load_index builds it on first use, which takes seconds for a large
+        # history, so calls that never need it don't pay for it
+        self._index = index
+        self._load_index = load_index
+        
         # Rule-based categorization for common merchants
         self.rules = {
             # AI/Tech Services
@@ -47,6 +58,22 @@ class MLCategorizer:
             'lyft': 'Transportation'
         }
     
+    @property
+    def index(self) -> MerchantIndex:
+        if self._index is None:
+            self._index = self._load_index() if self._load_index else MerchantIndex()
+        return self._index
+    
+    def reset_index(self) -> None:
+        """Drop the index so it is loaded again on next use"""
+        if self._load_index is not None:
+            self._index = None
+    
+    def _index_loaded(self) -> bool:
+        # Labels are also saved in merchant_categories, so an index that
+        # has not been loaded yet picks them up when it is
+        return self._index is not None or self._load_index is None
+    
     def categorize(self, transaction: Dict[str, Any]) -> Tuple[str, float]:
         """
         Categorize a transaction
@@ -61,6 +88,12 @@ class MLCategorizer:
             if keyword in combined:
                 return category, 0.9  # High confidence for rule match
         
+        # Fall back to the most similar known merchants
+        if transaction.get('merchant'):
+            predicted = self.index.predict(extract_merchant_name(transaction['merchant']))
+            if predicted:
+                return predicted
+        
         # Check for income (positive amounts)
         if transaction.get('amount', 0) > 0:
             return 'Income', 0.8
@@ -68,8 +101,58 @@ class MLCategorizer:
         # Default
         return 'Uncategorized', 0.0
     
+    def categorize_batch(self, batch: TransactionBatch) -> int:
+        """
+        Categorize every uncategorized row of a batch in place
+        Returns: number of rows that were categorized
+        
+        Results are memoized per (merchant, description, is_income) so
+        recurring payees only go through the rule scan once per batch.
+        """
+        uncategorized = batch.category_code(UNCATEGORIZED)
+        memo: Dict[Tuple[str, str, bool], Tuple[int, float]] = {}
+        codes = batch.category_codes
+        confidences = batch.confidences
+        categorized = 0
+        
+        for i, code in enumerate(codes):
+            if code != uncategorized:
+                continue
+            
+            key = (batch.merchants[i], batch.descriptions[i], batch.amounts[i] > 0)
+            result = memo.get(key)
+            if result is None:
+                category, confidence = self.categorize(batch[i])
+                result = (batch.category_code(category), confidence)
+                memo[key] = result
+            
+            codes[i], confidences[i] = result
+            if result[0] != uncategorized:
+                categorized += 1
+        
+        return categorized
+    
+    def learn(self, batch: TransactionBatch) -> None:
+        """Add a saved batch's confidently categorized merchants to the index"""
+        if not self._index_loaded():
+            return
+        seen = set()
+        for merchant, code, confidence in zip(batch.merchants, batch.category_codes, batch.confidences):
+            if confidence < MIN_LABEL_CONFIDENCE:
+                continue
+            key = (merchant, code)
+            if key not in seen:
+                seen.add(key)
+                self.index.add(merchant, batch.categories[code], confidence)
+    
     def train(self, transactions: List[Dict[str, Any]]):
         """Train the model with user-corrected transactions"""
-        # Placeholder for future ML implementation
         logger.info(f"Training with {len(transactions)} transactions")
-        pass
+        if not self._index_loaded():
+            return
+        for transaction in transactions:
+            self.index.add(
+                extract_merchant_name(transaction['merchant']),
+                transaction['category'],
+                transaction.get('confidence', 1.0)
+            )
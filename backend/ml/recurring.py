@@ -0,0 +1,340 @@
+"""Incremental recurring-charge and anomaly detection"""
+
+import math
+import sqlite3
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+import logging
+
+from models.batch import days_to_iso
+
+logger = logging.getLogger(__name__)
+
+# (name, mean interval in days, tolerance in days)
+CADENCES = (
+    ('weekly', 7.0, 2.0),
+    ('biweekly', 14.0, 3.0),
+    ('monthly', 30.4, 4.0),
+    ('quarterly', 91.3, 10.0),
+    ('yearly', 365.25, 15.0),
+)
+
+# Charges needed before a merchant can count as recurring
+MIN_OCCURRENCES = 3
+
+# Recurring charges may vary by at most this coefficient of variation
+MAX_AMOUNT_CV = 0.3
+
+# Below this coefficient of variation a subscription has a fixed price,
+# so any change to it is reported as a price change
+FIXED_PRICE_CV = 0.02
+
+# A price change larger than this fraction is reported as an outlier
+MAX_PRICE_CHANGE = 0.5
+
+# Outliers must be this many standard deviations and this fraction of
+# the mean away from the merchant's average charge
+OUTLIER_Z = 3.0
+OUTLIER_MIN_RATIO = 0.25
+
+STATE_COLUMNS = (
+    'merchant_id', 'charge_count', 'first_date', 'last_date', 'last_cents',
+    'amount_mean', 'amount_m2', 'interval_count', 'interval_mean', 'interval_m2',
+    'recurring_flagged',
+)
+
+# One charge: (merchant_id, days since epoch, amount in cents, transaction id)
+Charge = Tuple[int, int, int, str]
+
+
+class MerchantStats:
+    """
+    Running statistics of one merchant's charges
+
+    Amount and interval mean/variance use Welford's online algorithm, so
+    each new charge is folded in without revisiting history.
+    """
+
+    __slots__ = STATE_COLUMNS
+
+    def __init__(self, merchant_id: int, charge_count: int = 0,
+                 first_date: Optional[int] = None, last_date: Optional[int] = None,
+                 last_cents: Optional[int] = None, amount_mean: float = 0.0,
+                 amount_m2: float = 0.0, interval_count: int = 0,
+                 interval_mean: float = 0.0, interval_m2: float = 0.0,
+                 recurring_flagged: int = 0):
+        self.merchant_id = merchant_id
+        self.charge_count = charge_count
+        self.first_date = first_date
+        self.last_date = last_date
+        self.last_cents = last_cents
+        self.amount_mean = amount_mean
+        self.amount_m2 = amount_m2
+        self.interval_count = interval_count
+        self.interval_mean = interval_mean
+        self.interval_m2 = interval_m2
+        self.recurring_flagged = recurring_flagged
+
+    @property
+    def amount_std(self) -> float:
+        if self.charge_count < 2:
+            return 0.0
+        return math.sqrt(self.amount_m2 / (self.charge_count - 1))
+
+    @property
+    def interval_std(self) -> float:
+        if self.interval_count < 2:
+            return 0.0
+        return math.sqrt(self.interval_m2 / (self.interval_count - 1))
+
+    def cadence(self) -> Optional[Tuple[str, float]]:
+        """(cadence name, tolerance) if the charges look recurring, else None"""
+        if self.charge_count < MIN_OCCURRENCES or self.interval_count < MIN_OCCURRENCES - 1:
+            return None
+        if self.amount_mean <= 0 or self.amount_std / self.amount_mean > MAX_AMOUNT_CV:
+            return None
+        for name, days, tolerance in CADENCES:
+            if abs(self.interval_mean - days) <= tolerance and self.interval_std <= tolerance:
+                return name, tolerance
+        return None
+
+    def next_expected(self) -> Optional[int]:
+        if self.last_date is None or not self.interval_count:
+            return None
+        return self.last_date + int(round(self.interval_mean))
+
+    def check(self, cents: int) -> Optional[Tuple[str, int]]:
+        """
+        Compare a new charge with the state before it
+        Returns: (kind, expected cents) for an anomalous charge, else None
+        """
+        if self.charge_count < MIN_OCCURRENCES:
+            return None
+
+        mean, std = self.amount_mean, self.amount_std
+        fixed_price = mean > 0 and std / mean <= FIXED_PRICE_CV
+        if fixed_price and self.cadence() and cents != self.last_cents:
+            change = abs(cents - self.last_cents) / self.last_cents
+            if change <= MAX_PRICE_CHANGE:
+                return 'price_change', self.last_cents
+            return 'outlier', self.last_cents
+
+        deviation = abs(cents - mean)
+        if deviation > OUTLIER_Z * std and deviation > OUTLIER_MIN_RATIO * mean:
+            return 'outlier', int(round(mean))
+        return None
+
+    def add(self, days: int, cents: int) -> None:
+        """Fold one charge (absolute amount in cents) into the statistics"""
+        self.charge_count += 1
+        delta = cents - self.amount_mean
+        self.amount_mean += delta / self.charge_count
+        self.amount_m2 += delta * (cents - self.amount_mean)
+
+        if self.last_date is None or days >= self.last_date:
+            if self.last_date is not None:
+                interval = days - self.last_date
+                self.interval_count += 1
+                delta = interval - self.interval_mean
+                self.interval_mean += delta / self.interval_count
+                self.interval_m2 += delta * (interval - self.interval_mean)
+            self.last_date = days
+            self.last_cents = cents
+        # Charges older than the last one seen only update the amount
+        # statistics; their intervals are picked up by a rebuild
+
+        if self.first_date is None or days < self.first_date:
+            self.first_date = days
+
+    def to_row(self) -> tuple:
+        return tuple(getattr(self, column) for column in STATE_COLUMNS)
+
+
+class RecurringDetector:
+    """
+    Keeps merchant_stats and anomalies up to date as charges are saved
+
+    ``update`` touches only the merchants in the new rows, and the read
+    methods scan merchant_stats rather than transaction history.
+    """
+
+    def __init__(self, conn: sqlite3.Connection,
+                 history: Optional[Callable[[List[int]], Iterable[Charge]]] = None):
+        self.conn = conn
+        # Every stored charge of the given merchants, used to rebuild them
+        self.history = history
+
+    def update(self, charges: Iterable[Charge]) -> int:
+        """
+        Fold new charges into the running statistics
+        Returns: number of anomalies recorded
+
+        Charges are (merchant_id, days, absolute cents, transaction id) and
+        must be new rows; replaying a charge counts it twice. Runs inside
+        the caller's transaction.
+
+        A charge older than its merchant's last one changes intervals that
+        were already folded in, so that merchant is replayed from
+        ``history`` instead, which must include the new rows.
+        """
+        by_merchant: Dict[int, List[Charge]] = {}
+        for charge in charges:
+            by_merchant.setdefault(charge[0], []).append(charge)
+        if not by_merchant:
+            return 0
+
+        states = self._load(list(by_merchant))
+        backfilled = [
+            merchant_id for merchant_id, merchant_charges in by_merchant.items()
+            if merchant_id in states and states[merchant_id].last_date is not None
+            and min(charge[1] for charge in merchant_charges) < states[merchant_id].last_date
+        ]
+        if backfilled and self.history is not None:
+            self.reset(backfilled)
+            for merchant_id in backfilled:
+                del states[merchant_id]
+                by_merchant[merchant_id] = []
+            for charge in self.history(backfilled):
+                by_merchant[charge[0]].append(charge)
+        anomalies = []
+        for merchant_id, merchant_charges in by_merchant.items():
+            state = states.get(merchant_id)
+            if state is None:
+                state = states[merchant_id] = MerchantStats(merchant_id)
+            merchant_charges.sort(key=lambda charge: (charge[1], charge[3]))
+
+            for _, days, cents, txn_id in merchant_charges:
+                flagged = state.check(cents)
+                if flagged:
+                    anomalies.append((txn_id, merchant_id, days, flagged[0], cents, flagged[1]))
+                state.add(days, cents)
+                if not state.recurring_flagged and state.cadence():
+                    state.recurring_flagged = 1
+                    anomalies.append((txn_id, merchant_id, days, 'new_subscription', cents, None))
+
+        placeholders = ', '.join('?' * len(STATE_COLUMNS))
+        self.conn.executemany(
+            f"INSERT OR REPLACE INTO merchant_stats ({', '.join(STATE_COLUMNS)}) "
+            f"VALUES ({placeholders})",
+            [state.to_row() for state in states.values()]
+        )
+        self.conn.executemany("""
+            INSERT OR REPLACE INTO anomalies
+            (transaction_id, merchant_id, date, kind, amount_cents, expected_cents)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, anomalies)
+        return len(anomalies)
+
+    def reset(self, merchant_ids: Optional[List[int]] = None) -> None:
+        """Forget state (for all merchants, or the given ones) before a rebuild"""
+        if merchant_ids is None:
+            self.conn.execute("DELETE FROM merchant_stats")
+            self.conn.execute("DELETE FROM anomalies")
+            return
+        params = [(merchant_id,) for merchant_id in merchant_ids]
+        self.conn.executemany("DELETE FROM merchant_stats WHERE merchant_id = ?", params)
+        self.conn.executemany("DELETE FROM anomalies WHERE merchant_id = ?", params)
+
+    def get_recurring(self, as_of: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Merchants whose charges repeat on a regular cadence
+
+        ``as_of`` (days since epoch) defaults to the latest charge seen, so
+        status reflects the imported data rather than the wall clock.
+        """
+        states = self._load()
+        if as_of is None:
+            as_of = max((state.last_date for state in states.values()
+                         if state.last_date is not None), default=None)
+        names = self._merchant_names()
+
+        recurring = []
+        for state in states.values():
+            cadence = state.cadence()
+            if not cadence:
+                continue
+            name, tolerance = cadence
+            next_expected = state.next_expected()
+            missed = as_of is not None and as_of > next_expected + tolerance
+            recurring.append({
+                'merchant_id': state.merchant_id,
+                'merchant': names.get(state.merchant_id),
+                'cadence': name,
+                'interval_days': round(state.interval_mean, 1),
+                'average_amount': round(state.amount_mean / 100, 2),
+                'last_amount': state.last_cents / 100,
+                'last_date': days_to_iso(state.last_date),
+                'next_expected': days_to_iso(next_expected),
+                'charges': state.charge_count,
+                'status': 'missed' if missed else 'active',
+            })
+        recurring.sort(key=lambda item: -item['average_amount'])
+        return recurring
+
+    def get_anomalies(self, start: Optional[int] = None, limit: int = 100,
+                      as_of: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Flagged charges (new subscriptions, price changes, outliers) plus
+        recurring charges that are overdue, newest first
+        """
+        query = """
+            SELECT a.transaction_id, a.merchant_id, m.name AS merchant, a.date, a.kind,
+                   a.amount_cents, a.expected_cents
+            FROM anomalies a LEFT JOIN merchants m ON m.id = a.merchant_id
+        """
+        params: List[Any] = []
+        if start is not None:
+            query += " WHERE a.date >= ?"
+            params.append(start)
+        query += " ORDER BY a.date DESC, a.id DESC LIMIT ?"
+        params.append(limit)
+
+        anomalies = [
+            {
+                'transaction_id': row[0],
+                'merchant_id': row[1],
+                'merchant': row[2],
+                'date': days_to_iso(row[3]),
+                'kind': row[4],
+                'amount': -row[5] / 100 if row[5] is not None else None,
+                'expected_amount': -row[6] / 100 if row[6] is not None else None,
+            }
+            for row in self.conn.execute(query, params)
+        ]
+
+        missed = [
+            {
+                'transaction_id': None,
+                'merchant_id': item['merchant_id'],
+                'merchant': item['merchant'],
+                'date': item['next_expected'],
+                'kind': 'missed',
+                'amount': None,
+                'expected_amount': -item['last_amount'],
+            }
+            for item in self.get_recurring(as_of) if item['status'] == 'missed'
+        ]
+        combined = missed + anomalies
+        combined.sort(key=lambda item: item['date'] or '', reverse=True)
+        return combined[:limit]
+
+    def _load(self, merchant_ids: Optional[List[int]] = None) -> Dict[int, MerchantStats]:
+        columns = ', '.join(STATE_COLUMNS)
+        if merchant_ids is None:
+            rows = self.conn.execute(f"SELECT {columns} FROM merchant_stats").fetchall()
+        else:
+            rows = []
+            for i in range(0, len(merchant_ids), 500):
+                chunk = merchant_ids[i:i + 500]
+                placeholders = ', '.join('?' * len(chunk))
+                rows += self.conn.execute(
+                    f"SELECT {columns} FROM merchant_stats WHERE merchant_id IN ({placeholders})",
+                    chunk
+                ).fetchall()
+        return {row[0]: MerchantStats(*row) for row in rows}
+
+    def _merchant_names(self) -> Dict[int, str]:
+        return {
+            row[0]: row[1] for row in self.conn.execute(
+                "SELECT m.id, m.name FROM merchants m JOIN merchant_stats s ON s.merchant_id = m.id"
+            )
+        }
@@ -0,0 +1,316 @@
+"""Approximate nearest-merchant index over character n-grams"""
+
+import math
+import os
+import pickle
+import sqlite3
+import threading
+from array import array
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+import logging
+
+from models.batch import UNCATEGORIZED
+
+logger = logging.getLogger(__name__)
+
+NGRAM = 3
+
+# Only categories assigned with at least this confidence (rules, user
+# corrections, categories from the statement) are used as labels
+MIN_LABEL_CONFIDENCE = 0.9
+
+# Neighbours that vote on a category
+TOP_K = 5
+
+# Matches below this cosine similarity are ignored
+MIN_SIMILARITY = 0.5
+
+# Confidence of an exact match; always below rule matches (0.9)
+MAX_CONFIDENCE = 0.85
+
+# Blocked search: postings of the rarest query n-grams are scanned until
+# this many entries have been seen (but at least MIN_BLOCK n-grams), and
+# only the MAX_CANDIDATES merchants sharing most of them are scored
+MIN_BLOCK = 2
+MAX_SCANNED = 2000
+MAX_CANDIDATES = 32
+
+# IDF weights are cached and recomputed once the index has grown by this
+# fraction since they were last computed
+REWEIGHT_GROWTH = 0.1
+
+# Settings key holding a token that triggers replace on every change to
+# merchant_categories; a saved index is reused while the token matches
+LABELS_VERSION_KEY = 'merchant_categories_version'
+
+# Bump when the saved index layout changes
+INDEX_FORMAT = 1
+
+
+def ngrams(name: str) -> set:
+    """Character n-grams of a merchant name, padded so word edges count"""
+    text = f" {' '.join(name.lower().split())} "
+    return {text[i:i + NGRAM] for i in range(len(text) - NGRAM + 1)}
+
+
+def _labels_version(conn: sqlite3.Connection) -> Optional[str]:
+    try:
+        row = conn.execute("SELECT value FROM settings WHERE key = ?", (LABELS_VERSION_KEY,)).fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return row[0] if row else None
+
+
+def _flatten(arrays: List[array]) -> Tuple[array, array]:
+    """Concatenate arrays, with offsets[i]:offsets[i + 1] delimiting each"""
+    flat, offsets = array('I'), array('I', [0])
+    for values in arrays:
+        flat.extend(values)
+        offsets.append(len(flat))
+    return flat, offsets
+
+
+def _unflatten(flat: array, offsets: array) -> List[array]:
+    return [flat[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+
+
+class MerchantIndex:
+    """
+    Sparse TF-IDF index of categorized merchant names
+
+    Each merchant is a set of character trigrams weighted by inverse
+    document frequency; similarity is the cosine between two sets. An
+    inverted index from trigram to merchants provides candidates, so a
+    query only scores merchants sharing its rarest trigrams. Merchants
+    are added incrementally; IDF weights and norms are cached and
+    refreshed as the index grows.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.names: List[str] = []
+        self.labels: List[str] = []
+        self.confidences = array('d')
+        self._merchant_ids: Dict[str, int] = {}
+        self._gram_ids: Dict[str, int] = {}
+        self._df = array('I')
+        self._postings: List[array] = []
+        self._grams: List[array] = []
+        # Cached squared IDF per n-gram and vector norm per merchant
+        self._idf2 = array('d')
+        self._norms = array('d')
+        self._weighted_size = 0
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @classmethod
+    def from_db(cls, conn: sqlite3.Connection, cache_path: Optional[str] = None) -> 'MerchantIndex':
+        """
+        Build the index from the merchant_categories table
+
+        With ``cache_path`` the built index is saved there and loaded
+        instead of rebuilt until merchant_categories changes.
+        """
+        # Read before the labels, so a concurrent change can only make
+        # the saved index look older than it is
+        version = _labels_version(conn) if cache_path else None
+        if version:
+            index = cls.load(cache_path, version)
+            if index is not None:
+                logger.info(f"Merchant index loaded from {cache_path} with {len(index)} merchants")
+                return index
+
+        index = cls()
+        rows = conn.execute("""
+            SELECT m.name, c.name, mc.confidence
+            FROM merchant_categories mc
+            JOIN merchants m ON m.id = mc.merchant_id
+            JOIN categories c ON c.id = mc.category_id
+        """).fetchall()
+        with index._lock:
+            for name, category, confidence in rows:
+                index._add(name, category, confidence, weigh=False)
+            index._reweight()
+        logger.info(f"Merchant index built with {len(index)} merchants")
+        if version:
+            index.save(cache_path, version)
+        return index
+
+    def save(self, path: str, version: str) -> None:
+        """Write the index (including postings and IDF weights) to ``path``"""
+        with self._lock:
+            postings, posting_offsets = _flatten(self._postings)
+            grams, gram_offsets = _flatten(self._grams)
+            state = {
+                'names': self.names,
+                'labels': self.labels,
+                'confidences': self.confidences,
+                'grams': sorted(self._gram_ids, key=self._gram_ids.get),
+                'df': self._df,
+                'postings': (postings, posting_offsets),
+                'merchant_grams': (grams, gram_offsets),
+                'idf2': self._idf2,
+                'norms': self._norms,
+                'weighted_size': self._weighted_size,
+            }
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            try:
+                with open(temp_path, 'wb') as f:
+                    # The header is read on its own to reject stale files cheaply
+                    pickle.dump((INDEX_FORMAT, version), f, pickle.HIGHEST_PROTOCOL)
+                    pickle.dump(state, f, pickle.HIGHEST_PROTOCOL)
+                os.replace(temp_path, path)
+            except OSError as e:
+                logger.warning(f"Could not save merchant index to {path}: {e}")
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+
+    @classmethod
+    def load(cls, path: str, version: str) -> Optional['MerchantIndex']:
+        """Index saved at ``path`` for this labels version, or None"""
+        try:
+            with open(path, 'rb') as f:
+                if pickle.load(f) != (INDEX_FORMAT, version):
+                    return None
+                state = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable merchant index {path}: {e}")
+            return None
+
+        index = cls()
+        index.names = state['names']
+        index.labels = state['labels']
+        index.confidences = state['confidences']
+        index._merchant_ids = {name: idx for idx, name in enumerate(index.names)}
+        index._gram_ids = {gram: gram_id for gram_id, gram in enumerate(state['grams'])}
+        index._df = state['df']
+        index._postings = _unflatten(*state['postings'])
+        index._grams = _unflatten(*state['merchant_grams'])
+        index._idf2 = state['idf2']
+        index._norms = state['norms']
+        index._weighted_size = state['weighted_size']
+        return index
+
+    def add(self, name: str, category: str, confidence: float = 1.0) -> None:
+        """
+        Add a merchant or relabel it
+
+        A label is only replaced by one of at least the same confidence,
+        so rule matches never override user corrections.
+        """
+        if not name or not category or category == UNCATEGORIZED:
+            return
+        if confidence < MIN_LABEL_CONFIDENCE:
+            return
+
+        with self._lock:
+            self._add(name, category, confidence)
+
+    def _add(self, name: str, category: str, confidence: float, weigh: bool = True) -> None:
+        idx = self._merchant_ids.get(name)
+        if idx is not None:
+            if confidence >= self.confidences[idx]:
+                self.labels[idx] = category
+                self.confidences[idx] = confidence
+            return
+
+        idx = len(self.names)
+        self._merchant_ids[name] = idx
+        self.names.append(name)
+        self.labels.append(category)
+        self.confidences.append(confidence)
+
+        gram_ids = array('I')
+        for gram in ngrams(name):
+            gram_id = self._gram_ids.get(gram)
+            if gram_id is None:
+                gram_id = self._gram_ids[gram] = len(self._df)
+                self._df.append(0)
+                self._postings.append(array('I'))
+                self._idf2.append(0.0)
+            self._df[gram_id] += 1
+            self._postings[gram_id].append(idx)
+            gram_ids.append(gram_id)
+            if weigh:
+                self._idf2[gram_id] = self._idf(self._df[gram_id]) ** 2
+        self._grams.append(gram_ids)
+        self._norms.append(self._norm(gram_ids) if weigh else 0.0)
+
+    def _idf(self, df: int) -> float:
+        return math.log((len(self.names) + 1) / (df + 1)) + 1
+
+    def _norm(self, gram_ids: array) -> float:
+        idf2 = self._idf2
+        return math.sqrt(sum(idf2[gram_id] for gram_id in gram_ids))
+
+    def _reweight(self) -> None:
+        """Recompute cached IDF weights and norms for the current size"""
+        self._idf2 = array('d', (self._idf(df) ** 2 for df in self._df))
+        self._norms = array('d', (self._norm(gram_ids) for gram_ids in self._grams))
+        self._weighted_size = len(self.names)
+
+    def query(self, name: str, k: int = TOP_K) -> List[Tuple[str, str, float]]:
+        """Up to k most similar merchants as (name, category, similarity)"""
+        grams = ngrams(name)
+        if not grams:
+            return []
+
+        with self._lock:
+            if not self.names:
+                return []
+            if len(self.names) > self._weighted_size * (1 + REWEIGHT_GROWTH):
+                self._reweight()
+            df = self._df
+            known = [self._gram_ids[gram] for gram in grams if gram in self._gram_ids]
+            if not known:
+                return []
+
+            idf2 = self._idf2
+            weights = {gram_id: idf2[gram_id] for gram_id in known}
+            unseen = len(grams) - len(known)
+            query_norm = math.sqrt(sum(weights.values()) + unseen * self._idf(0) ** 2)
+
+            # Candidates from the rarest n-grams' postings
+            known.sort(key=lambda gram_id: df[gram_id])
+            hits: Counter = Counter()
+            scanned = 0
+            for block, gram_id in enumerate(known):
+                if block >= MIN_BLOCK and scanned >= MAX_SCANNED:
+                    break
+                postings = self._postings[gram_id]
+                hits.update(postings)
+                scanned += len(postings)
+
+            scored = []
+            get = weights.get
+            for idx, _ in hits.most_common(MAX_CANDIDATES):
+                dot = sum(get(gram_id, 0.0) for gram_id in self._grams[idx])
+                scored.append((dot / (query_norm * self._norms[idx]), idx))
+
+            scored.sort(reverse=True)
+            return [(self.names[idx], self.labels[idx], similarity)
+                    for similarity, idx in scored[:k]]
+
+    def predict(self, name: str) -> Optional[Tuple[str, float]]:
+        """
+        Category and confidence for a merchant from its nearest neighbours
+
+        Neighbours above MIN_SIMILARITY vote with their similarity. The
+        confidence scales the best similarity by the winning category's
+        share of the vote, capped at MAX_CONFIDENCE.
+        """
+        neighbours = [match for match in self.query(name) if match[2] >= MIN_SIMILARITY]
+        if not neighbours:
+            return None
+
+        votes: Dict[str, float] = {}
+        for _, category, similarity in neighbours:
+            votes[category] = votes.get(category, 0.0) + similarity
+        category = max(votes, key=votes.get)
+        best = max(similarity for _, label, similarity in neighbours if label == category)
+        share = votes[category] / sum(votes.values())
+        return category, round(MAX_CONFIDENCE * min(best, 1.0) * share, 3)
@@ -0,0 +1,354 @@
+"""Columnar in-memory transaction batches"""
+
+from array import array
+from datetime import date
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from typing import Any, Dict, Iterator, List, Optional
+import sys
+
+EPOCH = date(1970, 1, 1)
+EPOCH_ORDINAL = EPOCH.toordinal()
+
+# int32 sentinel for dates that could not be parsed
+NO_DATE = -2 ** 31
+
+UNCATEGORIZED = 'Uncategorized'
+
+_CENT = Decimal('0.01')
+
+
+def date_to_days(value: date) -> int:
+    """Convert a date to days since the Unix epoch"""
+    return value.toordinal() - EPOCH_ORDINAL
+
+
+def days_to_date(days: int) -> Optional[date]:
+    """Convert days since the Unix epoch back to a date"""
+    if days == NO_DATE:
+        return None
+    return date.fromordinal(days + EPOCH_ORDINAL)
+
+
+def days_to_iso(days: int) -> Optional[str]:
+    """Convert days since the Unix epoch to an ISO date string"""
+    if days == NO_DATE:
+        return None
+    return date.fromordinal(days + EPOCH_ORDINAL).isoformat()
+
+
+def iso_to_days(value: Any) -> int:
+    """Convert an ISO (YYYY-MM-DD) date string to days since the epoch"""
+    if value is None:
+        return NO_DATE
+    try:
+        return date.fromisoformat(str(value)[:10]).toordinal() - EPOCH_ORDINAL
+    except ValueError:
+        return NO_DATE
+
+
+def to_cents(value: Any) -> int:
+    """
+    Convert an amount to integer cents without float rounding
+
+    Strings are parsed exactly (currency symbols, thousands separators and
+    parenthesised negatives are accepted); floats are rounded to the
+    nearest cent.
+    """
+    if isinstance(value, int):
+        return value * 100
+    if isinstance(value, float):
+        return int(round(value * 100))
+
+    cleaned = str(value).replace('$', '').replace(',', '').strip()
+    if cleaned.startswith('(') and cleaned.endswith(')'):
+        cleaned = '-' + cleaned[1:-1]
+
+    try:
+        return int(Decimal(cleaned).quantize(_CENT, rounding=ROUND_HALF_UP) * 100)
+    except InvalidOperation:
+        raise ValueError(f"Invalid amount: {value!r}")
+
+
+def cents_to_amount(cents: int) -> float:
+    """Convert integer cents to a float amount for display"""
+    return cents / 100
+
+
+class TransactionRow:
+    """
+    Lightweight view of a single row in a TransactionBatch
+
+    Supports the read-only parts of the dict interface (``row['amount']``,
+    ``row.get('merchant')``) so it can be passed to code written against
+    transaction dicts.
+    """
+
+    __slots__ = ('_batch', '_index')
+
+    _FIELDS = ('id', 'date', 'merchant', 'description', 'amount', 'category', 'confidence')
+
+    def __init__(self, batch: 'TransactionBatch', index: int):
+        self._batch = batch
+        self._index = index
+
+    @property
+    def id(self) -> str:
+        return self._batch.ids[self._index]
+
+    @property
+    def date_days(self) -> int:
+        return self._batch.dates[self._index]
+
+    @property
+    def date(self) -> Optional[str]:
+        return days_to_iso(self._batch.dates[self._index])
+
+    @property
+    def merchant(self) -> str:
+        return self._batch.merchants[self._index]
+
+    @property
+    def description(self) -> str:
+        return self._batch.descriptions[self._index]
+
+    @property
+    def amount_cents(self) -> int:
+        return self._batch.amounts[self._index]
+
+    @property
+    def amount(self) -> float:
+        return cents_to_amount(self._batch.amounts[self._index])
+
+    @property
+    def category(self) -> str:
+        batch = self._batch
+        return batch.categories[batch.category_codes[self._index]]
+
+    @property
+    def confidence(self) -> float:
+        return self._batch.confidences[self._index]
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self._FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._FIELDS
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key not in self._FIELDS:
+            return default
+        return getattr(self, key)
+
+    def keys(self):
+        return self._FIELDS
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {field: getattr(self, field) for field in self._FIELDS}
+
+    def __repr__(self) -> str:
+        return f"TransactionRow({self.to_dict()!r})"
+
+
+class TransactionBatch:
+    """
+    Columnar container for transactions
+
+    Dates are stored as int32 days since the epoch, amounts as int64 cents
+    and categories as codes into a per-batch dictionary (``categories``).
+    String columns are plain lists; repeated merchant names are interned.
+    """
+
+    __slots__ = (
+        'ids', 'dates', 'merchants', 'descriptions', 'amounts',
+        'category_codes', 'confidences', 'categories', '_category_lookup'
+    )
+
+    def __init__(self):
+        self.ids: List[str] = []
+        self.dates = array('i')
+        self.merchants: List[str] = []
+        self.descriptions: List[str] = []
+        self.amounts = array('q')
+        self.category_codes = array('I')
+        self.confidences = array('d')
+        self.categories: List[str] = []
+        self._category_lookup: Dict[str, int] = {}
+        self.category_code(UNCATEGORIZED)
+
+    @classmethod
+    def from_dicts(cls, transactions: List[Dict[str, Any]]) -> 'TransactionBatch':
+        """Build a batch from transaction dicts"""
+        batch = cls()
+        for txn in transactions:
+            batch.append_dict(txn)
+        return batch
+
+    @classmethod
+    def from_rows(cls, rows: List[tuple]) -> 'TransactionBatch':
+        """
+        Build a batch from database tuples of (id, days since epoch,
+        merchant, description, amount in cents, category, confidence)
+        """
+        batch = cls()
+        if not rows:
+            return batch
+
+        ids, dates, merchants, descriptions, amounts, categories, confidences = zip(*rows)
+        batch.ids = list(ids)
+        batch.dates = array('i', [NO_DATE if days is None else days for days in dates])
+        batch.merchants = [merchant or '' for merchant in merchants]
+        batch.descriptions = [description or '' for description in descriptions]
+        batch.amounts = array('q', amounts)
+        code = batch.category_code
+        batch.category_codes = array('I', [code(category or UNCATEGORIZED) for category in categories])
+        batch.confidences = array('d', [confidence or 0.0 for confidence in confidences])
+        return batch
+
+    def category_code(self, name: str) -> int:
+        """Return the dictionary code for a category, adding it if needed"""
+        code = self._category_lookup.get(name)
+        if code is None:
+            code = len(self.categories)
+            self.categories.append(name)
+            self._category_lookup[name] = code
+        return code
+
+    def append(self, txn_id: str, date_days: int, merchant: str, description: str,
+               amount_cents: int, category: str = UNCATEGORIZED,
+               confidence: float = 0.0) -> None:
+        """Append a single transaction"""
+        self.ids.append(txn_id)
+        self.dates.append(date_days)
+        self.merchants.append(sys.intern(merchant))
+        self.descriptions.append(description)
+        self.amounts.append(amount_cents)
+        self.category_codes.append(self.category_code(category or UNCATEGORIZED))
+        self.confidences.append(confidence)
+
+    def append_dict(self, txn: Dict[str, Any]) -> None:
+        """Append a transaction given in dict form"""
+        self.append(
+            txn['id'],
+            iso_to_days(txn.get('date')),
+            txn.get('merchant') or '',
+            txn.get('description') or '',
+            to_cents(txn.get('amount', 0)),
+            txn.get('category') or UNCATEGORIZED,
+            txn.get('confidence') or 0.0
+        )
+
+    def extend(self, other: 'TransactionBatch') -> None:
+        """Append all rows of another batch, remapping its category codes"""
+        remap = [self.category_code(name) for name in other.categories]
+        self.ids.extend(other.ids)
+        self.dates.extend(other.dates)
+        self.merchants.extend(other.merchants)
+        self.descriptions.extend(other.descriptions)
+        self.amounts.extend(other.amounts)
+        self.category_codes.extend(remap[code] for code in other.category_codes)
+        self.confidences.extend(other.confidences)
+
+    def slice(self, start: int, stop: int) -> 'TransactionBatch':
+        """Return a new batch holding rows ``start:stop``"""
+        part = TransactionBatch()
+        part.ids = self.ids[start:stop]
+        part.dates = self.dates[start:stop]
+        part.merchants = self.merchants[start:stop]
+        part.descriptions = self.descriptions[start:stop]
+        part.amounts = self.amounts[start:stop]
+        part.category_codes = self.category_codes[start:stop]
+        part.confidences = self.confidences[start:stop]
+        part.categories = list(self.categories)
+        part._category_lookup = dict(self._category_lookup)
+        return part
+
+    def set_category(self, index: int, category: str, confidence: float) -> None:
+        """Set the category and confidence of a row"""
+        self.category_codes[index] = self.category_code(category)
+        self.confidences[index] = confidence
+
+    def category_at(self, index: int) -> str:
+        return self.categories[self.category_codes[index]]
+
+    def used_categories(self) -> List[str]:
+        """Categories actually referenced by at least one row"""
+        used = set(self.category_codes)
+        return [name for code, name in enumerate(self.categories) if code in used]
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getitem__(self, index: int) -> TransactionRow:
+        if index < 0:
+            index += len(self.ids)
+        if not 0 <= index < len(self.ids):
+            raise IndexError(index)
+        return TransactionRow(self, index)
+
+    def __iter__(self) -> Iterator[TransactionRow]:
+        for index in range(len(self.ids)):
+            yield TransactionRow(self, index)
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        """Materialise the batch as a list of transaction dicts"""
+        categories = self.categories
+        return [
+            {
+                'id': txn_id,
+                'date': days_to_iso(days),
+                'merchant': merchant,
+                'description': description,
+                'amount': cents / 100,
+                'category': categories[code],
+                'confidence': confidence
+            }
+            for txn_id, days, merchant, description, cents, code, confidence in zip(
+                self.ids, self.dates, self.merchants, self.descriptions,
+                self.amounts, self.category_codes, self.confidences
+            )
+        ]
+
+    def to_columns(self) -> Dict[str, Any]:
+        """
+        Columnar wire representation of the batch
+
+        String columns are shared with the batch rather than copied, and
+        categories are sent as codes into the ``categories`` list.
+        """
+        return {
+            'length': len(self.ids),
+            'columns': {
+                'id': self.ids,
+                'date': [days_to_iso(days) for days in self.dates],
+                'merchant': self.merchants,
+                'description': self.descriptions,
+                'amount': [cents / 100 for cents in self.amounts],
+                'category': self.category_codes.tolist(),
+                'confidence': self.confidences.tolist()
+            },
+            'categories': self.categories
+        }
+
+    def to_numpy(self) -> Dict[str, Any]:
+        """Zero-copy NumPy views over the numeric columns"""
+        import numpy as np
+
+        return {
+            'date': np.frombuffer(self.dates, dtype=np.int32),
+            'amount_cents': np.frombuffer(self.amounts, dtype=np.int64),
+            'category_code': np.frombuffer(self.category_codes, dtype=np.uint32),
+            'confidence': np.frombuffer(self.confidences, dtype=np.float64),
+        }
+
+    def total_cents(self) -> Dict[str, int]:
+        """Sum of negative (spending) and positive (income) amounts in cents"""
+        spending = 0
+        income = 0
+        for cents in self.amounts:
+            if cents < 0:
+                spending -= cents
+            elif cents > 0:
+                income += cents
+        return {'spending': spending, 'income': income}
@@ -5,20 +5,28 @@ import pandas as pd
 from typing import List, Dict, Any
 import secrets
 from datetime import datetime
-import re
 import logging
 
+from utils.helpers import extract_merchant_name
+from models.batch import (
+    TransactionBatch, UNCATEGORIZED, EPOCH, NO_DATE, date_to_days, to_cents
+)
+
 logger = logging.getLogger(__name__)
 
 
 class CSVParser:
     def parse(self, file_path: str) -> List[Dict[str, Any]]:
         """Parse CSV file and return transaction list"""
-        transactions = []
+        return self.parse_batch(file_path).to_dicts()
+    
+    def parse_batch(self, file_path: str) -> TransactionBatch:
+        """Parse CSV file into a columnar transaction batch"""
+        batch = TransactionBatch()
         
         try:
-            # Read CSV with pandas for flexibility
-            df = pd.read_csv(file_path)
+            # Read everything as text so amounts can be converted to cents exactly
+            df = pd.read_csv(file_path, dtype=str, keep_default_na=False)
             
             # Clean column names
             df.columns = df.columns.str.strip()
@@ -26,28 +34,37 @@ class CSVParser:
             # Map columns
             column_mapping = self._detect_columns(df.columns)
             
-            for _, row in df.iterrows():
-                transaction = {
-                    'id': f"txn_{secrets.token_hex(8)}",
-                    'date': self._parse_date(row[column_mapping['date']]),
-                    'merchant': self._extract_merchant(row[column_mapping['merchant']]),
-                    'description': str(row[column_mapping['merchant']]),
-                    'amount': float(row[column_mapping['amount']]),
-                    'category': 'Uncategorized',
-                    'confidence': 0.0
-                }
+            dates = self._parse_dates(df[column_mapping['date']])
+            payees = df[column_mapping['merchant']]
+            amounts = df[column_mapping['amount']]
+            if 'category' in column_mapping:
+                categories = df[column_mapping['category']]
+            else:
+                categories = [''] * len(df)
+            
+            skipped = 0
+            for days, payee, amount, existing_cat in zip(dates, payees, amounts, categories):
+                # Blank rows (e.g. balance or pending lines) carry no amount
+                if not amount.strip():
+                    skipped += 1
+                    continue
                 
                 # Use existing category if available
-                if 'category' in column_mapping and column_mapping['category'] in row:
-                    existing_cat = row[column_mapping['category']]
-                    if pd.notna(existing_cat):
-                        transaction['category'] = str(existing_cat)
-                        transaction['confidence'] = 1.0
-                
-                transactions.append(transaction)
+                existing_cat = existing_cat.strip()
+                batch.append(
+                    f"txn_{secrets.token_hex(8)}",
+                    days,
+                    self._extract_merchant(payee),
+                    payee,
+                    to_cents(amount),
+                    existing_cat or UNCATEGORIZED,
+                    1.0 if existing_cat else 0.0
+                )
             
-            logger.info(f"Parsed {len(transactions)} transactions from CSV")
-            return transactions
+            if skipped:
+                logger.warning(f"Skipped {skipped} CSV rows with no amount")
+            logger.info(f"Parsed {len(batch)} transactions from CSV")
+            return batch
             
         except Exception as e:
             logger.error(f"CSV parsing error: {e}")
@@ -70,33 +87,27 @@ class CSVParser:
         
         return mapping
     
-    def _parse_date(self, date_str: str) -> str:
-        """Convert date to ISO format"""
+    def _parse_dates(self, values: pd.Series) -> List[int]:
+        """Convert a date column to days since the epoch"""
+        # Vectorised parse first; anything in an unexpected format falls back
+        # to a per-value parse
+        parsed = pd.to_datetime(values, errors='coerce')
+        days = (parsed - pd.Timestamp(EPOCH)).dt.days
+        
+        return [
+            self._parse_date(raw) if pd.isna(day) else int(day)
+            for raw, day in zip(values, days)
+        ]
+    
+    def _parse_date(self, date_str: str) -> int:
+        """Convert a single date to days since the epoch"""
         try:
             dt = pd.to_datetime(date_str)
-            return dt.strftime('%Y-%m-%d')
-        except:
-            return str(date_str)
+            return date_to_days(dt.date())
+        except Exception:
+            logger.warning(f"Unparseable date: {date_str!r}")
+            return NO_DATE
     
     def _extract_merchant(self, description: str) -> str:
         """Clean up merchant name from description"""
-        # Remove quotes and extra spaces
-        cleaned = str(description)
-        cleaned = re.sub(r'"', '', cleaned)
-        cleaned = re.sub(r'\s+', ' ', cleaned)
-        
-        # Remove common prefixes
-        prefixes = ['WL *', 'SQSP* ', 'ABC*']
-        for prefix in prefixes:
-            if cleaned.startswith(prefix):
-                cleaned = cleaned[len(prefix):]
-        
-        # Take first few meaningful words
-        parts = cleaned.split()
-        if parts:
-            # Remove trailing location codes
-            merchant = ' '.join(parts[:3])
-            merchant = re.sub(r'\s+[A-Z]{2}\s*$', '', merchant)
-            return merchant.strip()
-        
-        return cleaned[:50]
+        return extract_merchant_name(description)
@@ -2,11 +2,18 @@
 
 import re
 import secrets
-from typing import List, Dict, Any, Optional
+from datetime import date
+from typing import List, Dict, Any, Callable, Optional, Tuple
 import logging
 
+from models.batch import TransactionBatch, NO_DATE, date_to_days, to_cents
+from utils.helpers import extract_merchant_name
+
 logger = logging.getLogger(__name__)
 
+DATE_PATTERN = re.compile(r'(\d{1,2})/(\d{1,2})(?:/(\d{2,4}))?')
+AMOUNT_PATTERN = re.compile(r'([-]?[\d,]+\.\d{2})')
+
 # Note: PDF parsing requires additional libraries
 # Install with: pip install PyPDF2 pdfplumber tabula-py
 
@@ -22,75 +29,100 @@ class PDFParser:
     
     def parse(self, file_path: str) -> List[Dict[str, Any]]:
         """Parse PDF bank statement"""
+        return self.parse_batch(file_path).to_dicts()
+    
+    def parse_batch(self, file_path: str,
+                    progress: Optional[Callable[[int, int], None]] = None) -> TransactionBatch:
+        """
+        Parse PDF bank statement into a columnar transaction batch
+        
+        progress, if given, is called with (pages done, total pages) after
+        each page; raising from it aborts the parse.
+        """
         if not self.has_pdf_libs:
             raise ImportError("PDF parsing libraries not installed")
         
-        transactions = []
+        batch = TransactionBatch()
         
         try:
             import pdfplumber
             
             with pdfplumber.open(file_path) as pdf:
-                for page in pdf.pages:
+                total_pages = len(pdf.pages)
+                for page_num, page in enumerate(pdf.pages, 1):
                     text = page.extract_text()
                     if text:
                         # Parse text for transactions
-                        page_transactions = self._extract_transactions_from_text(text)
-                        transactions.extend(page_transactions)
+                        self._extract_transactions_from_text(text, batch)
+                    if progress:
+                        progress(page_num, total_pages)
             
-            logger.info(f"Parsed {len(transactions)} transactions from PDF")
-            return transactions
+            logger.info(f"Parsed {len(batch)} transactions from PDF")
+            return batch
             
         except Exception as e:
             logger.error(f"PDF parsing error: {e}")
             raise
     
-    def _extract_transactions_from_text(self, text: str) -> List[Dict[str, Any]]:
-        """Extract transactions from PDF text"""
-        transactions = []
-        lines = text.split('\n')
-        
-        for line in lines:
-            # Look for transaction patterns (date and amount)
-            if self._is_transaction_line(line):
-                transaction = self._parse_transaction_line(line)
-                if transaction:
-                    transactions.append(transaction)
-        
-        return transactions
+    def _extract_transactions_from_text(self, text: str, batch: TransactionBatch) -> None:
+        """Extract transactions from PDF text into a batch"""
+        for line in text.split('\n'):
+            # Lines with both a date and an amount are transactions
+            parsed = self._parse_transaction_line(line)
+            if parsed:
+                days, payee, description, amount_cents = parsed
+                batch.append(
+                    f"txn_{secrets.token_hex(8)}",
+                    days,
+                    extract_merchant_name(payee),
+                    description,
+                    amount_cents
+                )
     
-    def _is_transaction_line(self, line: str) -> bool:
-        """Check if line contains transaction data"""
-        has_date = bool(re.search(r'\d{1,2}/\d{1,2}', line))
-        has_amount = bool(re.search(r'[\d,]+\.\d{2}', line))
-        return has_date and has_amount
-    
-    def _parse_transaction_line(self, line: str) -> Optional[Dict[str, Any]]:
-        """Parse a single transaction line"""
+    def _parse_transaction_line(self, line: str) -> Optional[Tuple[int, str, str, int]]:
+        """
+        Parse a single transaction line
+        Returns: (days since epoch, payee, description, amount in cents)
+        """
         try:
             # Extract date
-            date_match = re.search(r'(\d{1,2}/\d{1,2}(?:/\d{2,4})?)', line)
+            date_match = DATE_PATTERN.search(line)
             if not date_match:
                 return None
             
             # Extract amount
-            amount_matches = re.findall(r'([-]?[\d,]+\.\d{2})', line)
+            amount_matches = AMOUNT_PATTERN.findall(line)
             if not amount_matches:
                 return None
             
-            amount = float(amount_matches[-1].replace(',', ''))
+            amount_cents = to_cents(amount_matches[-1])
             
-            # Extract description
+            # Extract description, and the payee text between date and amounts
             description = line[:50].strip()
+            payee = AMOUNT_PATTERN.sub('', line[date_match.end():]).strip()
             
-            return {
-                'id': f"txn_{secrets.token_hex(8)}",
-                'date': date_match.group(1),
-                'merchant': description[:30],
-                'description': description,
-                'amount': amount,
-                'category': 'Uncategorized',
-                'confidence': 0.0
-            }
+            return self._parse_date(*date_match.groups()), payee, description, amount_cents
         except Exception:
             return None
+    
+    def _parse_date(self, month: str, day: str, year: Optional[str]) -> int:
+        """
+        Convert statement date parts to days since the epoch
+        
+        Statements usually print MM/DD without a year; those are assumed to
+        fall within the year before today.
+        """
+        try:
+            today = date.today()
+            if year:
+                year_num = int(year)
+                if year_num < 100:
+                    year_num += 2000
+                return date_to_days(date(year_num, int(month), int(day)))
+            
+            parsed = date(today.year, int(month), int(day))
+            if parsed > today:
+                parsed = date(today.year - 1, int(month), int(day))
+            return date_to_days(parsed)
+        except ValueError:
+            return NO_DATE
@@ -0,0 +1,94 @@
+"""Tests for the columnar transaction batch"""
+
+import pytest
+
+from database.manager import DatabaseManager
+from ml.categorizer import MLCategorizer
+from models.batch import (
+    TransactionBatch, NO_DATE, days_to_iso, iso_to_days, to_cents
+)
+
+
+def make_batch():
+    batch = TransactionBatch()
+    batch.append('txn_1', iso_to_days('2025-09-04'), 'ANTHROPIC', 'ANTHROPIC ANTHROPIC.COMCA', -4398)
+    batch.append('txn_2', iso_to_days('2025-09-02'), 'REPUBLIC FITNESS', 'ABC*REPUBLIC FITNESS', -8399,
+                 'Fitness', 1.0)
+    batch.append('txn_3', iso_to_days('2025-08-27'), 'PAYROLL', 'PAYROLL DEPOSIT', 250000)
+    return batch
+
+
+def test_to_cents_is_exact():
+    assert to_cents('-43.98') == -4398
+    assert to_cents('$1,234.50') == 123450
+    assert to_cents('(12.00)') == -1200
+    assert to_cents(0.1 + 0.2) == 30
+    assert to_cents(5) == 500
+    with pytest.raises(ValueError):
+        to_cents('abc')
+
+
+def test_dates_round_trip():
+    assert days_to_iso(iso_to_days('2025-09-04')) == '2025-09-04'
+    assert iso_to_days('09/04') == NO_DATE
+    assert days_to_iso(NO_DATE) is None
+
+
+def test_row_view_and_dicts():
+    batch = make_batch()
+    row = batch[1]
+    assert row['amount'] == -83.99
+    assert row.get('category') == 'Fitness'
+    assert row.get('missing', 'x') == 'x'
+    assert batch.to_dicts()[0] == {
+        'id': 'txn_1',
+        'date': '2025-09-04',
+        'merchant': 'ANTHROPIC',
+        'description': 'ANTHROPIC ANTHROPIC.COMCA',
+        'amount': -43.98,
+        'category': 'Uncategorized',
+        'confidence': 0.0
+    }
+
+
+def test_extend_and_slice_remap_categories():
+    batch = make_batch()
+    other = TransactionBatch()
+    other.append('txn_4', 0, 'X', 'X', -100, 'Other', 1.0)
+    batch.extend(other)
+    assert [row.category for row in batch] == ['Uncategorized', 'Fitness', 'Uncategorized', 'Other']
+    assert [row.id for row in batch.slice(1, 3)] == ['txn_2', 'txn_3']
+
+
+def test_categorize_batch():
+    batch = make_batch()
+    categorized = MLCategorizer().categorize_batch(batch)
+    assert categorized == 2
+    assert [(row.category, row.confidence) for row in batch] == [
+        ('AI Services', 0.9), ('Fitness', 1.0), ('Income', 0.8)
+    ]
+
+
+def test_save_and_load_batch(tmp_path):
+    db = DatabaseManager(str(tmp_path / 'test.db'))
+    assert db.save_batch(make_batch()) == 3
+
+    loaded = db.get_transactions_batch({'start_date': '2025-09-01'})
+    assert loaded.ids == ['txn_1', 'txn_2']
+    assert list(loaded.amounts) == [-4398, -8399]
+    assert 'Fitness' in db.get_all_categories()
+
+
+def test_csv_rows_without_amount_are_skipped(tmp_path):
+    pytest.importorskip('pandas')
+    from parsers.csv_parser import CSVParser
+
+    path = tmp_path / 'statement.csv'
+    path.write_text(
+        "Date,Payee,Amount\n"
+        "09/04/2025,ANTHROPIC,-43.98\n"
+        "09/05/2025,PENDING HOLD,\n"
+        "09/06/2025,PAYROLL,\"2,500.00\"\n"
+    )
+    batch = CSVParser().parse_batch(str(path))
+    assert list(batch.amounts) == [-4398, 250000]
@@ -0,0 +1,103 @@
+"""Tests for background import jobs"""
+
+import threading
+import time
+
+import pytest
+
+from database.manager import DatabaseManager
+from jobs.manager import JobManager
+from ml.categorizer import MLCategorizer
+from models.batch import TransactionBatch
+
+
+class StubParser:
+    """Returns a fixed number of rows, optionally waiting on an event first"""
+
+    def __init__(self, rows, gate=None):
+        self.rows = rows
+        self.gate = gate
+
+    def parse_batch(self, path):
+        if self.gate:
+            self.gate.wait(5)
+        batch = TransactionBatch()
+        for i in range(self.rows):
+            batch.append(f"txn_{i}", 20000 + i % 30, 'NETFLIX', 'NETFLIX.COM', -1549)
+        return batch
+
+
+def wait_for(manager, job_id, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = manager.get_job(job_id)
+        if job['phase'] in ('completed', 'failed', 'cancelled'):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job did not finish: {job}")
+
+
+def test_import_job_saves_in_batches(tmp_path):
+    db_path = str(tmp_path / 'test.db')
+    reader = DatabaseManager(db_path)
+    manager = JobManager(db_path, {'csv': StubParser(25)}, MLCategorizer(),
+                         batch_size=10, detach=False)
+
+    job = wait_for(manager, manager.start_import(['statement.csv']))
+    manager.shutdown()
+
+    assert job['phase'] == 'completed'
+    assert job['rows_done'] == job['rows_total'] == 25
+    assert job['errors'] == []
+    assert len(reader.get_transactions()) == 25
+    assert reader.get_transactions()[0]['category'] == 'Entertainment'
+
+
+def test_cancel_job(tmp_path):
+    gate = threading.Event()
+    db_path = str(tmp_path / 'test.db')
+    manager = JobManager(db_path, {'csv': StubParser(25, gate)}, MLCategorizer(),
+                         detach=False)
+
+    job_id = manager.start_import(['statement.csv'])
+    assert manager.cancel_job(job_id)
+    gate.set()
+    job = wait_for(manager, job_id)
+    manager.shutdown()
+
+    assert job['phase'] == 'cancelled'
+    assert job['rows_done'] == 0
+    assert not manager.cancel_job(job_id)
+
+
+def test_failed_file_is_reported(tmp_path):
+    class Broken:
+        def parse_batch(self, path):
+            raise ValueError('bad statement')
+
+    manager = JobManager(str(tmp_path / 'test.db'), {'csv': Broken()}, MLCategorizer(),
+                         detach=False)
+    job = wait_for(manager, manager.start_import(['bad.csv']))
+    manager.shutdown()
+
+    assert job['phase'] == 'failed'
+    assert job['errors'] == [{'path': 'bad.csv', 'error': 'bad statement'}]
+
+
+def test_detached_worker_outlives_the_caller(tmp_path):
+    pytest.importorskip('pandas')
+    pytest.importorskip('bcrypt')
+    from parsers.csv_parser import CSVParser
+
+    statement = tmp_path / 'statement.csv'
+    statement.write_text("Date,Payee,Amount\n09/04/2025,NETFLIX.COM,-15.49\n")
+    db_path = str(tmp_path / 'test.db')
+    DatabaseManager(db_path)
+
+    job_id = JobManager(db_path, {'csv': CSVParser()}, MLCategorizer()).start_import([str(statement)])
+    # A new manager, as in the next bridge call, sees the job's progress
+    job = wait_for(JobManager(db_path, {'csv': CSVParser()}, MLCategorizer()), job_id, timeout=30)
+
+    assert job['phase'] == 'completed'
+    assert job['rows_done'] == 1
+    assert DatabaseManager(db_path).get_transactions()[0]['category'] == 'Entertainment'
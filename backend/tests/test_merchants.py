@@ -0,0 +1,79 @@
+"""Tests for merchant normalization and the merchants table"""
+
+import sqlite3
+
+import pytest
+
+from database.manager import DatabaseManager
+from utils.helpers import extract_merchant_name
+
+
+@pytest.mark.parametrize('raw, expected', [
+    ('ABC*REPUBLIC FITNESS 617-5471229 MA', 'Republic Fitness'),
+    ('REPUBLIC FITNESS MA', 'Republic Fitness'),
+    ('Amazon web services aws.amazon.coWA', 'Amazon Web Services'),
+    ('ANTHROPIC ANTHROPIC.COMCA', 'Anthropic'),
+    ('SQSP* SQUARESPACE INC. NY', 'Squarespace'),
+    ('WHOLEFDS SOM #123 SOMERVILLE MA', 'Wholefds Som'),
+    ('SHOP AT NY STORE', 'Shop At'),
+    ('FOOD IN MA', 'Food'),
+    ('DELTA AIR LINES', 'Delta Air Lines'),
+])
+def test_extract_merchant_name(raw, expected):
+    assert extract_merchant_name(raw) == expected
+    assert extract_merchant_name(expected) == expected
+
+
+def test_same_payee_shares_one_merchant_id(tmp_path):
+    db = DatabaseManager(str(tmp_path / 'test.db'))
+    ids = db.resolve_merchants([
+        'ABC*REPUBLIC FITNESS 617-5471229 MA', 'REPUBLIC FITNESS MA', 'NETFLIX', None
+    ])
+    assert ids[0] == ids[1] != ids[2]
+    assert ids[3] is None
+    assert db.conn.execute("SELECT COUNT(*) FROM merchants").fetchone()[0] == 2
+
+
+def test_legacy_merchant_column_is_migrated(tmp_path):
+    path = str(tmp_path / 'legacy.db')
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE transactions (
+            id TEXT PRIMARY KEY, date TEXT, merchant TEXT, description TEXT,
+            amount REAL, category TEXT, confidence REAL DEFAULT 0.0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE INDEX idx_merchant ON transactions(merchant);
+        INSERT INTO transactions (id, date, merchant, description, amount, category)
+        VALUES ('txn_1', '2025-09-02', 'REPUBLIC FITNESS 617-5471229', 'ABC*REPUBLIC FITNESS', -83.99, 'Fitness'),
+               ('txn_2', '2025-08-19', 'Republic Fitness', 'REPUBLIC FITNESS', -83.99, 'Fitness');
+    """)
+    conn.close()
+
+    db = DatabaseManager(path)
+    transactions = db.get_transactions()
+    assert [t['merchant'] for t in transactions] == ['Republic Fitness', 'Republic Fitness']
+    assert transactions[0]['merchant_id'] == transactions[1]['merchant_id']
+    assert len(db.get_transactions({'search': 'fitness'})) == 2
+
+
+def test_failed_batch_does_not_cache_rolled_back_ids(tmp_path):
+    from models.batch import TransactionBatch
+
+    db = DatabaseManager(str(tmp_path / 'test.db'))
+    rows = [{'id': 'txn_1', 'date': '2025-09-02', 'merchant': 'REPUBLIC FITNESS',
+             'description': 'REPUBLIC FITNESS', 'amount': -83.99, 'category': 'Gym'}]
+    # Stands in for a write that fails mid-batch, e.g. SQLITE_BUSY
+    db.conn.execute("""
+        CREATE TRIGGER fail_insert BEFORE INSERT ON transactions
+        BEGIN SELECT RAISE(ABORT, 'database is locked'); END
+    """)
+    with pytest.raises(sqlite3.Error):
+        db.save_batch(TransactionBatch.from_dicts(rows))
+    assert db.conn.execute("SELECT COUNT(*) FROM merchants").fetchone()[0] == 0
+    assert not db.save_transaction(dict(rows[0], id='txn_2'))
+
+    db.conn.execute("DROP TRIGGER fail_insert")
+    db.save_batch(TransactionBatch.from_dicts(rows))
+    transaction, = db.get_transactions()
+    assert (transaction['merchant'], transaction['category']) == ('Republic Fitness', 'Gym')
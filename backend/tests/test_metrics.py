@@ -0,0 +1,124 @@
+"""Tests for the instrumentation layer"""
+
+import sqlite3
+
+import pytest
+
+from database.manager import DatabaseManager
+from main import BankAnalyzerAPI
+from utils import metrics as metrics_module
+from utils.metrics import Histogram, Metrics, instrumented, metrics, store_path
+
+
+@pytest.fixture(autouse=True)
+def clean_metrics():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+def test_histogram_percentiles():
+    histogram = Histogram()
+    for ms in (0.5, 3, 3, 40, 900):
+        histogram.observe(ms / 1000)
+    snapshot = histogram.snapshot()
+    assert snapshot['count'] == 5
+    assert snapshot['p50_ms'] == 5
+    assert snapshot['p99_ms'] == 1000
+    assert snapshot['max_ms'] == 900
+
+
+def test_span_records_throughput():
+    with metrics.span('parse') as span:
+        span['rows'] = 10
+    snapshot = metrics.snapshot()
+    assert snapshot['timings']['stage.parse']['count'] == 1
+    assert snapshot['throughput']['parse']['rows'] == 10
+
+
+def test_sql_statements_are_counted(tmp_path):
+    db = DatabaseManager(str(tmp_path / 'test.db'))
+    db.get_transactions()
+    snapshot = metrics.snapshot()
+    assert snapshot['counters']['sql.statements.SELECT'] >= 1
+    assert snapshot['timings']['sql.SELECT']['count'] >= 1
+
+
+def test_instrumented_counts_failures_and_profiles():
+    class API:
+        @instrumented
+        def ok(self):
+            return {'success': True}
+
+        @instrumented
+        def fails(self):
+            return {'success': False, 'error': 'boom'}
+
+    api = API()
+    api.ok(profile='cpu')
+    api.fails()
+    assert api.ok(profile='bogus')['success'] is False
+
+    snapshot = metrics.snapshot()
+    assert snapshot['timings']['api.ok']['count'] == 1
+    assert snapshot['counters']['api.fails.errors'] == 1
+    assert snapshot['profiles'][0]['method'] == 'ok'
+    assert 'function calls' in snapshot['profiles'][0]['report']
+
+
+def test_metrics_are_shared_through_the_database(tmp_path):
+    db_path = str(tmp_path / 'test.db')
+    DatabaseManager(db_path)
+
+    # Two registries stand in for two bridge processes
+    first, second = Metrics(), Metrics()
+    first.persist(db_path)
+    second.persist(db_path)
+    try:
+        first.observe('api.get_transactions', 0.004)
+        first.incr('sql.statements.SELECT', 3)
+        first.flush()
+        second.observe('api.get_transactions', 0.3)
+        second.incr('sql.statements.SELECT', 2)
+        second.add_rows('query', 100, 0.5)
+
+        snapshot = second.snapshot()
+        timing = snapshot['timings']['api.get_transactions']
+        assert (timing['count'], timing['min_ms'], timing['max_ms']) == (2, 4.0, 300.0)
+        assert snapshot['counters']['sql.statements.SELECT'] == 5
+        assert snapshot['throughput']['query'] == {'rows': 100, 'rows_per_sec': 200.0}
+
+        first.reset()
+        assert second.snapshot()['counters'] == {}
+    finally:
+        first.persist(None)
+        second.persist(None)
+
+
+def test_metrics_survive_a_busy_store(tmp_path, monkeypatch):
+    db_path = str(tmp_path / 'test.db')
+    monkeypatch.setattr(metrics_module, 'STORE_TIMEOUT', 0.01)
+    registry = Metrics()
+    registry.persist(db_path)
+    holder = sqlite3.connect(store_path(db_path))
+    try:
+        holder.execute("BEGIN IMMEDIATE")
+        registry.incr('api.calls')
+        registry.flush()
+        # Still reported while the store is busy, and saved once it is free
+        assert registry.snapshot()['counters'] == {'api.calls': 1}
+        holder.rollback()
+        registry.flush()
+        assert registry.counters == {}
+        assert registry.snapshot()['counters'] == {'api.calls': 1}
+    finally:
+        holder.close()
+        registry.persist(None)
+
+
+def test_in_memory_database_keeps_metrics_in_process():
+    api = BankAnalyzerAPI(':memory:')
+    api.get_transactions()
+    result = api.get_metrics()
+    assert result['success']
+    assert result['metrics']['timings']['api.get_transactions']['count'] == 1
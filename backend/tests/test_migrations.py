@@ -0,0 +1,126 @@
+"""Tests for versioned schema migrations"""
+
+import sqlite3
+
+from database import migrations
+from database.manager import DatabaseManager
+
+LEGACY_ROWS = """
+    INSERT INTO transactions (id, date, merchant, description, amount, category, created_at)
+    VALUES ('txn_1', '2025-09-02', 'REPUBLIC FITNESS MA', 'ABC*REPUBLIC FITNESS', -83.99, 'Fitness', '2025-09-10 12:00:00'),
+           ('txn_2', '08/19', 'NETFLIX', 'NETFLIX.COM', -15.49, 'Entertainment ', '2025-09-10 12:00:00'),
+           ('txn_3', '12/30', 'PAYROLL', 'ACME PAYROLL', 2500.1, NULL, '2025-01-05 09:00:00'),
+           ('txn_4', 'garbage', 'NETFLIX', 'NETFLIX.COM', 0.1, 'Entertainment', '2025-09-10 12:00:00');
+"""
+
+
+def make_legacy_db(path):
+    conn = sqlite3.connect(path)
+    conn.executescript(migrations.BASE_SCHEMA + LEGACY_ROWS)
+    conn.close()
+
+
+def test_legacy_database_is_migrated(tmp_path):
+    path = str(tmp_path / 'legacy.db')
+    make_legacy_db(path)
+
+    db = DatabaseManager(path)
+    assert migrations.schema_version(db.conn) == migrations.latest_version()
+    columns = [row[1] for row in db.conn.execute("PRAGMA table_info(transactions)")]
+    assert 'amount_cents' in columns and 'category_id' in columns
+    assert 'merchant' not in columns and 'category' not in columns
+
+    raw = {row[0]: row[1:] for row in db.conn.execute(
+        "SELECT id, date, amount_cents FROM transactions"
+    )}
+    assert raw['txn_1'] == (20333, -8399)
+    assert raw['txn_3'] == (20087, 250010)
+    assert raw['txn_4'] == (None, 10)
+
+    transactions = {t['id']: t for t in db.get_transactions()}
+    assert transactions['txn_2']['date'] == '2025-08-19'
+    # No year: placed before the row was created
+    assert transactions['txn_3']['date'] == '2024-12-30'
+    assert transactions['txn_2']['category'] == 'Entertainment'
+    assert transactions['txn_3']['category'] is None
+    assert len(db.get_transactions({'start_date': '2025-08-01', 'end_date': '2025-08-31'})) == 1
+    assert db.get_category_spending('2025-01-01', '2025-12-31') == {
+        'Fitness': 83.99, 'Entertainment': 15.49
+    }
+
+
+def test_interrupted_migration_resumes(tmp_path, monkeypatch):
+    path = str(tmp_path / 'legacy.db')
+    make_legacy_db(path)
+    conn = sqlite3.connect(path)
+
+    calls = []
+    original = migrations.legacy_date_to_days
+
+    def fail_after_first_batch(value, created_at=None):
+        calls.append(value)
+        if len(calls) > 2:
+            raise RuntimeError("interrupted")
+        return original(value, created_at)
+
+    monkeypatch.setattr(migrations, 'legacy_date_to_days', fail_after_first_batch)
+    try:
+        migrations.migrate(conn, batch_size=2)
+    except RuntimeError:
+        pass
+    assert migrations.schema_version(conn) == 1
+    assert migrations.get_setting(conn, 'migration.2.cursor') == '2'
+    conn.close()
+
+    monkeypatch.setattr(migrations, 'legacy_date_to_days', original)
+    db = DatabaseManager(path)
+    assert migrations.schema_version(db.conn) == migrations.latest_version()
+    assert migrations.get_setting(db.conn, 'migration.2.cursor') is None
+    assert len(db.get_transactions()) == 4
+
+
+def test_new_database_round_trip(tmp_path):
+    db = DatabaseManager(str(tmp_path / 'new.db'))
+    assert migrations.schema_version(db.conn) == migrations.latest_version()
+
+    db.save_transaction({
+        'id': 'txn_1', 'date': '2025-09-02', 'merchant': 'NETFLIX',
+        'description': 'NETFLIX.COM', 'amount': -15.49, 'category': 'Entertainment'
+    })
+    assert db.update_transaction('txn_1', {'category': 'Streaming', 'amount': '-16.99'})
+    assert not db.update_transaction('txn_1', {'created_at': 'now'})
+    # Non-ISO dates are rejected rather than stored as NULL
+    assert not db.update_transaction('txn_1', {'date': '09/04/2025'})
+
+    transaction, = db.get_transactions({'category': 'Streaming'})
+    assert transaction['amount'] == -16.99
+    assert transaction['date'] == '2025-09-02'
+    assert 'Streaming' in db.get_all_categories()
+
+
+def test_merchant_labels_are_seeded_from_archived_years(tmp_path):
+    from models.batch import TransactionBatch
+
+    path = str(tmp_path / 'test.db')
+    db = DatabaseManager(path)
+    db.save_batch(TransactionBatch.from_dicts([
+        {'id': 'txn_1', 'date': '2023-03-01', 'merchant': 'REPUBLIC FITNESS', 'description': '',
+         'amount': -83.99, 'category': 'Fitness', 'confidence': 1.0},
+        {'id': 'txn_2', 'date': '2025-03-01', 'merchant': 'NETFLIX', 'description': '',
+         'amount': -15.49, 'category': 'Entertainment', 'confidence': 0.9},
+    ]))
+    db.archive_year(2023)
+    # Back to a database from before merchant_categories existed
+    with db.conn:
+        db.conn.execute("DROP TABLE merchant_categories")
+        migrations.set_setting(db.conn, migrations.SCHEMA_VERSION_KEY, 6)
+    db.close_shards()
+    db.conn.close()
+
+    db = DatabaseManager(path)
+    labels = dict(db.conn.execute("""
+        SELECT m.name, c.name FROM merchant_categories mc
+        JOIN merchants m ON m.id = mc.merchant_id JOIN categories c ON c.id = mc.category_id
+    """).fetchall())
+    assert labels == {'Republic Fitness': 'Fitness', 'Netflix': 'Entertainment'}
+    assert [row[1] for row in db.conn.execute("PRAGMA database_list")] == ['main']
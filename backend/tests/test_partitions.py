@@ -0,0 +1,89 @@
+"""Tests for year-partitioned archive shards"""
+
+import os
+from datetime import date
+
+import pytest
+
+from database import manager
+from database.manager import ArchivedTransactionError, DatabaseManager
+from models.batch import TransactionBatch
+
+THIS_YEAR = date.today().year
+
+
+def make_batch():
+    return TransactionBatch.from_dicts([
+        {'id': 'txn_old', 'date': '2022-03-01', 'merchant': 'NETFLIX', 'description': 'NETFLIX.COM',
+         'amount': -15.49, 'category': 'Entertainment'},
+        {'id': 'txn_mid', 'date': '2023-07-04', 'merchant': 'REPUBLIC FITNESS', 'description': 'GYM',
+         'amount': -83.99, 'category': 'Fitness'},
+        {'id': 'txn_new', 'date': f'{THIS_YEAR}-01-02', 'merchant': 'NETFLIX', 'description': 'NETFLIX.COM',
+         'amount': -15.49, 'category': 'Entertainment'},
+    ])
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = DatabaseManager(str(tmp_path / 'bank.db'))
+    db.save_batch(make_batch())
+    return db
+
+
+def test_closed_years_move_to_shards(db, tmp_path):
+    archived = db.archive_closed_years()
+    assert [entry['year'] for entry in archived] == [2022, 2023]
+    assert os.path.exists(tmp_path / 'bank_2022.db')
+    assert db.conn.execute("SELECT COUNT(*) FROM main.transactions").fetchone()[0] == 1
+
+    # Hot queries never attach a shard
+    recent = db.get_transactions({'start_date': f'{THIS_YEAR}-01-01'})
+    assert [t['id'] for t in recent] == ['txn_new']
+    assert not db._attached
+
+    assert [t['id'] for t in db.get_transactions()] == ['txn_new', 'txn_mid', 'txn_old']
+    assert db.get_transactions({'merchant': 'Netflix', 'end_date': '2022-12-31'})[0]['id'] == 'txn_old'
+    assert db.get_category_spending('2022-01-01', f'{THIS_YEAR}-12-31') == {
+        'Fitness': 83.99, 'Entertainment': 30.98
+    }
+
+
+def test_queries_over_many_shards_are_merged(db, monkeypatch):
+    db.archive_closed_years()
+    monkeypatch.setattr(manager, 'MAX_ATTACHED_SHARDS', 1)
+    batch = db.get_transactions_batch()
+    assert batch.ids == ['txn_new', 'txn_mid', 'txn_old']
+    assert len(db._attached) == 1
+
+
+def test_archived_rows_are_read_only(db):
+    db.archive_closed_years()
+    with pytest.raises(ArchivedTransactionError):
+        db.update_transaction('txn_old', {'category': 'Streaming'})
+    with pytest.raises(ArchivedTransactionError):
+        db.delete_transaction('txn_mid')
+
+    # Re-importing an archived statement does not duplicate rows
+    assert db.save_batch(make_batch()) == 1
+    assert len(db.get_transactions()) == 3
+    # ... even when the parser gave them fresh ids
+    reimport = make_batch()
+    reimport.ids = [f'{txn_id}_again' for txn_id in reimport.ids]
+    assert db.save_batch(reimport) == 0
+    assert len(db.get_transactions()) == 3
+
+
+def test_current_year_cannot_be_archived(db):
+    with pytest.raises(ValueError):
+        db.archive_year(THIS_YEAR)
+
+
+def test_archiving_again_merges_into_the_shard(db):
+    assert db.archive_year(2023) == 1
+    db.save_transaction({'id': 'txn_late', 'date': '2023-12-30', 'merchant': 'NETFLIX',
+                         'description': 'NETFLIX.COM', 'amount': -15.49, 'category': 'Entertainment'})
+    assert db.archive_year(2023) == 1
+    assert db.conn.execute("SELECT row_count FROM partitions WHERE year = 2023").fetchone()[0] == 2
+    assert [t['id'] for t in db.get_transactions({'end_date': '2023-12-31', 'start_date': '2023-01-01'})] == [
+        'txn_late', 'txn_mid'
+    ]
@@ -0,0 +1,94 @@
+"""Tests for incremental recurring-charge and anomaly detection"""
+
+from database.manager import DatabaseManager
+from models.batch import TransactionBatch
+
+
+def charges(merchant, dates, amounts, prefix):
+    return [
+        {'id': f'{prefix}_{i}', 'date': day, 'merchant': merchant, 'description': merchant,
+         'amount': amount, 'category': 'Uncategorized'}
+        for i, (day, amount) in enumerate(zip(dates, amounts))
+    ]
+
+
+MONTHS = ['2025-01-03', '2025-02-03', '2025-03-03', '2025-04-03', '2025-05-03', '2025-06-03']
+
+
+def make_db(tmp_path):
+    db = DatabaseManager(str(tmp_path / 'bank.db'))
+    # Imported one statement at a time
+    for month in range(4):
+        rows = (
+            charges('NETFLIX', MONTHS[month:month + 1], [-15.49], f'nf{month}')
+            + charges('GYM', MONTHS[month:month + 1], [-80.0], f'gym{month}')
+        )
+        db.save_batch(TransactionBatch.from_dicts(rows))
+    db.save_batch(TransactionBatch.from_dicts(
+        charges('NETFLIX', MONTHS[4:6], [-17.99, -17.99], 'nf_late')
+        + charges('COFFEE', ['2025-05-01', '2025-05-08', '2025-05-20', '2025-06-10'],
+                  [-4.5, -4.75, -4.5, -45.0], 'coffee')
+    ))
+    return db
+
+
+def test_recurring_charges_and_anomalies(tmp_path):
+    db = make_db(tmp_path)
+
+    recurring = {item['merchant']: item for item in db.recurring.get_recurring()}
+    assert set(recurring) == {'Netflix', 'Gym'}
+    assert recurring['Netflix']['cadence'] == 'monthly'
+    assert recurring['Netflix']['last_amount'] == 17.99
+    assert recurring['Netflix']['status'] == 'active'
+    # Last gym charge was in April; data runs to June
+    assert recurring['Gym']['status'] == 'missed'
+
+    kinds = {(item['merchant'], item['kind']) for item in db.recurring.get_anomalies()}
+    assert kinds == {
+        ('Netflix', 'new_subscription'), ('Gym', 'new_subscription'),
+        ('Netflix', 'price_change'), ('Gym', 'missed'), ('Coffee', 'outlier'),
+    }
+
+
+def test_incremental_state_matches_rebuild(tmp_path):
+    db = make_db(tmp_path)
+    # Re-importing rows must not count them twice
+    db.save_batch(TransactionBatch.from_dicts(charges('NETFLIX', MONTHS[4:6], [-17.99, -17.99], 'nf_late')))
+    # ... even when the parser gave them fresh ids
+    assert db.save_batch(TransactionBatch.from_dicts(
+        charges('NETFLIX', MONTHS[:6], [-15.49] * 4 + [-17.99] * 2, 'nf_again')
+    )) == 0
+
+    def state():
+        return db.conn.execute("SELECT * FROM merchant_stats ORDER BY merchant_id").fetchall()
+
+    before = [tuple(row)[:-1] for row in state()]
+    anomalies = db.conn.execute("SELECT COUNT(*) FROM anomalies").fetchone()[0]
+    db.rebuild_merchant_stats()
+    assert [tuple(row)[:-1] for row in state()] == before
+    assert db.conn.execute("SELECT COUNT(*) FROM anomalies").fetchone()[0] == anomalies
+
+    db.delete_transaction('coffee_3')
+    assert 'Coffee' not in {item['merchant'] for item in db.recurring.get_anomalies()}
+
+
+def test_identical_charges_are_kept_once_each(tmp_path):
+    db = DatabaseManager(str(tmp_path / 'bank.db'))
+    rows = charges('COFFEE', ['2025-05-01', '2025-05-01'], [-4.5, -4.5], 'a')
+    assert db.save_batch(TransactionBatch.from_dicts(rows)) == 2
+    # A statement overlapping the first import adds only its new charge
+    rows = charges('COFFEE', ['2025-05-01', '2025-05-01', '2025-05-01'], [-4.5] * 3, 'b')
+    assert db.save_batch(TransactionBatch.from_dicts(rows)) == 1
+    assert db.conn.execute("SELECT charge_count FROM merchant_stats").fetchone()[0] == 3
+
+
+def test_backfilled_charges_rebuild_the_merchant(tmp_path):
+    db = DatabaseManager(str(tmp_path / 'bank.db'))
+    db.save_batch(TransactionBatch.from_dicts(charges('NETFLIX', MONTHS[5:], [-15.49], 'june')))
+    # Older statements imported afterwards
+    db.save_batch(TransactionBatch.from_dicts(charges('NETFLIX', MONTHS[:5], [-15.49] * 5, 'early')))
+
+    netflix, = db.recurring.get_recurring()
+    assert netflix['cadence'] == 'monthly'
+    assert netflix['charges'] == 6
+    assert netflix['last_date'] == MONTHS[5]
@@ -0,0 +1,45 @@
+"""Tests for response serialization"""
+
+import json
+
+import pytest
+
+from models.batch import TransactionBatch
+from utils import serializer
+
+
+@pytest.mark.parametrize('name', ['json', 'auto'])
+def test_streamed_output_matches_dumps(name):
+    result = {
+        'success': True,
+        'transactions': [{'id': f"txn_{i}", 'amount': -i / 100} for i in range(25)],
+        'total': 25
+    }
+    streamed = b''.join(serializer.iter_dumps(result, name, chunk_size=4))
+    assert json.loads(streamed) == json.loads(serializer.dumps(result, name)) == result
+
+
+def test_to_columnar():
+    rows = [{'name': 'Fitness', 'value': 83.99}, {'name': 'Parking', 'value': 33.0}]
+    assert serializer.to_columnar(rows) == {
+        'length': 2,
+        'columns': {'name': ['Fitness', 'Parking'], 'value': [83.99, 33.0]}
+    }
+    assert serializer.to_columnar([]) == {'length': 0, 'columns': {}}
+
+
+def test_batch_columns():
+    batch = TransactionBatch()
+    batch.append('txn_1', 0, 'A', 'A', -150, 'Fitness', 1.0)
+    batch.append('txn_2', 1, 'B', 'B', 200)
+    columns = batch.to_columns()
+    assert columns['columns']['date'] == ['1970-01-01', '1970-01-02']
+    assert columns['columns']['amount'] == [-1.5, 2.0]
+    assert [columns['categories'][code] for code in columns['columns']['category']] == [
+        'Fitness', 'Uncategorized'
+    ]
+
+
+def test_unknown_wire_format():
+    with pytest.raises(ValueError):
+        serializer.check_wire_format('xml')
@@ -0,0 +1,86 @@
+"""Tests for the nearest-merchant index"""
+
+import pytest
+
+from database.manager import DatabaseManager
+from ml.categorizer import MLCategorizer
+from ml.similarity import MerchantIndex
+from models.batch import TransactionBatch
+
+
+def test_similar_payees_share_a_category():
+    index = MerchantIndex()
+    index.add('Oliveiras Steakhouse', 'Food & Dining')
+    index.add('Star Market', 'Groceries')
+    index.add('Shell Oil', 'Auto')
+
+    category, confidence = index.predict('Oliveira Steak House')
+    assert category == 'Food & Dining'
+    assert 0.0 < confidence < 0.9
+    assert index.predict('Completely Unrelated') is None
+
+
+def test_categorizer_falls_back_to_index():
+    categorizer = MLCategorizer()
+    categorizer.train([{'merchant': 'TST* OLIVEIRAS STEAKHOUSE 12 MA', 'category': 'Food & Dining'}])
+
+    category, confidence = categorizer.categorize({
+        'merchant': 'TST* OLIVEIRAS STEAKHOUSE 345 MA', 'description': '', 'amount': -42.0
+    })
+    assert category == 'Food & Dining'
+    assert confidence < 0.9
+    # Rules still win
+    assert categorizer.categorize({'merchant': 'Netflix', 'description': '', 'amount': -1})[1] == 0.9
+
+
+def test_labels_persist_in_database(tmp_path):
+    db = DatabaseManager(str(tmp_path / 'bank.db'))
+    db.save_batch(TransactionBatch.from_dicts([
+        {'id': 'txn_1', 'date': '2025-01-05', 'merchant': 'Oliveiras Steakhouse',
+         'description': '', 'amount': -40.0, 'category': 'Food & Dining', 'confidence': 1.0},
+        # Guesses below the label threshold are not learned
+        {'id': 'txn_2', 'date': '2025-01-06', 'merchant': 'Star Market',
+         'description': '', 'amount': -20.0, 'category': 'Groceries', 'confidence': 0.6},
+    ]))
+    db.update_transaction('txn_1', {'category': 'Restaurants', 'confidence': 1.0})
+
+    index = MerchantIndex.from_db(db.conn)
+    assert index.names == ['Oliveiras Steakhouse']
+    assert index.predict('Oliveiras Steakhouse')[0] == 'Restaurants'
+
+
+def test_index_is_loaded_only_when_needed():
+    loads = []
+
+    def load():
+        loads.append(1)
+        index = MerchantIndex()
+        index.add('Oliveiras Steakhouse', 'Food & Dining')
+        return index
+
+    categorizer = MLCategorizer(load_index=load)
+    categorizer.train([{'merchant': 'Star Market', 'category': 'Groceries'}])
+    assert categorizer.categorize({'merchant': 'Netflix', 'description': '', 'amount': -1})[0] == 'Entertainment'
+    assert loads == []
+
+    assert categorizer.categorize({'merchant': 'Oliveira Steak House', 'description': '', 'amount': -1})[0] == 'Food & Dining'
+    assert loads == [1]
+
+
+def test_built_index_is_reused_until_labels_change(tmp_path, monkeypatch):
+    db = DatabaseManager(str(tmp_path / 'bank.db'))
+    db.save_batch(TransactionBatch.from_dicts([
+        {'id': 'txn_1', 'date': '2025-01-05', 'merchant': 'Oliveiras Steakhouse',
+         'description': '', 'amount': -40.0, 'category': 'Food & Dining', 'confidence': 1.0},
+    ]))
+    cache_path = str(tmp_path / 'bank.db.index')
+    built = MerchantIndex.from_db(db.conn, cache_path)
+
+    monkeypatch.setattr(MerchantIndex, '_reweight', lambda self: pytest.fail('index was rebuilt'))
+    loaded = MerchantIndex.from_db(db.conn, cache_path)
+    assert loaded.names == built.names
+    assert loaded.predict('Oliveira Steak House') == built.predict('Oliveira Steak House')
+    monkeypatch.undo()
+
+    db.update_transaction('txn_1', {'category': 'Restaurants', 'confidence': 1.0})
+    assert MerchantIndex.from_db(db.conn, cache_path).predict('Oliveiras Steakhouse')[0] == 'Restaurants'
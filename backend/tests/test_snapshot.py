@@ -0,0 +1,143 @@
+"""Tests for online snapshots and restore"""
+
+import json
+import os
+import sqlite3
+
+import pytest
+
+from database import snapshot
+from database.manager import DatabaseManager
+from database.migrations import latest_version, schema_version
+from models.batch import TransactionBatch
+from utils.metrics import InstrumentedConnection
+
+
+def rows(prefix, dates, category='Entertainment'):
+    return TransactionBatch.from_dicts([
+        {'id': f'{prefix}_{i}', 'date': day, 'merchant': 'NETFLIX', 'description': 'NETFLIX.COM',
+         'amount': -15.49, 'category': category, 'confidence': 1.0}
+        for i, day in enumerate(dates)
+    ])
+
+
+def state(db):
+    return [(t['id'], t['date'], t['merchant'], t['amount'], t['category']) for t in db.get_transactions()]
+
+
+def test_full_and_incremental_snapshots_restore(tmp_path):
+    db = DatabaseManager(str(tmp_path / 'bank.db'))
+    db.save_batch(rows('old', ['2023-01-05', '2023-02-05']))
+    db.save_batch(rows('new', ['2025-01-05', '2025-02-05']))
+    db.archive_year(2023)
+    full_state = state(db)
+
+    full = snapshot.create_snapshot(db, str(tmp_path / 'full'), compression='gzip')
+    assert {entry['role'] for entry in full['files']} == {'main', 'shard'}
+
+    db.save_batch(rows('later', ['2025-03-05'], category='Streaming'))
+    db.update_transaction('new_0', {'category': 'Streaming'})
+    db.delete_transaction('new_1')
+    incremental_state = state(db)
+
+    incremental = snapshot.create_snapshot(db, str(tmp_path / 'incr'), incremental=True)
+    changes, = incremental['files']
+    assert changes['role'] == 'changes' and changes['rows'] < 20
+    assert db.conn.execute("SELECT COUNT(*) FROM change_log").fetchone()[0] == 0
+
+    db.save_batch(rows('unsaved', ['2025-04-05']))
+    snapshot.restore_snapshot(db, str(tmp_path / 'full'))
+    assert state(db) == full_state
+    # Cached ids from before the restore are not reused
+    db.save_batch(rows('after', ['2025-05-05'], category='Movies'))
+    assert db.get_transactions({'category': 'Movies'})[0]['merchant'] == 'Netflix'
+
+    snapshot.restore_snapshot(db, str(tmp_path / 'incr'))
+    assert state(db) == incremental_state
+
+
+def test_corrupted_snapshot_is_rejected(tmp_path):
+    db = DatabaseManager(str(tmp_path / 'bank.db'))
+    db.save_batch(rows('txn', ['2025-01-05']))
+    manifest = snapshot.create_snapshot(db, str(tmp_path / 'snap'))
+
+    with open(os.path.join(tmp_path, 'snap', manifest['files'][0]['name']), 'r+b') as f:
+        f.seek(200)
+        f.write(b'corrupt')
+    with pytest.raises(ValueError):
+        snapshot.restore_snapshot(db, str(tmp_path / 'snap'))
+    assert len(db.get_transactions()) == 1
+
+
+def test_failed_restore_keeps_live_shards(tmp_path, monkeypatch):
+    db = DatabaseManager(str(tmp_path / 'bank.db'))
+    db.save_batch(rows('old', ['2023-01-05']))
+    db.archive_year(2023)
+    snapshot.create_snapshot(db, str(tmp_path / 'snap'))
+    db.save_batch(rows('late', ['2023-03-05']))
+    db.archive_year(2023)
+    before = state(db)
+
+    def fail(*args, **kwargs):
+        raise sqlite3.OperationalError('disk I/O error')
+
+    monkeypatch.setattr(InstrumentedConnection, 'backup', fail)
+    with pytest.raises(sqlite3.OperationalError):
+        snapshot.restore_snapshot(db, str(tmp_path / 'snap'))
+    assert state(db) == before
+    assert not [name for name in os.listdir(tmp_path) if name.startswith('.restore-')]
+
+
+def test_incremental_needs_a_previous_snapshot(tmp_path):
+    db = DatabaseManager(str(tmp_path / 'bank.db'))
+    with pytest.raises(ValueError):
+        snapshot.create_snapshot(db, str(tmp_path / 'snap'), incremental=True)
+
+
+def downgrade(directory, version, drop=()):
+    """Make a full snapshot look like one taken by an older schema version"""
+    manifest = snapshot.load_manifest(directory)
+    entry, = [entry for entry in manifest['files'] if entry['role'] == 'main']
+    conn = sqlite3.connect(os.path.join(directory, entry['name']))
+    with conn:
+        for table in drop:
+            conn.execute(f"DROP TABLE {table}")
+        conn.execute("UPDATE settings SET value = ? WHERE key = 'schema_version'", (str(version),))
+    conn.close()
+    entry['sha256'] = snapshot._sha256(os.path.join(directory, entry['name']))
+    manifest['schema_version'] = version
+    with open(os.path.join(directory, snapshot.MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f)
+
+
+def test_old_schema_snapshot_is_migrated_on_restore(tmp_path):
+    db = DatabaseManager(str(tmp_path / 'bank.db'))
+    db.save_batch(rows('old', ['2023-01-05']))
+    db.archive_year(2023)
+    db.save_batch(rows('new', ['2025-01-05']))
+    full_state = state(db)
+    snapshot.create_snapshot(db, str(tmp_path / 'v6'))
+    # Taken before merchant_categories (7) and jobs (9) existed
+    downgrade(str(tmp_path / 'v6'), 6, drop=('merchant_categories', 'jobs'))
+
+    db.save_batch(rows('unsaved', ['2025-02-05']))
+    snapshot.restore_snapshot(db, str(tmp_path / 'v6'))
+    assert state(db) == full_state
+    assert schema_version(db.conn) == latest_version()
+    assert db.conn.execute("SELECT COUNT(*) FROM merchant_categories").fetchone()[0] == 1
+    db.save_batch(rows('after', ['2025-03-05']))
+    assert len(db.get_transactions()) == 3
+    assert not [name for name in os.listdir(tmp_path) if name.startswith('.restore-')]
+
+
+def test_newer_schema_snapshot_is_rejected(tmp_path):
+    db = DatabaseManager(str(tmp_path / 'bank.db'))
+    db.save_batch(rows('txn', ['2025-01-05']))
+    snapshot.create_snapshot(db, str(tmp_path / 'future'))
+    downgrade(str(tmp_path / 'future'), latest_version() + 1)
+    db.save_batch(rows('kept', ['2025-02-05']))
+
+    with pytest.raises(ValueError, match='newer'):
+        snapshot.restore_snapshot(db, str(tmp_path / 'future'))
+    assert len(db.get_transactions()) == 2
+    assert schema_version(db.conn) == latest_version()
@@ -2,6 +2,7 @@
 
 import re
 from datetime import datetime
+from functools import lru_cache
 from typing import Any
 
 
@@ -43,23 +44,50 @@ def normalize_date(date_str: str) -> str:
     return date_str
 
 
+# Merchant normalization pipeline, compiled once at import
+_MERCHANT_QUOTES = re.compile(r'["\']')
+_MERCHANT_SPACES = re.compile(r'\s+')
+_MERCHANT_PREFIXES = re.compile(
+    r'^(?:(?:PURCHASE|POS|DEBIT|CARD|PAYMENT)\b\s*|(?:WL|SQSP|ABC|TST|SQ)\s?\*\s*)+'
+)
+# Store numbers, phone numbers and reference codes, plus whatever follows
+_MERCHANT_CODES = re.compile(r'(?:#\s*\d+|\s\d[\d-]{2,}).*$')
+_MERCHANT_STARS = re.compile(r'\s*\*\s*')
+# US state codes that statements append to the payee
+_STATE_CODES = frozenset(
+    'AL AK AZ AR CA CO CT DE DC FL GA HI ID IL IN IA KS KY LA ME MD MA MI MN MS MO MT '
+    'NE NV NH NJ NM NY NC ND OH OK OR PA PR RI SC SD TN TX UT VT VA WA WV WI WY'.split()
+)
+
+
+@lru_cache(maxsize=65536)
 def extract_merchant_name(description: str) -> str:
-    """Extract clean merchant name from transaction description"""
-    # Remove common transaction prefixes
-    prefixes = [
-        'PURCHASE', 'POS', 'DEBIT', 'CARD', 'PAYMENT',
-        'WL *', 'SQSP* ', 'ABC*'
-    ]
+    """
+    Extract clean merchant name from transaction description
     
-    cleaned = description.upper()
-    for prefix in prefixes:
-        if cleaned.startswith(prefix):
-            cleaned = cleaned[len(prefix):].strip()
+    This is the canonical normalization used for the merchants table, so
+    the same payee always maps to the same name, e.g.
+    "ABC*REPUBLIC FITNESS 617-5471229 MA" -> "Republic Fitness".
+    Results are memoized since statements repeat the same payees.
+    """
+    cleaned = _MERCHANT_QUOTES.sub('', str(description)).upper()
+    cleaned = _MERCHANT_SPACES.sub(' ', cleaned).strip()
+    
+    # Remove common transaction prefixes
+    cleaned = _MERCHANT_PREFIXES.sub('', cleaned)
     
     # Remove trailing transaction codes
-    cleaned = re.sub(r'#\d+.*$', '', cleaned)
-    cleaned = re.sub(r'\d{10,}.*$', '', cleaned)
+    cleaned = _MERCHANT_CODES.sub('', cleaned)
+    cleaned = _MERCHANT_STARS.sub(' ', cleaned).strip()
+    
+    # Drop domains after the first word ("AMAZON WEB SERVICES AWS.AMAZON.COWA")
+    words = cleaned.split()
+    words = words[:1] + [word for word in words[1:] if '.' not in word]
     
-    # Take first few words
-    words = cleaned.split()[:3]
-    return ' '.join(words).title() if words else description[:30]
+    # Take first few words, without trailing state codes. Stripping after
+    # truncating (and repeatedly) keeps the result a fixed point.
+    words = words[:3]
+    while len(words) > 1 and words[-1] in _STATE_CODES:
+        words.pop()
+    merchant = ' '.join(words)
+    return merchant.title() if merchant else str(description).strip()[:30]
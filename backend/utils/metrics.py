@@ -0,0 +1,494 @@
+"""Timing, counters and profiling for backend hot paths"""
+
+import bisect
+import cProfile
+import functools
+import io
+import json
+import pstats
+import sqlite3
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Histogram bucket upper bounds in milliseconds
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+PROFILE_MODES = ('cpu', 'memory')
+
+# Profiles kept for get_metrics()
+MAX_PROFILES = 20
+
+# Seconds to wait for another process's write lock when saving metrics;
+# past that the metrics stay buffered until the next flush
+STORE_TIMEOUT = 0.1
+
+STORE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS metrics (
+        kind TEXT NOT NULL,
+        name TEXT NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        total REAL NOT NULL DEFAULT 0,
+        min REAL,
+        max REAL,
+        buckets TEXT,
+        since TEXT,
+        PRIMARY KEY (kind, name)
+    );
+
+    CREATE TABLE IF NOT EXISTS metric_profiles (
+        id INTEGER PRIMARY KEY,
+        method TEXT NOT NULL,
+        mode TEXT NOT NULL,
+        captured_at TEXT,
+        report TEXT
+    );
+"""
+
+
+def store_path(db_path: Optional[str]) -> Optional[str]:
+    """
+    Metrics file shared by every process using a database
+
+    Metrics live next to the database rather than in it, so saving them
+    never takes the database's write lock. In-memory databases have none.
+    """
+    if not db_path or db_path == ':memory:':
+        return None
+    return f"{db_path}.metrics"
+
+
+class Histogram:
+    """Fixed-bucket latency histogram"""
+
+    __slots__ = ('counts', 'count', 'total', 'min', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, seconds: float) -> None:
+        ms = seconds * 1000
+        self.counts[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        self.min = ms if self.min is None else min(self.min, ms)
+        self.max = ms if self.max is None else max(self.max, ms)
+
+    def merge(self, other: 'Histogram') -> None:
+        """Add another histogram's observations to this one"""
+        if not other.count:
+            return
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.total += other.total
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-th quantile"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return BUCKETS_MS[i] if i < len(BUCKETS_MS) else self.max
+        return self.max
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'count': self.count,
+            'total_ms': round(self.total, 3),
+            'mean_ms': round(self.total / self.count, 3) if self.count else None,
+            'min_ms': round(self.min, 3) if self.min is not None else None,
+            'max_ms': round(self.max, 3) if self.max is not None else None,
+            'p50_ms': self.percentile(0.50),
+            'p95_ms': self.percentile(0.95),
+            'p99_ms': self.percentile(0.99),
+            'buckets': {
+                (f"le_{BUCKETS_MS[i]}" if i < len(BUCKETS_MS) else 'inf'): n
+                for i, n in enumerate(self.counts) if n
+            },
+        }
+
+
+class Metrics:
+    """
+    Thread-safe registry of timings, counters and captured profiles
+
+    Each bridge call runs in a new process, so once persist() is given a
+    database the registry is only a buffer: flush() merges it into the
+    shared metrics file and snapshot() reports the combined totals.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._store_lock = threading.Lock()
+        self._store: Optional[sqlite3.Connection] = None
+        self.reset()
+
+    def persist(self, db_path: Optional[str]) -> None:
+        """
+        Share metrics with other processes using a database (see store_path)
+
+        None or an in-memory database keeps them in this process.
+        """
+        path = store_path(db_path)
+        with self._store_lock:
+            if self._store is not None:
+                self._store.close()
+                self._store = None
+            if path is None:
+                return
+            store = sqlite3.connect(path, timeout=STORE_TIMEOUT, check_same_thread=False)
+            try:
+                store.execute("PRAGMA journal_mode=WAL")
+                store.executescript(STORE_SCHEMA)
+            except sqlite3.Error as e:
+                store.close()
+                logger.warning(f"Could not open metrics store {path}: {e}")
+                return
+            self._store = store
+
+    def reset(self) -> None:
+        with self._lock:
+            self._clear()
+        with self._store_lock:
+            if self._store is not None:
+                with self._store:
+                    self._store.execute("DELETE FROM metrics")
+                    self._store.execute("DELETE FROM metric_profiles")
+
+    def _clear(self) -> None:
+        self.timings: Dict[str, Histogram] = {}
+        self.counters: Dict[str, int] = {}
+        self.rows: Dict[str, int] = {}
+        self.row_seconds: Dict[str, float] = {}
+        self.profiles = deque(maxlen=MAX_PROFILES)
+        self.started_at = datetime.now().isoformat(timespec='seconds')
+
+    def observe(self, name: str, seconds: float) -> None:
+        """Record a duration under a histogram name"""
+        with self._lock:
+            histogram = self.timings.get(name)
+            if histogram is None:
+                histogram = self.timings[name] = Histogram()
+            histogram.observe(seconds)
+
+    def incr(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def add_rows(self, stage: str, rows: int, seconds: float) -> None:
+        """Record rows processed by a stage, for rows/sec"""
+        with self._lock:
+            self.rows[stage] = self.rows.get(stage, 0) + rows
+            self.row_seconds[stage] = self.row_seconds.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def span(self, stage: str, rows: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Time a pipeline stage (parse, categorize, insert, query, serialize)
+
+        The yielded dict can be updated with ``rows`` when the row count is
+        only known once the stage has run.
+        """
+        info = {'rows': rows}
+        start = time.perf_counter()
+        try:
+            yield info
+        finally:
+            elapsed = time.perf_counter() - start
+            self.observe(f"stage.{stage}", elapsed)
+            if info['rows'] is not None:
+                self.add_rows(stage, info['rows'], elapsed)
+
+    def add_profile(self, profile: Dict[str, Any]) -> None:
+        with self._lock:
+            self.profiles.append(profile)
+
+    def flush(self) -> None:
+        """Merge everything recorded since the last flush into the store"""
+        if self._store is None:
+            return
+        with self._lock:
+            recorded = (self.timings, self.counters, self.rows, self.row_seconds,
+                        list(self.profiles), self.started_at)
+            self._clear()
+        try:
+            with self._store_lock:
+                if self._store is not None:
+                    self._merge(self._store, *recorded)
+                    return
+        except sqlite3.Error as e:
+            logger.warning(f"Could not save metrics, keeping them for the next flush: {e}")
+        self._restore(*recorded)
+
+    def _restore(self, timings, counters, rows, row_seconds, profiles, since) -> None:
+        """Put back metrics taken by a flush that could not save them"""
+        with self._lock:
+            self._add((self.timings, self.counters, self.rows, self.row_seconds),
+                      (timings, counters, rows, row_seconds))
+            self.profiles = deque(profiles + list(self.profiles), maxlen=MAX_PROFILES)
+            self.started_at = min(self.started_at, since)
+
+    @staticmethod
+    def _add(totals, more) -> None:
+        """Add (timings, counters, rows, row_seconds) dicts into another such tuple"""
+        timings, counters, rows, row_seconds = totals
+        for name, histogram in more[0].items():
+            timings.setdefault(name, Histogram()).merge(histogram)
+        for name, value in more[1].items():
+            counters[name] = counters.get(name, 0) + value
+        for name, value in more[2].items():
+            rows[name] = rows.get(name, 0) + value
+            row_seconds[name] = row_seconds.get(name, 0.0) + more[3][name]
+
+    @staticmethod
+    def _merge(conn: sqlite3.Connection, timings, counters, rows, row_seconds,
+               profiles, since) -> None:
+        with conn:
+            # Lock first so concurrent processes cannot interleave merges
+            conn.execute("BEGIN IMMEDIATE")
+            stored = {
+                (kind, name): (count, total, low, high, buckets, first)
+                for kind, name, count, total, low, high, buckets, first in conn.execute(
+                    "SELECT kind, name, count, total, min, max, buckets, since FROM metrics"
+                )
+            }
+
+            merged = []
+            for name, histogram in timings.items():
+                count, total, low, high, buckets, first = stored.get(('timing', name)) or (
+                    0, 0.0, None, None, None, since)
+                combined = Histogram()
+                if buckets:
+                    combined.counts = json.loads(buckets)
+                combined.count, combined.total, combined.min, combined.max = count, total, low, high
+                combined.merge(histogram)
+                merged.append(('timing', name, combined.count, combined.total, combined.min,
+                               combined.max, json.dumps(combined.counts), first))
+            for kind, values, totals in (('counter', counters, {}), ('rows', rows, row_seconds)):
+                for name, value in values.items():
+                    count, total, _, _, _, first = stored.get((kind, name)) or (
+                        0, 0.0, None, None, None, since)
+                    merged.append((kind, name, count + value, total + totals.get(name, 0.0),
+                                   None, None, None, first))
+
+            conn.executemany(
+                "INSERT OR REPLACE INTO metrics (kind, name, count, total, min, max, buckets, since) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", merged
+            )
+            if profiles:
+                conn.executemany(
+                    "INSERT INTO metric_profiles (method, mode, captured_at, report) VALUES (?, ?, ?, ?)",
+                    [(p['method'], p['mode'], p['captured_at'], p['report']) for p in profiles]
+                )
+                conn.execute(
+                    "DELETE FROM metric_profiles WHERE id <= "
+                    "(SELECT MAX(id) FROM metric_profiles) - ?", (MAX_PROFILES,)
+                )
+
+    def snapshot(self) -> Dict[str, Any]:
+        """JSON-serialisable view of everything recorded so far"""
+        if self._store is not None:
+            self.flush()
+            with self._store_lock:
+                if self._store is not None:
+                    return self._stored_snapshot(self._store)
+        with self._lock:
+            return self._report(self.timings, self.counters, self.rows, self.row_seconds,
+                                list(self.profiles), self.started_at)
+
+    def _stored_snapshot(self, conn: sqlite3.Connection) -> Dict[str, Any]:
+        timings: Dict[str, Histogram] = {}
+        counters: Dict[str, int] = {}
+        rows: Dict[str, int] = {}
+        row_seconds: Dict[str, float] = {}
+        since = None
+        for kind, name, count, total, low, high, buckets, first in conn.execute(
+            "SELECT kind, name, count, total, min, max, buckets, since FROM metrics"
+        ):
+            since = first if since is None else min(since, first)
+            if kind == 'timing':
+                histogram = timings[name] = Histogram()
+                histogram.counts = json.loads(buckets)
+                histogram.count, histogram.total, histogram.min, histogram.max = count, total, low, high
+            elif kind == 'counter':
+                counters[name] = count
+            else:
+                rows[name], row_seconds[name] = count, total
+        profiles = [
+            {'method': method, 'mode': mode, 'captured_at': captured_at, 'report': report}
+            for method, mode, captured_at, report in conn.execute(
+                "SELECT method, mode, captured_at, report FROM metric_profiles ORDER BY id"
+            )
+        ]
+        # Plus anything a failed flush left buffered
+        with self._lock:
+            self._add((timings, counters, rows, row_seconds),
+                      (self.timings, self.counters, self.rows, self.row_seconds))
+            profiles = (profiles + list(self.profiles))[-MAX_PROFILES:]
+        return self._report(timings, counters, rows, row_seconds, profiles,
+                            since or self.started_at)
+
+    @staticmethod
+    def _report(timings, counters, rows, row_seconds, profiles, since) -> Dict[str, Any]:
+        return {
+            'since': since,
+            'timings': {name: h.snapshot() for name, h in sorted(timings.items())},
+            'counters': dict(sorted(counters.items())),
+            'throughput': {
+                stage: {
+                    'rows': count,
+                    'rows_per_sec': round(count / row_seconds[stage], 1)
+                    if row_seconds[stage] > 0 else None,
+                }
+                for stage, count in sorted(rows.items())
+            },
+            'profiles': profiles,
+        }
+
+
+# Process-wide registry
+metrics = Metrics()
+
+
+def _statement_kind(sql: str) -> str:
+    words = sql.lstrip().split(None, 1)
+    return words[0].upper() if words else 'EMPTY'
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """
+    sqlite3 connection that times every execute call
+
+    Durations are recorded per statement kind (``sql.SELECT``,
+    ``sql.INSERT`` ...). SELECT timings cover preparing the statement and
+    its first step; fetching the rest of the rows is covered by the
+    ``query`` stage span. Pass as ``sqlite3.connect(..., factory=...)``.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Counts every statement SQLite runs, including each executemany
+        # row and statements inside executescript
+        self.set_trace_callback(self._trace)
+
+    @staticmethod
+    def _trace(sql: str) -> None:
+        metrics.incr(f"sql.statements.{_statement_kind(sql)}")
+
+    def execute(self, sql, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, *args, **kwargs)
+        finally:
+            metrics.observe(f"sql.{_statement_kind(sql)}", time.perf_counter() - start)
+
+    def executemany(self, sql, parameters, *args, **kwargs):
+        # Rows are counted here rather than by the trace callback, which
+        # would expand the SQL for every row (and again for every trigger
+        # statement the row fires)
+        kind = _statement_kind(sql)
+        rows = 0
+
+        def counted():
+            nonlocal rows
+            for params in parameters:
+                rows += 1
+                yield params
+
+        start = time.perf_counter()
+        self.set_trace_callback(None)
+        try:
+            return super().executemany(sql, counted(), *args, **kwargs)
+        finally:
+            self.set_trace_callback(self._trace)
+            metrics.observe(f"sql.{kind}_MANY", time.perf_counter() - start)
+            metrics.incr(f"sql.statements.{kind}", rows)
+
+    def executescript(self, sql, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().executescript(sql, *args, **kwargs)
+        finally:
+            metrics.observe("sql.SCRIPT", time.perf_counter() - start)
+
+
+def _run_profiled(mode: str, fn: Callable[[], Any]) -> Tuple[Any, str]:
+    """Run fn under cProfile or tracemalloc, returning (result, report)"""
+    if mode == 'cpu':
+        profiler = cProfile.Profile()
+        result = profiler.runcall(fn)
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(25)
+        return result, out.getvalue()
+
+    already_tracing = tracemalloc.is_tracing()
+    if not already_tracing:
+        tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        result = fn()
+        after = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        if not already_tracing:
+            tracemalloc.stop()
+    lines = [f"peak traced memory: {peak / 1024 / 1024:.1f} MB"]
+    lines += [str(stat) for stat in after.compare_to(before, 'lineno')[:25]]
+    return result, '\n'.join(lines)
+
+
+def instrumented(fn: Callable) -> Callable:
+    """
+    Time an API method and count failed results
+
+    Callers may pass ``profile='cpu'`` or ``profile='memory'`` to capture a
+    cProfile or tracemalloc report for that single call; reports are
+    available through ``metrics.snapshot()['profiles']``. Everything the
+    call recorded is flushed to the metrics store when it returns.
+    """
+    name = f"api.{fn.__name__}"
+
+    @functools.wraps(fn)
+    def wrapper(*args, profile: Optional[str] = None, **kwargs):
+        if profile is not None and profile not in PROFILE_MODES:
+            return {'success': False, 'error': f"Unknown profile mode: {profile}"}
+
+        start = time.perf_counter()
+        try:
+            if profile:
+                result, report = _run_profiled(profile, lambda: fn(*args, **kwargs))
+                metrics.add_profile({
+                    'method': fn.__name__,
+                    'mode': profile,
+                    'captured_at': datetime.now().isoformat(timespec='seconds'),
+                    'report': report,
+                })
+            else:
+                result = fn(*args, **kwargs)
+            if isinstance(result, dict) and result.get('success') is False:
+                metrics.incr(f"{name}.errors")
+            return result
+        except Exception:
+            metrics.incr(f"{name}.errors")
+            raise
+        finally:
+            metrics.observe(name, time.perf_counter() - start)
+            metrics.flush()
+
+    return wrapper
@@ -0,0 +1,146 @@
+"""Response serialization for the frontend bridge"""
+
+import json
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Union
+import logging
+
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Lists longer than this are streamed in chunks of this many items
+DEFAULT_CHUNK_SIZE = 1000
+
+# Wire formats accepted by API methods that return lists of records
+WIRE_FORMATS = ('rows', 'columnar')
+
+
+class JSONSerializer:
+    """Standard library encoder, used when orjson is not installed"""
+
+    name = 'json'
+
+    def dumps(self, obj: Any) -> bytes:
+        return json.dumps(obj, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+class OrjsonSerializer:
+    """orjson encoder (several times faster than json, emits bytes directly)"""
+
+    name = 'orjson'
+
+    def dumps(self, obj: Any) -> bytes:
+        return orjson.dumps(obj)
+
+
+Serializer = Union[JSONSerializer, OrjsonSerializer]
+
+_SERIALIZERS = {
+    'json': JSONSerializer,
+    'orjson': OrjsonSerializer,
+}
+
+
+def get_serializer(name: Optional[str] = None) -> Serializer:
+    """
+    Get a serializer by name
+
+    Args:
+        name: 'json', 'orjson' or None/'auto' for the fastest available
+
+    Returns:
+        Serializer instance
+    """
+    if name in (None, 'auto'):
+        name = 'orjson' if orjson is not None else 'json'
+
+    if name not in _SERIALIZERS:
+        raise ValueError(f"Unknown serializer: {name}")
+    if name == 'orjson' and orjson is None:
+        raise ImportError("orjson not installed. Install with: pip install orjson")
+
+    return _SERIALIZERS[name]()
+
+
+def check_wire_format(wire_format: str) -> None:
+    """Raise ValueError for unsupported wire formats"""
+    if wire_format not in WIRE_FORMATS:
+        raise ValueError(f"Unknown wire format: {wire_format}")
+
+
+def to_columnar(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Convert a list of records into the columnar wire format
+
+    Returns:
+        {'length': n, 'columns': {field: [values...]}}
+    """
+    if not rows:
+        return {'length': 0, 'columns': {}}
+
+    fields = list(rows[0].keys())
+    return {
+        'length': len(rows),
+        'columns': {field: [row.get(field) for row in rows] for field in fields}
+    }
+
+
+def dumps(result: Any, serializer: Optional[str] = None) -> bytes:
+    """Serialize a complete API result in one call"""
+    with metrics.span('serialize'):
+        return get_serializer(serializer).dumps(result)
+
+
+def iter_dumps(result: Any, serializer: Optional[str] = None,
+               chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Serialize an API result as a stream of byte chunks
+
+    Large lists anywhere in the result are encoded ``chunk_size`` items at a
+    time, so the full encoded payload never has to be held in memory.
+    Concatenating the chunks gives the same JSON document as ``dumps``.
+    """
+    yield from _iter_value(result, get_serializer(serializer), chunk_size)
+
+
+def write(result: Any, stream: BinaryIO, serializer: Optional[str] = None,
+          chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """
+    Stream an API result to a binary file object
+
+    Returns:
+        Number of bytes written
+    """
+    written = 0
+    with metrics.span('serialize'):
+        for chunk in iter_dumps(result, serializer, chunk_size):
+            stream.write(chunk)
+            written += len(chunk)
+        stream.flush()
+    return written
+
+
+def _iter_value(value: Any, serializer: Serializer, chunk_size: int) -> Iterator[bytes]:
+    if isinstance(value, dict):
+        yield b'{'
+        for i, (key, item) in enumerate(value.items()):
+            if i:
+                yield b','
+            yield serializer.dumps(str(key)) + b':'
+            yield from _iter_value(item, serializer, chunk_size)
+        yield b'}'
+    elif isinstance(value, list) and len(value) > chunk_size:
+        yield b'['
+        for start in range(0, len(value), chunk_size):
+            if start:
+                yield b','
+            # Strip the brackets from each encoded slice
+            yield serializer.dumps(value[start:start + chunk_size])[1:-1]
+        yield b']'
+    else:
+        yield serializer.dumps(value)
@@ -51,11 +51,12 @@ import os
 os.chdir('{}')
 sys.path.insert(0, '{}')
 from main import BankAnalyzerAPI
+from utils import serializer
 
 api = BankAnalyzerAPI()
 args = json.loads('{}')
 result = api.{}(**args) if args else api.{}()
-print(json.dumps(result))
+serializer.write(result, sys.stdout.buffer)
 "#,
         backend_path.display(),
         backend_path.display(),
@@ -101,17 +102,36 @@ fn parse_csv(file_path: String) -> Result<Value, String> {
     call_python_api("parse_csv", json!({ "file_path": file_path }))
 }
 
+#[tauri::command]
+fn start_import(paths: Vec<String>) -> Result<Value, String> {
+    // Returns a job_id at once; the import runs in a detached worker
+    call_python_api("start_import", json!({ "paths": paths }))
+}
+
+#[tauri::command]
+fn get_job(job_id: String) -> Result<Value, String> {
+    call_python_api("get_job", json!({ "job_id": job_id }))
+}
+
+#[tauri::command]
+fn cancel_job(job_id: String) -> Result<Value, String> {
+    call_python_api("cancel_job", json!({ "job_id": job_id }))
+}
+
 #[tauri::command]
 fn get_transactions(
     filters: Option<TransactionFilter>,
-    pagination: Option<Value>
+    pagination: Option<Value>,
+    wire_format: Option<String>
 ) -> Result<Value, String> {
     // Only pass filters to Python, ignore pagination for now
-    let args = if let Some(f) = filters {
+    let mut args = if let Some(f) = filters {
         json!({ "filters": f })
     } else {
         json!({})
     };
+    // "rows" (default) or "columnar"
+    args["wire_format"] = json!(wire_format.unwrap_or_else(|| "rows".to_string()));
     call_python_api("get_transactions", args)
 }
 
@@ -161,12 +181,17 @@ fn get_categories() -> Result<Value, String> {
 }
 
 #[tauri::command]
-fn get_category_breakdown(start_date: String, end_date: String) -> Result<Value, String> {
+fn get_category_breakdown(
+    start_date: String,
+    end_date: String,
+    wire_format: Option<String>
+) -> Result<Value, String> {
     call_python_api(
         "get_category_breakdown",
         json!({
             "start_date": start_date,
-            "end_date": end_date
+            "end_date": end_date,
+            "wire_format": wire_format.unwrap_or_else(|| "rows".to_string())
         })
     )
 }
@@ -248,6 +273,9 @@ fn main() {
         .plugin(tauri_plugin_dialog::init())
         .invoke_handler(tauri::generate_handler![
             parse_csv,
+            start_import,
+            get_job,
+            cancel_job,
             get_transactions,
             get_spending_summary,
             get_category_breakdown,